@@ -0,0 +1,372 @@
+"""Benchmarks for model inference, dashboard filtering, charts and the API.
+
+Times the pieces a change is most likely to slow down on the bundled
+data.csv and on synthetic tables resampled from it, measures sharded
+aggregation from one shard up to one per core, then load-tests the API in
+process with FastAPI's TestClient. Results are written as JSON so
+a later run can be compared against them:
+
+    python benchmarks/bench.py -o baseline.json
+    python benchmarks/bench.py --compare baseline.json
+
+--compare exits with status 1 when any benchmark got slower than the
+--threshold ratio. Model benchmarks and the HTTP load test need a trained
+model (--model, default src/utils/best_model.joblib) and are skipped
+without one.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, "src")
+sys.path.insert(0, SRC)
+
+import numpy as np
+from analytics import CHART_NAMES, compute_chart, compute_dashboard, compute_stats
+from batch_score import PAYMENT_METHOD_CODE
+from dataset import ID_COLUMN, Dataset, read_customers
+from filters import FilterIndex
+from model import CalibratedModel, PredictionInput
+from sharded import ShardedBackend
+
+DEFAULT_SIZES = "1000000,10000000"
+DEFAULT_SCALING_ROWS = 1000000
+
+# Filter selections timed on every table, from none to all four filters
+SELECTIONS = {
+    "none": {},
+    "time_period": {"time_period": "Last year"},
+    "segment": {"segment": "High-value Customers"},
+    "service+contract": {"service": "Fiber optic", "contract": "Month-to-month"},
+    "all": {
+        "time_period": "Last year",
+        "segment": "High-value Customers",
+        "service": "Fiber optic",
+        "contract": "Month-to-month",
+    },
+}
+
+
+def timeit(fn, repeat: int) -> dict:
+    """Seconds per call of ``fn`` over ``repeat`` runs after one warm-up"""
+    fn()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return {
+        "seconds": float(np.median(samples)),
+        "min": min(samples),
+        "repeat": repeat,
+    }
+
+
+def latency_summary(samples: list, elapsed: float) -> dict:
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99]).tolist()
+    return {
+        "seconds": p50,
+        "p50": p50,
+        "p95": p95,
+        "p99": p99,
+        "requests": len(samples),
+        "throughput_rps": len(samples) / elapsed,
+    }
+
+
+def synthetic_dataset(base: Dataset, rows: int, seed: int = 0) -> Dataset:
+    """``rows`` rows resampled from ``base``, keeping its joint distribution.
+
+    Customer IDs are replaced by integers so a 10M-row table does not spend
+    most of its memory on ID strings nothing here reads.
+    """
+    index = np.random.default_rng(seed).integers(0, len(base), rows)
+    columns = {
+        column: values[index]
+        for column, values in base.columns.items()
+        if column != ID_COLUMN
+    }
+    columns[ID_COLUMN] = np.arange(rows)
+    return Dataset(columns, base.categories, base.churned[index])
+
+
+def bench_table(name: str, dataset: Dataset, repeat: int) -> dict:
+    """Filter index build, mask selection, stats, every chart and the dashboard"""
+    results = {}
+    prefix = f"{name}/"
+    index = FilterIndex(dataset)
+    results[prefix + "filters/build_index"] = timeit(
+        lambda: FilterIndex(dataset), repeat
+    )
+    for label, selection in SELECTIONS.items():
+        results[prefix + f"filters/mask[{label}]"] = timeit(
+            lambda: index.mask(**selection), repeat
+        )
+
+    for label in ("none", "all"):
+        mask = index.mask(**SELECTIONS[label])
+        results[prefix + f"stats[{label}]"] = timeit(
+            lambda: compute_stats(dataset, mask), repeat
+        )
+        for chart_name in CHART_NAMES:
+            results[prefix + f"chart/{chart_name}[{label}]"] = timeit(
+                lambda: compute_chart(dataset, mask, chart_name), repeat
+            )
+        results[prefix + f"dashboard[{label}]"] = timeit(
+            lambda: compute_dashboard(dataset, mask), repeat
+        )
+    return results
+
+
+def bench_scaling(base: Dataset, rows: int, repeat: int) -> dict:
+    """Sharded dashboard and stats from 1 shard up to one per core"""
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        snapshot_dir = os.path.join(directory, "snapshot")
+        synthetic_dataset(base, rows).save(snapshot_dir)
+        dataset = Dataset.load(snapshot_dir)
+        for shards in range(1, (os.cpu_count() or 1) + 1):
+            backend = ShardedBackend(dataset, snapshot_dir, shards)
+            try:
+                for label in ("none", "all"):
+                    selection = SELECTIONS[label]
+                    for query in ("stats", "dashboard"):
+                        name = f"sharded[{rows}]/{query}[{label}]/shards={shards}"
+                        results[name] = timeit(
+                            lambda: getattr(backend, query)(selection), repeat
+                        )
+                        single = results.get(
+                            f"sharded[{rows}]/{query}[{label}]/shards=1"
+                        )
+                        results[name]["speedup"] = (
+                            single["seconds"] / results[name]["seconds"]
+                        )
+            finally:
+                backend.shutdown()
+    return results
+
+
+def prediction_inputs(frame, limit: int) -> list:
+    rows = frame.head(limit)
+    return [
+        PredictionInput(
+            Contract=row.Contract,
+            InternetService=row.InternetService,
+            MonthlyCharges=row.MonthlyCharges,
+            tenure=row.tenure,
+            PaymentMethod=PAYMENT_METHOD_CODE[row.PaymentMethod],
+        )
+        for row in rows.itertuples()
+    ]
+
+
+def bench_model(model_path: str, bins_path: str, frame, repeat: int) -> dict:
+    results = {}
+    inputs = prediction_inputs(frame, 1000)
+    for mode in ("live", "table"):
+        model = CalibratedModel(model_path, bins_path, inference_mode=mode)
+        prefix = f"model[{mode}]/"
+        if mode == "live":
+            results[prefix + "transform_features"] = timeit(
+                lambda: model._transform_features(inputs[0]), repeat * 20
+            )
+        results[prefix + "predict"] = timeit(
+            lambda: model.predict(inputs[0]), repeat * 20
+        )
+        results[prefix + f"predict_batch[{len(inputs)}]"] = timeit(
+            lambda: model.predict_batch(inputs), repeat
+        )
+    return results
+
+
+def _load(client, method: str, path: str, payloads, requests: int, concurrency: int):
+    def send(i):
+        started = time.perf_counter()
+        if method == "POST":
+            response = client.post(path, json=payloads[i % len(payloads)])
+        else:
+            response = client.get(path, params=payloads[i % len(payloads)])
+        response.raise_for_status()
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        samples = list(pool.map(send, range(requests)))
+    return latency_summary(samples, time.perf_counter() - started)
+
+
+def bench_http(args, frame) -> dict:
+    """In-process load test of the main routes through FastAPI's TestClient"""
+    # api reads its configuration at import time
+    os.environ.update(
+        DATA_PATH=os.path.abspath(args.data),
+        SNAPSHOT_DIR="",
+        MODEL_PATH=os.path.abspath(args.model),
+        BIN_PATH=os.path.abspath(args.bins),
+    )
+    if not args.with_caches:
+        # Measure the compute path rather than cube and cache lookups
+        os.environ.update(ANALYTICS_CUBE="0", CACHE_SIZE="0")
+    from fastapi.testclient import TestClient
+    import api
+
+    filter_params = list(SELECTIONS.values())
+    predict_payloads = [
+        item.model_dump() for item in prediction_inputs(frame, args.http_requests)
+    ]
+    scenarios = {
+        "stats": ("GET", "/stats", filter_params),
+        "chart/tenureChurn": ("GET", "/chart/tenureChurn", filter_params),
+        "dashboard": ("GET", "/dashboard", filter_params),
+        "predict": ("POST", "/predict", predict_payloads),
+    }
+    results = {}
+    with TestClient(api.app) as client:
+        for name, (method, path, payloads) in scenarios.items():
+            results[f"http/{name}"] = _load(
+                client,
+                method,
+                path,
+                payloads,
+                args.http_requests,
+                args.concurrency,
+            )
+    return results
+
+
+def compare(previous: dict, current: dict, threshold: float) -> list:
+    """(name, previous seconds, current seconds, ratio) of regressed benchmarks"""
+    regressions = []
+    print(f"\n{'benchmark':60} {'before':>10} {'after':>10} {'ratio':>7}")
+    for name, result in current["results"].items():
+        before = previous["results"].get(name)
+        if before is None:
+            continue
+        ratio = result["seconds"] / before["seconds"] if before["seconds"] else 1.0
+        flag = " <-- slower" if ratio > threshold else ""
+        print(
+            f"{name:60} {before['seconds'] * 1e3:9.3f}ms "
+            f"{result['seconds'] * 1e3:9.3f}ms {ratio:6.2f}x{flag}"
+        )
+        if flag:
+            regressions.append((name, before["seconds"], result["seconds"], ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data", default=os.path.join(SRC, "data.csv"))
+    parser.add_argument(
+        "--model",
+        default=os.getenv("MODEL_PATH", os.path.join(SRC, "utils/best_model.joblib")),
+    )
+    parser.add_argument(
+        "--bins",
+        default=os.getenv(
+            "BIN_PATH", os.path.join(SRC, "utils/binning_transformers.joblib")
+        ),
+    )
+    parser.add_argument(
+        "--sizes",
+        default=DEFAULT_SIZES,
+        help="comma-separated synthetic table sizes in rows, empty for none",
+    )
+    parser.add_argument(
+        "--scaling-rows",
+        type=int,
+        default=DEFAULT_SCALING_ROWS,
+        help="rows for the sharded scaling benchmark, 0 to skip",
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--http-requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument(
+        "--with-caches",
+        action="store_true",
+        help="keep the analytics cube and response cache on in the HTTP test",
+    )
+    parser.add_argument("--skip-http", action="store_true")
+    parser.add_argument("-o", "--output", help="write results as JSON")
+    parser.add_argument("--compare", help="JSON results of a previous run")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.2,
+        help="slowdown ratio reported as a regression (default 1.2)",
+    )
+    args = parser.parse_args()
+
+    frame = read_customers(args.data)
+    base = Dataset.from_frame(frame)
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+
+    results = {}
+    print(f"data.csv: {len(base)} rows")
+    results.update(bench_table("data.csv", base, args.repeat))
+    for rows in sizes:
+        print(f"synthetic: {rows} rows")
+        results.update(
+            bench_table(
+                f"synthetic[{rows}]", synthetic_dataset(base, rows), args.repeat
+            )
+        )
+
+    if args.scaling_rows:
+        print(f"sharded scaling: {args.scaling_rows} rows, 1-{os.cpu_count()} shards")
+        results.update(bench_scaling(base, args.scaling_rows, args.repeat))
+
+    if os.path.exists(args.model):
+        print("model inference")
+        results.update(bench_model(args.model, args.bins, frame, args.repeat))
+        if not args.skip_http:
+            print("HTTP load test")
+            results.update(bench_http(args, frame))
+    else:
+        print(f"No model at {args.model}, skipping inference and HTTP benchmarks")
+
+    run = {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    for name, result in results.items():
+        extra = "".join(
+            f" {key}={result[key] * 1e3:.3f}ms"
+            for key in ("p95", "p99")
+            if key in result
+        )
+        if "throughput_rps" in result:
+            extra += f" {result['throughput_rps']:.0f} req/s"
+        if "speedup" in result:
+            extra += f" {result['speedup']:.2f}x vs 1 shard"
+        print(f"{name:60} {result['seconds'] * 1e3:9.3f}ms{extra}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(run, f, indent=2)
+        print(f"Wrote {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        regressions = compare(previous, run, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} benchmark(s) slower than {args.threshold}x")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+"""Aggregates behind the desktop dashboard charts, without Qt or pyplot.
+
+Each chart groups rows by one column: category codes for categorical
+columns, equal-width bins for charges. A grouping is encoded once, on
+first use, as an integer group id per row; the chart's churned and not
+churned counts are then a single np.bincount over it rather than a pandas
+groupby. Counts over the whole table are cached per grouping, so charts on
+the same column share them, and a boolean row mask gives the counts of a
+filtered subset from the same encoded ids.
+
+FilterMasks holds the web dashboard's filter presets (src/presets.py, also
+behind src/filters.py, see load_presets) as boolean masks over the loaded
+rows.
+"""
+
+import importlib.util
+import os
+import threading
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass
+from types import ModuleType
+from typing import Optional, Tuple
+
+# The web dashboard's filter presets
+PRESETS_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "src", "presets.py"
+)
+
+# Columns the charts read; anything else in the CSV is never parsed
+COLUMNS = (
+    "gender",
+    "SeniorCitizen",
+    "Partner",
+    "Dependents",
+    "tenure",
+    "PhoneService",
+    "InternetService",
+    "Contract",
+    "PaymentMethod",
+    "MonthlyCharges",
+    "TotalCharges",
+    "Churn",
+)
+
+
+def load_presets(path: str = PRESETS_PATH) -> ModuleType:
+    """The presets module at ``path``, loaded from its file so that neither
+    sys.path nor sys.modules change"""
+    spec = importlib.util.spec_from_file_location("presets", path)
+    presets = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(presets)
+    return presets
+
+
+def load_customers(path: str) -> pd.DataFrame:
+    data = pd.read_csv(path, usecols=lambda column: column in COLUMNS)
+    # Convert TotalCharges to numeric, handling empty strings
+    data["TotalCharges"] = pd.to_numeric(data["TotalCharges"], errors="coerce")
+    return data
+
+
+@dataclass(frozen=True)
+class ChartSpec:
+    """One desktop chart.
+
+    Rows are grouped by the sorted values of ``column``, or by ``bins``
+    equal-width bins when set: "hist" bins are numpy.histogram's (last bin
+    closed), "cut" bins are pandas.cut's (right-closed, labelled with
+    their dollar range). ``kind`` picks the drawing: "pie" (rows per
+    value), "line" or "rate" (churn rate in percent as a line or bars),
+    "split" (churned and not churned bars per value) or "hist".
+    ``figsize`` is the chart's size when drawn on its own.
+    """
+
+    column: str
+    kind: str
+    title: str
+    xlabel: str = ""
+    ylabel: str = "Count"
+    bins: int = 0
+    binning: str = "hist"
+    labels: Optional[tuple] = None
+    rotation: int = 0
+    figsize: tuple = (6, 4)
+
+
+CHARTS = {
+    "churnRate": ChartSpec("Churn", "pie", "Overall Churn Rate", figsize=(10, 5)),
+    "tenureChurn": ChartSpec(
+        "tenure",
+        "line",
+        "Churn Rate by Tenure",
+        xlabel="Tenure (months)",
+        ylabel="Churn Rate (%)",
+        figsize=(10, 5),
+    ),
+    "genderChurn": ChartSpec("gender", "split", "Churn by Gender"),
+    "seniorChurn": ChartSpec(
+        "SeniorCitizen",
+        "split",
+        "Churn by Senior Citizen Status",
+        labels=("Not Senior", "Senior"),
+    ),
+    "partnerChurn": ChartSpec("Partner", "split", "Churn by Partner Status"),
+    "dependentsChurn": ChartSpec("Dependents", "split", "Churn by Dependents"),
+    "internetChurn": ChartSpec(
+        "InternetService", "split", "Churn by Internet Service Type"
+    ),
+    "contractChurn": ChartSpec("Contract", "split", "Churn by Contract Type"),
+    "paymentChurn": ChartSpec(
+        "PaymentMethod",
+        "split",
+        "Churn by Payment Method",
+        rotation=45,
+        figsize=(8, 5),
+    ),
+    "phoneChurn": ChartSpec("PhoneService", "split", "Churn by Phone Service"),
+    "monthlyChargesDist": ChartSpec(
+        "MonthlyCharges",
+        "hist",
+        "Monthly Charges Distribution",
+        xlabel="Monthly Charges",
+        ylabel="Frequency",
+        bins=20,
+        figsize=(5, 5),
+    ),
+    "totalChargesDist": ChartSpec(
+        "TotalCharges",
+        "hist",
+        "Total Charges Distribution",
+        xlabel="Total Charges",
+        ylabel="Frequency",
+        bins=20,
+        figsize=(5, 5),
+    ),
+    "monthlyGroupsChurn": ChartSpec(
+        "MonthlyCharges",
+        "rate",
+        "Churn Rate by Monthly Charges Groups",
+        xlabel="Monthly Charges Groups",
+        ylabel="Churn Rate (%)",
+        bins=10,
+        binning="cut",
+        rotation=45,
+        figsize=(10, 5),
+    ),
+}
+
+
+@dataclass
+class Grouping:
+    """Group id per row (``n_groups`` for rows in no group, e.g. missing
+    values), the group labels and, for binned columns, the bin edges"""
+
+    ids: np.ndarray
+    labels: tuple
+    edges: Optional[np.ndarray] = None
+
+    @property
+    def n_groups(self) -> int:
+        return len(self.labels)
+
+
+def _encode(values: pd.Series, spec: ChartSpec) -> Grouping:
+    if not spec.bins:
+        codes, uniques = pd.factorize(values, sort=True)
+        labels = tuple(uniques.tolist())
+        codes[codes < 0] = len(labels)
+        return Grouping(codes, labels)
+
+    if spec.binning == "cut":
+        binned, edges = pd.cut(values, spec.bins, retbins=True)
+        ids = binned.cat.codes.to_numpy().astype(np.int64)
+        labels = tuple(
+            f"${int(left)}-${int(right)}" for left, right in zip(edges[:-1], edges[1:])
+        )
+        ids[ids < 0] = spec.bins
+        return Grouping(ids, labels, edges)
+
+    numbers = values.to_numpy(dtype=float)
+    present = ~np.isnan(numbers)
+    edges = np.histogram_bin_edges(numbers[present], spec.bins)
+    ids = np.searchsorted(edges, numbers, side="right") - 1
+    # The last bin includes its right edge, as in numpy.histogram
+    ids[numbers == edges[-1]] = spec.bins - 1
+    ids[~present] = spec.bins
+    labels = tuple(f"{left:g}-{right:g}" for left, right in zip(edges[:-1], edges[1:]))
+    return Grouping(ids, labels, edges)
+
+
+class FilterMasks:
+    """Boolean mask for every filter preset, built once.
+
+    Selections combine like the API's: unknown time periods and segments
+    leave the rows unfiltered, unknown services and contracts match none.
+    """
+
+    def __init__(self, data: pd.DataFrame, presets: ModuleType):
+        self.presets = presets
+        definitions = presets.range_masks(
+            data["tenure"].to_numpy(), data["MonthlyCharges"].to_numpy()
+        )
+        self.masks = {key: build() for key, build in definitions.items()}
+        self.labels = {}
+        for key, column in (("service", "InternetService"), ("contract", "Contract")):
+            codes, labels = pd.factorize(data[column], sort=True)
+            self.labels[key] = labels.tolist()
+            for code, label in enumerate(self.labels[key]):
+                self.masks[(key, label)] = codes == code
+        self.empty = np.zeros(len(data), dtype=bool)
+
+    def mask(
+        self,
+        time_period: Optional[str] = None,
+        segment: Optional[str] = None,
+        service: Optional[str] = None,
+        contract: Optional[str] = None,
+    ) -> Optional[np.ndarray]:
+        """Combined mask for a selection, None when every row is selected"""
+        presets = self.presets
+        selected = []
+        if time_period in presets.TIME_PERIODS:
+            selected.append(self.masks[("time_period", time_period)])
+        if segment and segment != "All Segments":
+            mask = self.masks.get(("segment", segment))
+            if mask is not None:
+                selected.append(mask)
+        if service and service != presets.ALL_SERVICES:
+            selected.append(self.masks.get(("service", service), self.empty))
+        if contract and contract != presets.ALL_CONTRACTS:
+            selected.append(self.masks.get(("contract", contract), self.empty))
+        if not selected:
+            return None
+        if len(selected) == 1:
+            return selected[0]
+        combined = np.logical_and(selected[0], selected[1])
+        for mask in selected[2:]:
+            np.logical_and(combined, mask, out=combined)
+        return combined
+
+
+class ChurnAggregates:
+    """Shared, lazily built aggregates for every chart over one table.
+
+    Safe to use from several threads; lazily built state is guarded by a
+    lock.
+    """
+
+    def __init__(self, data: pd.DataFrame, presets: ModuleType):
+        """``presets``: the filter presets module, e.g. load_presets()"""
+        self.data = data
+        self.presets = presets
+        self.churned = (data["Churn"] == "Yes").to_numpy()
+        self._groupings = {}
+        self._counts = {}
+        self._filters = None
+        self.lock = threading.Lock()
+
+    @property
+    def filters(self) -> FilterMasks:
+        with self.lock:
+            if self._filters is None:
+                self._filters = FilterMasks(self.data, self.presets)
+            return self._filters
+
+    def __len__(self) -> int:
+        return len(self.churned)
+
+    def grouping(self, spec: ChartSpec) -> Grouping:
+        key = (spec.column, spec.bins, spec.binning)
+        grouping = self._groupings.get(key)
+        if grouping is None:
+            with self.lock:
+                grouping = self._groupings.get(key)
+                if grouping is None:
+                    grouping = _encode(self.data[spec.column], spec)
+                    self._groupings[key] = grouping
+        return grouping
+
+    def counts(
+        self, spec: ChartSpec, mask: Optional[np.ndarray] = None
+    ) -> Tuple[Grouping, np.ndarray]:
+        """The chart's grouping and its counts as a (2, n_groups) array of
+        [not churned, churned] per group, over the rows selected by mask"""
+        grouping = self.grouping(spec)
+        key = (spec.column, spec.bins, spec.binning)
+        if mask is None and key in self._counts:
+            return grouping, self._counts[key]
+
+        ids, churned = grouping.ids, self.churned
+        if mask is not None:
+            ids, churned = ids[mask], churned[mask]
+        n_slots = grouping.n_groups + 1
+        counts = np.bincount(ids * 2 + churned, minlength=2 * n_slots)
+        counts = counts.reshape(n_slots, 2)[:-1].T
+        if mask is None:
+            self._counts[key] = counts
+        return grouping, counts
+
+
+def churn_rate(counts: np.ndarray) -> np.ndarray:
+    """Churn rate in percent per group; 0 for empty groups"""
+    totals = counts.sum(axis=0)
+    return np.divide(
+        counts[1] * 100.0, totals, out=np.zeros(len(totals)), where=totals > 0
+    )
@@ -0,0 +1,172 @@
+"""Headless export of every dashboard chart for every filter combination.
+
+    python export_charts.py                         # PNG and SVG of everything
+    python export_charts.py --formats png --charts churnRate,tenureChurn
+
+Runs without Qt: the table is loaded and aggregated once in this process
+(one bincount per chart and filter combination), and only the resulting
+counts are sent to a pool of worker processes that draw them with the Agg
+backend. Files are written to --output-dir as <filters>/<chart>.<format>,
+with manifest.json listing every image, its filters and its hash.
+
+An image's hash covers what it shows: the chart spec, the counts, labels
+and bin edges computed from the dataset, the format and the DPI. A rerun
+skips every image whose hash matches the previous manifest and whose file
+still exists, so only charts whose data or spec changed are redrawn.
+"""
+
+import argparse
+import dataclasses
+import hashlib
+import itertools
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from aggregates import CHARTS, ChurnAggregates, load_customers, load_presets
+from plots import figure_of
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# Bump when the drawing code changes, so every image is redrawn
+RENDER_VERSION = 1
+ALL_TIME = "All Time"
+
+
+def filter_combinations(aggregates: ChurnAggregates) -> list:
+    labels = aggregates.filters.labels
+    presets = aggregates.presets
+    return [
+        {
+            "time_period": time_period,
+            "segment": segment,
+            "service": service,
+            "contract": contract,
+        }
+        for time_period, segment, service, contract in itertools.product(
+            [ALL_TIME, *presets.TIME_PERIODS],
+            presets.SEGMENTS,
+            [presets.ALL_SERVICES, *labels["service"]],
+            [presets.ALL_CONTRACTS, *labels["contract"]],
+        )
+    ]
+
+
+def slug(selection: dict) -> str:
+    return "_".join(
+        re.sub(r"[^a-z0-9]+", "-", value.lower()).strip("-")
+        for value in selection.values()
+    )
+
+
+def image_hash(name: str, grouping, counts, fmt: str, dpi: int) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(
+        json.dumps(
+            [RENDER_VERSION, name, repr(CHARTS[name]), grouping.labels, fmt, dpi],
+            default=str,
+        ).encode()
+    )
+    digest.update(counts.tobytes())
+    if grouping.edges is not None:
+        digest.update(grouping.edges.tobytes())
+    return digest.hexdigest()
+
+
+def render(name: str, grouping, counts, outputs: list, dpi: int):
+    """Draw one chart and save it in every (format, path) of ``outputs``"""
+    figure, _ = figure_of([(name, grouping, counts)], CHARTS[name].figsize)
+    FigureCanvasAgg(figure)
+    for fmt, path in outputs:
+        staging = f"{path}.{os.getpid()}.tmp"
+        figure.savefig(staging, format=fmt, dpi=dpi)
+        os.replace(staging, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export chart images headlessly")
+    parser.add_argument(
+        "--data", default=os.path.join(HERE, "customer-churn-table.csv")
+    )
+    parser.add_argument("--output-dir", default=os.path.join(HERE, "chart_exports"))
+    parser.add_argument("--formats", default="png,svg")
+    parser.add_argument("--charts", default=",".join(CHARTS))
+    parser.add_argument("--dpi", type=int, default=100)
+    parser.add_argument("--jobs", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    formats = [fmt for fmt in args.formats.split(",") if fmt]
+    chart_names = [name for name in args.charts.split(",") if name]
+    unknown = set(chart_names) - set(CHARTS)
+    if unknown:
+        parser.error(f"unknown charts: {', '.join(sorted(unknown))}")
+
+    started = time.perf_counter()
+    aggregates = ChurnAggregates(load_customers(args.data), load_presets())
+    manifest_path = os.path.join(args.output_dir, "manifest.json")
+    try:
+        with open(manifest_path) as f:
+            previous = {image["path"]: image for image in json.load(f)["images"]}
+    except (OSError, ValueError, KeyError):
+        previous = {}
+
+    # Images exported by earlier runs stay listed, whatever this run covers
+    images = {
+        path: image
+        for path, image in previous.items()
+        if os.path.exists(os.path.join(args.output_dir, path))
+    }
+    drawn = 0
+    tasks = []
+    for selection in filter_combinations(aggregates):
+        mask = aggregates.filters.mask(**selection)
+        directory = slug(selection)
+        os.makedirs(os.path.join(args.output_dir, directory), exist_ok=True)
+        for name in chart_names:
+            grouping, counts = aggregates.counts(CHARTS[name], mask)
+            # Workers only need the labels and edges, not the per-row ids
+            grouping = dataclasses.replace(grouping, ids=None)
+            outputs = []
+            for fmt in formats:
+                path = f"{directory}/{name}.{fmt}"
+                key = image_hash(name, grouping, counts, fmt, args.dpi)
+                if images.get(path, {}).get("hash") != key:
+                    outputs.append((fmt, os.path.join(args.output_dir, path)))
+                images[path] = {
+                    "path": path,
+                    "chart": name,
+                    "filters": selection,
+                    "format": fmt,
+                    "hash": key,
+                }
+            if outputs:
+                tasks.append((name, grouping, counts, outputs))
+                drawn += len(outputs)
+    print(
+        f"Aggregated in {time.perf_counter() - started:.1f}s; "
+        f"{drawn} images to draw"
+    )
+
+    with ProcessPoolExecutor(args.jobs) as pool:
+        futures = [pool.submit(render, *task, args.dpi) for task in tasks]
+        for future in futures:
+            future.result()
+
+    staging = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(staging, "w") as f:
+        json.dump(
+            {
+                "data": os.path.abspath(args.data),
+                "rows": len(aggregates),
+                "images": list(images.values()),
+            },
+            f,
+            indent=2,
+        )
+    os.replace(staging, manifest_path)
+    print(f"Done in {time.perf_counter() - started:.1f}s; manifest at {manifest_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,535 @@
+"""Scripted version of the dev.ipynb training run.
+
+    python pipeline.py                       # full run, reusing cached stages
+    python pipeline.py --models xgb,lgbm     # search a subset of the models
+    python pipeline.py --force search_xgb    # recompute one stage
+    python pipeline.py --export-csv          # also write the notebook CSVs
+
+Each stage's output is cached as a joblib file under --cache-dir, named
+after a hash of the stage, its parameters and the hashes of its inputs
+(the raw CSV's content for the first stage). A rerun therefore recomputes
+only the stages whose inputs or parameters changed, and everything after
+them. Bump a stage's entry in STAGE_VERSIONS when its code changes.
+
+The hyperparameter searches run with --jobs workers (default: all cores)
+and each model's search is its own stage, so changing one search space
+does not rerun the others. Unlike the notebook every random step is
+seeded (--seed), which is what makes cached results reproducible.
+
+Writes best_model.joblib and binning_transformers.joblib to --output-dir,
+where the API loads them from by default.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.calibration import CalibratedClassifierCV
+from sklearn.ensemble import RandomForestClassifier, StackingClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import (
+    classification_report,
+    f1_score,
+    precision_recall_curve,
+    precision_score,
+    recall_score,
+    roc_auc_score,
+)
+from sklearn.model_selection import RandomizedSearchCV, StratifiedKFold
+from sklearn.model_selection import train_test_split
+from sklearn.preprocessing import KBinsDiscretizer, LabelEncoder
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+STAGE_VERSIONS = {
+    "clean": 1,
+    "transform": 1,
+    "feature_selection": 1,
+    "binning": 1,
+    "model_ready": 1,
+    "split": 1,
+    "search": 1,
+    "calibrate": 1,
+}
+
+# Column choices from the notebook
+CATEGORICAL_FEATURES = [
+    "Partner",
+    "Dependents",
+    "PhoneService",
+    "PaperlessBilling",
+    "Churn",
+]
+LABEL_FEATURES = ["Contract", "PaymentMethod"]
+INTERNET_SERVICE_DEPENDENT = [
+    "OnlineSecurity",
+    "OnlineBackup",
+    "DeviceProtection",
+    "TechSupport",
+    "StreamingTV",
+    "StreamingMovies",
+]
+DROP_REDUNDANT = INTERNET_SERVICE_DEPENDENT + [
+    "MultipleLines",
+    "PaperlessBilling",
+    "gender",
+]
+DROP_BEFORE_BINNING = [
+    "tenure",
+    "TotalCharges",
+    "MonthlyCharges",
+    "Dependents",
+    "Partner",
+    "SeniorCitizen",
+    "PhoneService",
+    "Contract",
+    "InternetService",
+]
+FINAL_FEATURES_DROP = [
+    "Total_VeryHigh",
+    "Total_High",
+    "Total_Medium",
+    "Total_Low",
+    "Monthly_High",
+    "tenure_Medium",
+]
+# Bin code to label, in the notebook's (and the model's) column order
+BIN_LABELS = {3: "VeryHigh", 2: "High", 1: "Medium", 0: "Low"}
+BINNED_COLUMNS = {
+    "MonthlyCharges": "Monthly",
+    "TotalCharges": "Total",
+    "tenure": "tenure",
+}
+
+
+def _xgb(seed):
+    from xgboost import XGBClassifier
+
+    return XGBClassifier(
+        objective="binary:logistic", eval_metric="logloss", random_state=seed
+    )
+
+
+def _catboost(seed):
+    from catboost import CatBoostClassifier
+
+    return CatBoostClassifier(
+        loss_function="Logloss", eval_metric="Logloss", random_state=seed, verbose=0
+    )
+
+
+def _lgbm(seed):
+    from lightgbm import LGBMClassifier
+
+    return LGBMClassifier(objective="binary", random_state=seed, verbose=-1)
+
+
+def _random_forest(seed):
+    return RandomForestClassifier(random_state=seed)
+
+
+# name: (estimator factory, search space, n_iter, CV folds), as in the notebook
+MODEL_SEARCHES = {
+    "xgb": (
+        _xgb,
+        {
+            "n_estimators": [100, 200, 300, 400, 500],
+            "learning_rate": [0.01, 0.05, 0.1, 0.2],
+            "max_depth": [3, 4, 5, 6, 8, 10],
+            "subsample": [0.6, 0.8, 1.0],
+            "colsample_bytree": [0.6, 0.8, 1.0],
+            "gamma": [0, 0.1, 0.2, 0.3],
+            "min_child_weight": [1, 3, 5],
+            "scale_pos_weight": [1],
+        },
+        25,
+        10,
+    ),
+    "cb": (
+        _catboost,
+        {
+            "iterations": [50, 100, 200, 300, 400],
+            "learning_rate": [0.01, 0.05, 0.1, 0.2],
+            "depth": [3, 5, 7, 9],
+            "l2_leaf_reg": [0, 0.1, 0.5, 1],
+            "border_count": [32, 64, 128, 256],
+            "random_strength": [0, 1, 5, 10],
+        },
+        20,
+        10,
+    ),
+    "lgbm": (
+        _lgbm,
+        {
+            "n_estimators": [50, 100, 200, 300, 400],
+            "learning_rate": [0.01, 0.05, 0.1, 0.2],
+            "num_leaves": [31, 62, 127, 255],
+            "max_depth": [-1, 5, 10, 15],
+            "colsample_bytree": [0.6, 0.8, 1.0],
+            "subsample": [0.6, 0.8, 1.0],
+            "reg_alpha": [0, 0.1, 0.5, 1],
+            "reg_lambda": [0, 0.1, 0.5, 1],
+        },
+        5,
+        20,
+    ),
+    # Not in the notebook; needs only scikit-learn
+    "rf": (
+        _random_forest,
+        {
+            "n_estimators": [100, 200, 300],
+            "max_depth": [None, 5, 10, 20],
+            "min_samples_leaf": [1, 2, 5],
+        },
+        10,
+        10,
+    ),
+}
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class StageCache:
+    """Runs stages, reusing outputs stored under the hash of their inputs.
+
+    A stage named in ``force`` is recomputed, and so is every stage that
+    consumes its output.
+    """
+
+    def __init__(self, cache_dir: str, force=()):
+        self.cache_dir = cache_dir
+        self.force = set(force)
+        self.recomputed = set()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def run(self, name: str, fn, params: dict, inputs: dict, stage: str = None):
+        """``inputs`` maps argument names to (key, value) results of earlier
+        stages; returns this stage's (key, value)"""
+        stage = stage or name
+        key = hashlib.blake2b(
+            json.dumps(
+                {
+                    "stage": name,
+                    "version": STAGE_VERSIONS[stage],
+                    "params": params,
+                    "inputs": {arg: result[0] for arg, result in inputs.items()},
+                },
+                sort_keys=True,
+                default=str,
+            ).encode(),
+            digest_size=16,
+        ).hexdigest()
+        path = os.path.join(self.cache_dir, f"{name}-{key}.joblib")
+        stale = name in self.force or any(
+            result[0] in self.recomputed for result in inputs.values()
+        )
+        if os.path.exists(path) and not stale:
+            print(f"[{name}] cached")
+            return key, joblib.load(path)
+
+        started = time.perf_counter()
+        value = fn(**{arg: result[1] for arg, result in inputs.items()}, **params)
+        staging = f"{path}.{os.getpid()}.tmp"
+        joblib.dump(value, staging)
+        os.replace(staging, path)
+        if stale:
+            self.recomputed.add(key)
+        print(f"[{name}] computed in {time.perf_counter() - started:.1f}s")
+        return key, value
+
+
+def clean(path: str) -> pd.DataFrame:
+    df = pd.read_csv(path)
+    df["TotalCharges"] = pd.to_numeric(df["TotalCharges"], errors="coerce")
+    return df.dropna()
+
+
+def transform(df: pd.DataFrame) -> pd.DataFrame:
+    """Numeric encoding of every column (df_transformed.csv)"""
+    df_transformed = df.drop(columns=["customerID"])
+    for feature in LABEL_FEATURES:
+        df_transformed[feature] = LabelEncoder().fit_transform(df_transformed[feature])
+    df_transformed[CATEGORICAL_FEATURES] = (
+        df_transformed[CATEGORICAL_FEATURES].replace({"Yes": 1, "No": 0}).astype(int)
+    )
+    df_transformed["MultipleLines"] = df_transformed["MultipleLines"].map(
+        {"No phone service": -1, "No": 0, "Yes": 1}
+    )
+    df_transformed["InternetService"] = df_transformed["InternetService"].map(
+        {"No": 0, "Fiber optic": 1, "DSL": 2}
+    )
+    df_transformed["gender"] = df_transformed["gender"].map({"Female": 2, "Male": 1})
+    for feature in INTERNET_SERVICE_DEPENDENT:
+        df_transformed[feature] = df_transformed[feature].map(
+            {"No": 0, "Yes": 1, "No internet service": -1}
+        )
+    df_transformed["Has_Internet"] = (df_transformed["InternetService"] != 0).astype(
+        int
+    )
+    df_transformed["Contract_Long"] = (df_transformed["Contract"] != 0).astype(int)
+    df_transformed["Contract_Short"] = (df_transformed["Contract"] == 0).astype(int)
+    df_transformed["MultipleLines"] = (
+        df_transformed["MultipleLines"] * df_transformed["PhoneService"]
+    )
+    return df_transformed
+
+
+def feature_selection(df_transformed: pd.DataFrame) -> pd.DataFrame:
+    return df_transformed.drop(columns=DROP_REDUNDANT)
+
+
+def _remove_outliers_iqr(df: pd.DataFrame, column: str) -> pd.DataFrame:
+    q1 = df[column].quantile(0.25)
+    q3 = df[column].quantile(0.75)
+    iqr = q3 - q1
+    lower_bound = max(df[column].min(), q1 - 1.5 * iqr)
+    upper_bound = min(df[column].max(), q3 + 1.5 * iqr)
+    return df[(df[column] >= lower_bound) & (df[column] <= upper_bound)]
+
+
+def binning(df_feature_selection: pd.DataFrame, n_bins: int):
+    """Quantile-bin the numeric columns into one-hot flags.
+
+    Returns df_numeric_transformed and the fitted binners, saved for the
+    API as binning_transformers.joblib.
+    """
+    df_clean = _remove_outliers_iqr(df_feature_selection, "MonthlyCharges")
+    df_clean = _remove_outliers_iqr(df_clean, "TotalCharges")
+
+    flags = {}
+    binners = {}
+    for column, prefix in BINNED_COLUMNS.items():
+        binner = KBinsDiscretizer(n_bins=n_bins, encode="ordinal", strategy="quantile")
+        bins = binner.fit_transform(df_clean[[column]]).astype(int)[:, 0]
+        for code, label in BIN_LABELS.items():
+            flags[f"{prefix}_{label}"] = (bins == code).astype(int)
+        binners[f"{prefix.lower()}_binner"] = binner
+
+    df_numeric_transformed = pd.concat(
+        [
+            df_clean.drop(columns=DROP_BEFORE_BINNING),
+            pd.DataFrame(flags, index=df_clean.index),
+        ],
+        axis=1,
+    )
+    return df_numeric_transformed, binners
+
+
+def model_ready(df_numeric_transformed: pd.DataFrame) -> pd.DataFrame:
+    return df_numeric_transformed.drop(columns=FINAL_FEATURES_DROP)
+
+
+def split(df_model_ready: pd.DataFrame, test_size: float, seed: int) -> dict:
+    """Balanced train/test split, leftover majority rows added to train,
+    then SMOTE on the training set"""
+    from imblearn.over_sampling import SMOTE
+
+    minority = df_model_ready[df_model_ready["Churn"] == 1]
+    majority = df_model_ready[df_model_ready["Churn"] == 0]
+    majority_down = majority.sample(n=len(minority), random_state=seed)
+    df_balanced = pd.concat([majority_down, minority], axis=0)
+
+    X = df_balanced.drop(columns=["Churn"])
+    y = df_balanced["Churn"]
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=test_size, stratify=y, random_state=seed
+    )
+    majority_leftover = majority.drop(majority_down.index)
+    X_train = pd.concat([X_train, majority_leftover.drop(columns=["Churn"])], axis=0)
+    y_train = pd.concat([y_train, majority_leftover["Churn"]], axis=0)
+    X_train, y_train = SMOTE(random_state=seed).fit_resample(X_train, y_train)
+    return {"X_train": X_train, "y_train": y_train, "X_test": X_test, "y_test": y_test}
+
+
+def search(data: dict, model: str, n_iter: int, folds: int, seed: int, jobs: int):
+    """Randomized hyperparameter search for one model, folds in parallel"""
+    factory, space, _, _ = MODEL_SEARCHES[model]
+    random_search = RandomizedSearchCV(
+        estimator=factory(seed),
+        param_distributions=space,
+        scoring="precision",
+        n_iter=n_iter,
+        cv=StratifiedKFold(n_splits=folds, shuffle=True, random_state=seed),
+        n_jobs=jobs,
+        random_state=seed,
+    )
+    random_search.fit(data["X_train"], data["y_train"])
+    print(f"[search_{model}] best {random_search.best_params_}")
+    return {
+        "estimator": random_search.best_estimator_,
+        "params": random_search.best_params_,
+        "cv_precision": random_search.best_score_,
+    }
+
+
+def _evaluate(y_test, y_proba) -> dict:
+    precision, recall, thresholds = precision_recall_curve(y_test, y_proba)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        f1_scores = np.nan_to_num(2 * precision * recall / (precision + recall))
+    best_threshold = float(thresholds[min(np.argmax(f1_scores), len(thresholds) - 1)])
+    y_pred = (y_proba >= best_threshold).astype(int)
+    return {
+        "threshold": best_threshold,
+        "precision": precision_score(y_test, y_pred),
+        "recall": recall_score(y_test, y_pred),
+        "f1": f1_score(y_test, y_pred),
+        "roc_auc": roc_auc_score(y_test, y_proba),
+        "report": classification_report(
+            y_test, y_pred, target_names=["Not Churn", "Churn"]
+        ),
+    }
+
+
+def calibrate(data: dict, searches: list, folds: int, seed: int, jobs: int):
+    """Stack the searched models under a logistic regression and calibrate
+    the stack with isotonic regression"""
+    estimators = [(result["name"], result["estimator"]) for result in searches]
+    if len(estimators) == 1:
+        base_model = estimators[0][1]
+    else:
+        base_model = StackingClassifier(
+            estimators=estimators,
+            final_estimator=LogisticRegression(),
+            cv=StratifiedKFold(n_splits=folds, shuffle=True, random_state=seed),
+            n_jobs=jobs,
+        )
+    calibrated_model = CalibratedClassifierCV(base_model, method="isotonic", cv=5)
+    calibrated_model.fit(data["X_train"], data["y_train"])
+    metrics = _evaluate(
+        data["y_test"], calibrated_model.predict_proba(data["X_test"])[:, 1]
+    )
+    return {"model": calibrated_model, "metrics": metrics}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the churn model in stages")
+    parser.add_argument(
+        "--data", default=os.path.join(HERE, "customer-churn-table.csv")
+    )
+    parser.add_argument("--cache-dir", default=os.path.join(HERE, ".pipeline-cache"))
+    parser.add_argument(
+        "--output-dir", default=os.path.join(HERE, "..", "src", "utils")
+    )
+    parser.add_argument(
+        "--models",
+        default="xgb,cb,lgbm",
+        help=f"comma-separated, from {', '.join(MODEL_SEARCHES)}",
+    )
+    parser.add_argument("--n-iter", type=int, help="override every model's n_iter")
+    parser.add_argument("--n-bins", type=int, default=4)
+    parser.add_argument("--test-size", type=float, default=0.4)
+    parser.add_argument("--stack-folds", type=int, default=15)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--jobs", type=int, default=-1, help="parallel workers")
+    parser.add_argument(
+        "--force", default="", help="comma-separated stages to recompute"
+    )
+    parser.add_argument(
+        "--export-csv",
+        action="store_true",
+        help="also write the notebook's intermediate CSVs next to this script",
+    )
+    args = parser.parse_args()
+
+    models = [model for model in args.models.split(",") if model]
+    unknown = set(models) - set(MODEL_SEARCHES)
+    if unknown:
+        parser.error(f"unknown models: {', '.join(sorted(unknown))}")
+
+    cache = StageCache(
+        args.cache_dir, [stage for stage in args.force.split(",") if stage]
+    )
+    raw = (file_hash(args.data), args.data)
+    cleaned = cache.run("clean", clean, {}, {"path": raw})
+    transformed = cache.run("transform", transform, {}, {"df": cleaned})
+    selected = cache.run(
+        "feature_selection", feature_selection, {}, {"df_transformed": transformed}
+    )
+    binned = cache.run(
+        "binning",
+        binning,
+        {"n_bins": args.n_bins},
+        {"df_feature_selection": selected},
+    )
+    numeric = (binned[0], binned[1][0])
+    ready = cache.run(
+        "model_ready", model_ready, {}, {"df_numeric_transformed": numeric}
+    )
+    data = cache.run(
+        "split",
+        split,
+        {"test_size": args.test_size, "seed": args.seed},
+        {"df_model_ready": ready},
+    )
+
+    searches = []
+    for model in models:
+        _, _, n_iter, folds = MODEL_SEARCHES[model]
+        key, result = cache.run(
+            f"search_{model}",
+            lambda data, jobs=args.jobs, **params: search(data, jobs=jobs, **params),
+            {
+                "model": model,
+                "n_iter": args.n_iter or n_iter,
+                "folds": folds,
+                "seed": args.seed,
+            },
+            {"data": data},
+            stage="search",
+        )
+        searches.append((key, {"name": model, **result}))
+
+    _, calibrated = cache.run(
+        "calibrate",
+        lambda searches, jobs=args.jobs, **params: calibrate(
+            jobs=jobs, searches=searches, **params
+        ),
+        {"folds": args.stack_folds, "seed": args.seed},
+        {
+            "data": data,
+            "searches": (
+                "+".join(key for key, _ in searches),
+                [s for _, s in searches],
+            ),
+        },
+    )
+    print(calibrated["metrics"]["report"])
+    print(
+        "Calibrated precision {precision:.2f}, recall {recall:.2f}, "
+        "F1 {f1:.2f}, ROC AUC {roc_auc:.2f} at threshold {threshold:.2f}".format(
+            **calibrated["metrics"]
+        )
+    )
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    joblib.dump(calibrated["model"], os.path.join(args.output_dir, "best_model.joblib"))
+    joblib.dump(
+        binned[1][1], os.path.join(args.output_dir, "binning_transformers.joblib")
+    )
+    print(
+        f"Wrote best_model.joblib and binning_transformers.joblib to {args.output_dir}"
+    )
+
+    if args.export_csv:
+        for name, (_, frame) in {
+            "df_transformed": transformed,
+            "df_feature_selection": selected,
+            "df_numeric_transformed": numeric,
+            "df_model_ready": ready,
+        }.items():
+            frame.to_csv(os.path.join(HERE, f"{name}.csv"), index=False)
+        print("Wrote the intermediate CSVs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""Drawing of the dashboard charts from precomputed aggregates.
+
+Figures are plain matplotlib Figure objects rather than pyplot figures, so
+nothing goes through pyplot's global state and the same code draws into a
+Qt canvas or any other backend. A ChartPlot keeps the artists it drew so
+new counts (e.g. after a filter change) update them in place.
+"""
+
+import numpy as np
+from matplotlib.figure import Figure
+from typing import Dict, Optional, Sequence, Tuple
+from aggregates import CHARTS, ChartSpec, ChurnAggregates, Grouping, churn_rate
+
+SPLIT_WIDTH = 0.25
+
+
+class ChartPlot:
+    """A chart drawn on one Axes whose artists are updated in place.
+
+    update() changes bar heights, line data and pie wedges for new counts
+    over the same groups; ``artists`` are everything it touches, for
+    blitting.
+    """
+
+    def __init__(self, ax, spec: ChartSpec, grouping: Grouping, counts: np.ndarray):
+        self.ax = ax
+        self.spec = spec
+        self.grouping = grouping
+        self.labels = list(spec.labels or grouping.labels)
+        self.artists = []
+        self.bars = []
+        totals = counts.sum(axis=0)
+
+        if spec.kind == "pie":
+            # Wedges keep the order of the first draw when counts change
+            self.order = np.argsort(-totals, kind="stable")
+            self.wedges, self.texts, self.autotexts = ax.pie(
+                # Axes.pie rejects all-zero sizes; empty wedges are set below
+                totals[self.order] if totals.any() else np.ones(len(totals)),
+                labels=[self.labels[i] for i in self.order],
+                autopct="%1.1f%%",
+                startangle=90,
+            )
+            self.artists = self.wedges + self.texts + self.autotexts
+            if not totals.any():
+                self._update_pie(totals)
+        elif spec.kind == "line":
+            present = totals > 0
+            (self.line,) = ax.plot(
+                np.asarray(self.labels)[present], churn_rate(counts)[present]
+            )
+            self.artists = [self.line]
+            ax.grid(True)
+        elif spec.kind == "split":
+            x = np.arange(len(self.labels))
+            self.bars = [
+                ax.bar(x - SPLIT_WIDTH / 2, counts[0], SPLIT_WIDTH, label="No"),
+                ax.bar(x + SPLIT_WIDTH / 2, counts[1], SPLIT_WIDTH, label="Yes"),
+            ]
+            ax.legend(title="Churn")
+        elif spec.kind == "hist":
+            centers = (grouping.edges[:-1] + grouping.edges[1:]) / 2
+            _, _, self.bars = ax.hist(
+                [centers, centers],
+                bins=grouping.edges,
+                weights=[counts[1], counts[0]],
+                label=["Churned", "Not Churned"],
+                alpha=0.7,
+            )
+            ax.legend()
+        elif spec.kind == "rate":
+            self.bars = [ax.bar(np.arange(len(self.labels)), churn_rate(counts))]
+        else:
+            raise ValueError(f"Unknown chart kind {spec.kind}")
+        for bars in self.bars:
+            self.artists.extend(bars.patches)
+
+        if spec.kind in ("split", "rate"):
+            ax.set_xticks(
+                np.arange(len(self.labels)),
+                self.labels,
+                rotation=spec.rotation,
+                ha="right" if spec.rotation else "center",
+            )
+        ax.set_title(spec.title)
+        if spec.xlabel:
+            ax.set_xlabel(spec.xlabel)
+        if spec.kind != "pie":
+            ax.set_ylabel(spec.ylabel)
+
+    def _bar_heights(self, counts: np.ndarray) -> list:
+        if self.spec.kind == "split":
+            return [counts[0], counts[1]]
+        if self.spec.kind == "hist":
+            return [counts[1], counts[0]]
+        return [churn_rate(counts)]
+
+    def _rescale(self, top: float) -> bool:
+        """Refit the y axis if ``top`` no longer fits it well; True when
+        the limits changed"""
+        current = self.ax.get_ylim()[1]
+        if current / 2 <= top <= current:
+            return False
+        self.ax.set_ylim(0, top * 1.05 if top > 0 else 1)
+        return True
+
+    def _update_pie(self, totals: np.ndarray):
+        fractions = totals[self.order] / max(totals.sum(), 1)
+        theta = 90.0
+        for wedge, text, autotext, fraction in zip(
+            self.wedges, self.texts, self.autotexts, fractions
+        ):
+            wedge.set_theta1(theta)
+            theta += 360.0 * fraction
+            wedge.set_theta2(theta)
+            middle = np.deg2rad((wedge.theta1 + wedge.theta2) / 2)
+            x, y = np.cos(middle), np.sin(middle)
+            # Positions match Axes.pie's default labeldistance and pctdistance
+            text.set_position((1.1 * x, 1.1 * y))
+            text.set_horizontalalignment("left" if x > 0 else "right")
+            autotext.set_position((0.6 * x, 0.6 * y))
+            autotext.set_text(f"{fraction * 100:.1f}%")
+            text.set_visible(fraction > 0)
+            autotext.set_visible(fraction > 0)
+
+    def update(self, counts: np.ndarray) -> bool:
+        """Show new counts; True when the axes limits changed, so the whole
+        figure (ticks included) needs redrawing rather than just the
+        artists"""
+        totals = counts.sum(axis=0)
+        if self.spec.kind == "pie":
+            self._update_pie(totals)
+            return False
+        if self.spec.kind == "line":
+            present = totals > 0
+            rates = churn_rate(counts)[present]
+            self.line.set_data(np.asarray(self.labels)[present], rates)
+            return self._rescale(rates.max() if len(rates) else 0)
+
+        top = 0
+        for bars, heights in zip(self.bars, self._bar_heights(counts)):
+            for patch, height in zip(bars.patches, heights):
+                patch.set_height(height)
+            top = max(top, heights.max() if len(heights) else 0)
+        return self._rescale(top)
+
+
+def figure_of(
+    charts: Sequence[Tuple[str, Grouping, np.ndarray]], figsize: tuple
+) -> Tuple[Figure, Dict[str, ChartPlot]]:
+    """One figure with the given (chart name, grouping, counts) side by
+    side, and their plots"""
+    figure = Figure(figsize=figsize)
+    plots = {}
+    for position, (name, grouping, counts) in enumerate(charts, 1):
+        ax = figure.add_subplot(1, len(charts), position)
+        plots[name] = ChartPlot(ax, CHARTS[name], grouping, counts)
+    if any(CHARTS[name].rotation for name, _, _ in charts):
+        figure.tight_layout()
+    return figure, plots
+
+
+def chart_figure(
+    aggregates: ChurnAggregates,
+    chart_names: Sequence[str],
+    figsize: tuple,
+    mask: Optional[np.ndarray] = None,
+) -> Tuple[Figure, Dict[str, ChartPlot]]:
+    """Figure of the named charts over the rows selected by ``mask``"""
+    return figure_of(
+        [(name, *aggregates.counts(CHARTS[name], mask)) for name in chart_names],
+        figsize,
+    )
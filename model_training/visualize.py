@@ -1,8 +1,6 @@
 import sys
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+from PyQt5.QtCore import QObject, QThread, QTimer, pyqtSignal, pyqtSlot
 from PyQt5.QtWidgets import (
     QApplication,
     QMainWindow,
@@ -15,16 +13,81 @@ from PyQt5.QtWidgets import (
     QGridLayout,
     QScrollArea,
 )
-from PyQt5.QtCore import Qt
-import numpy as np
-from PyQt5.QtCore import Qt
-import numpy as np
+from aggregates import CHARTS, ChurnAggregates, load_customers, load_presets
+from plots import chart_figure
+
+# Filter changes within this many milliseconds are recomputed once
+FILTER_DEBOUNCE_MS = 150
+ALL_TIME = "All Time"
+
+
+class BlitManager:
+    """Redraws a canvas's chart artists over a cached background.
+
+    The artists are animated, so full draws leave them out; the background
+    is captured after each full draw and the artists drawn on top of it.
+    """
+
+    def __init__(self, canvas, artists):
+        self.canvas = canvas
+        self.artists = artists
+        self.background = None
+        for artist in artists:
+            artist.set_animated(True)
+        canvas.mpl_connect("draw_event", self.on_draw)
+
+    def on_draw(self, event):
+        self.background = self.canvas.copy_from_bbox(self.canvas.figure.bbox)
+        self.draw_artists()
+
+    def draw_artists(self):
+        for artist in self.artists:
+            self.canvas.figure.draw_artist(artist)
+
+    def update(self):
+        if self.background is None:
+            # Not drawn yet; the first draw will show the current state
+            self.canvas.draw_idle()
+            return
+        self.canvas.restore_region(self.background)
+        self.draw_artists()
+        self.canvas.blit(self.canvas.figure.bbox)
+
+
+class AggregateWorker(QObject):
+    """Computes chart counts for a filter selection off the UI thread"""
+
+    finished = pyqtSignal(int, object, dict)
+
+    def __init__(self, aggregates):
+        super().__init__()
+        self.aggregates = aggregates
+        # Set by the UI thread; queued requests older than this are skipped
+        self.latest = 0
+
+    @pyqtSlot(int, dict)
+    def compute(self, generation, selection):
+        if generation != self.latest:
+            return
+        mask = self.aggregates.filters.mask(**selection)
+        counts = {
+            name: self.aggregates.counts(spec, mask)[1] for name, spec in CHARTS.items()
+        }
+        self.finished.emit(generation, mask, counts)
 
 
 class ChurnAnalysisApp(QMainWindow):
+    requested = pyqtSignal(int, dict)
+
     def __init__(self, data):
         super().__init__()
         self.data = data
+        # Shared by every chart; nothing is computed until a tab is shown
+        self.aggregates = ChurnAggregates(data, load_presets())
+        # Rows selected by the filters (None for all) and the drawn charts
+        self.mask = None
+        self.generation = 0
+        self.charts = []
         self.initUI()
 
     def initUI(self):
@@ -36,100 +99,114 @@ class ChurnAnalysisApp(QMainWindow):
         self.setCentralWidget(central_widget)
         layout = QVBoxLayout(central_widget)
 
+        # Filters, recomputed on a worker thread after a short pause
+        layout.addLayout(self.create_filter_bar())
+        self.filter_timer = QTimer(self)
+        self.filter_timer.setSingleShot(True)
+        self.filter_timer.setInterval(FILTER_DEBOUNCE_MS)
+        self.filter_timer.timeout.connect(self.request_update)
+
+        self.worker_thread = QThread(self)
+        self.worker = AggregateWorker(self.aggregates)
+        self.worker.moveToThread(self.worker_thread)
+        self.requested.connect(self.worker.compute)
+        self.worker.finished.connect(self.apply_update)
+        self.worker_thread.start()
+
         # Create tabs
         self.tabs = QTabWidget()
         layout.addWidget(self.tabs)
 
-        # Create different analysis tabs
-        self.create_overview_tab()
-        self.create_demographic_tab()
-        self.create_service_tab()
-        self.create_financial_tab()
+        # Create empty analysis tabs, each filled in when first shown
+        self.tab_builders = {}
+        for title, builder in (
+            ("Overview", self.create_overview_tab),
+            ("Demographics", self.create_demographic_tab),
+            ("Services", self.create_service_tab),
+            ("Financials", self.create_financial_tab),
+        ):
+            page = QWidget()
+            QVBoxLayout(page).setContentsMargins(0, 0, 0, 0)
+            self.tab_builders[self.tabs.addTab(page, title)] = builder
+        self.tabs.currentChanged.connect(self.build_tab)
+        self.build_tab(self.tabs.currentIndex())
 
         self.show()
 
+    def create_filter_bar(self):
+        labels = self.aggregates.filters.labels
+        presets = self.aggregates.presets
+        self.filters = {}
+        bar = QHBoxLayout()
+        for key, title, options in (
+            ("time_period", "Time Period", [ALL_TIME, *presets.TIME_PERIODS]),
+            ("segment", "Customer Segment", presets.SEGMENTS),
+            ("service", "Service Type", [presets.ALL_SERVICES, *labels["service"]]),
+            ("contract", "Contract Type", [presets.ALL_CONTRACTS, *labels["contract"]]),
+        ):
+            combo = QComboBox()
+            combo.addItems(options)
+            combo.currentTextChanged.connect(lambda _: self.filter_timer.start())
+            bar.addWidget(QLabel(title))
+            bar.addWidget(combo, 1)
+            self.filters[key] = combo
+        return bar
+
+    def request_update(self):
+        self.generation += 1
+        self.worker.latest = self.generation
+        selection = {key: combo.currentText() for key, combo in self.filters.items()}
+        self.requested.emit(self.generation, selection)
+
+    def apply_update(self, generation, mask, counts):
+        if generation != self.generation:
+            return
+        self.mask = mask
+        for canvas, plots, blitter in self.charts:
+            rescaled = [plot.update(counts[name]) for name, plot in plots.items()]
+            if any(rescaled):
+                canvas.draw_idle()
+            else:
+                blitter.update()
+
+    def closeEvent(self, event):
+        self.worker_thread.quit()
+        self.worker_thread.wait()
+        super().closeEvent(event)
+
+    def build_tab(self, index):
+        builder = self.tab_builders.pop(index, None)
+        if builder is not None:
+            self.tabs.widget(index).layout().addWidget(builder())
+
+    def canvas(self, chart_names, figsize):
+        figure, plots = chart_figure(self.aggregates, chart_names, figsize, self.mask)
+        canvas = FigureCanvas(figure)
+        artists = [artist for plot in plots.values() for artist in plot.artists]
+        self.charts.append((canvas, plots, BlitManager(canvas, artists)))
+        return canvas
+
     def create_overview_tab(self):
         overview_tab = QWidget()
         layout = QVBoxLayout(overview_tab)
 
-        # Overall churn rate
-        fig1 = plt.figure(figsize=(10, 5))
-        churn_counts = self.data["Churn"].value_counts()
-        plt.pie(
-            churn_counts, labels=churn_counts.index, autopct="%1.1f%%", startangle=90
-        )
-        plt.title("Overall Churn Rate")
-        canvas1 = FigureCanvas(fig1)
-
-        # Churn by tenure
-        fig2 = plt.figure(figsize=(10, 5))
-        tenure_churn = self.data.groupby("tenure")["Churn"].apply(
-            lambda x: (x == "Yes").mean() * 100
-        )
-        plt.plot(tenure_churn.index, tenure_churn.values)
-        plt.xlabel("Tenure (months)")
-        plt.ylabel("Churn Rate (%)")
-        plt.title("Churn Rate by Tenure")
-        plt.grid(True)
-        canvas2 = FigureCanvas(fig2)
+        # Overall churn rate and churn by tenure
+        layout.addWidget(self.canvas(["churnRate"], (10, 5)))
+        layout.addWidget(self.canvas(["tenureChurn"], (10, 5)))
 
-        # Add to layout
-        layout.addWidget(canvas1)
-        layout.addWidget(canvas2)
-
-        self.tabs.addTab(overview_tab, "Overview")
+        return overview_tab
 
     def create_demographic_tab(self):
         demographic_tab = QWidget()
         layout = QGridLayout(demographic_tab)
 
-        # Churn by gender
-        fig1 = plt.figure(figsize=(6, 4))
-        gender_churn = self.data.groupby("gender")["Churn"].value_counts().unstack()
-        gender_churn.plot(kind="bar", ax=plt.gca())
-        plt.title("Churn by Gender")
-        plt.ylabel("Count")
-        plt.xticks(rotation=0)
-        canvas1 = FigureCanvas(fig1)
-
-        # Churn by senior citizen
-        fig2 = plt.figure(figsize=(6, 4))
-        senior_churn = (
-            self.data.groupby("SeniorCitizen")["Churn"].value_counts().unstack()
-        )
-        senior_churn.plot(kind="bar", ax=plt.gca())
-        plt.title("Churn by Senior Citizen Status")
-        plt.ylabel("Count")
-        plt.xticks([0, 1], ["Not Senior", "Senior"], rotation=0)
-        canvas2 = FigureCanvas(fig2)
-
-        # Churn by partner
-        fig3 = plt.figure(figsize=(6, 4))
-        partner_churn = self.data.groupby("Partner")["Churn"].value_counts().unstack()
-        partner_churn.plot(kind="bar", ax=plt.gca())
-        plt.title("Churn by Partner Status")
-        plt.ylabel("Count")
-        plt.xticks(rotation=0)
-        canvas3 = FigureCanvas(fig3)
-
-        # Churn by dependents
-        fig4 = plt.figure(figsize=(6, 4))
-        dependents_churn = (
-            self.data.groupby("Dependents")["Churn"].value_counts().unstack()
-        )
-        dependents_churn.plot(kind="bar", ax=plt.gca())
-        plt.title("Churn by Dependents")
-        plt.ylabel("Count")
-        plt.xticks(rotation=0)
-        canvas4 = FigureCanvas(fig4)
-
-        # Add to grid layout
-        layout.addWidget(canvas1, 0, 0)
-        layout.addWidget(canvas2, 0, 1)
-        layout.addWidget(canvas3, 1, 0)
-        layout.addWidget(canvas4, 1, 1)
+        # Churn by gender, senior citizen, partner and dependents
+        layout.addWidget(self.canvas(["genderChurn"], (6, 4)), 0, 0)
+        layout.addWidget(self.canvas(["seniorChurn"], (6, 4)), 0, 1)
+        layout.addWidget(self.canvas(["partnerChurn"], (6, 4)), 1, 0)
+        layout.addWidget(self.canvas(["dependentsChurn"], (6, 4)), 1, 1)
 
-        self.tabs.addTab(demographic_tab, "Demographics")
+        return demographic_tab
 
     def create_service_tab(self):
         # Make the tab scrollable
@@ -141,140 +218,38 @@ class ChurnAnalysisApp(QMainWindow):
         inner_widget.setMinimumSize(1000, 1600)
         scroll_area.setMinimumSize(1000, 600)
 
-        # Internet service vs churn
-        fig1 = plt.figure(figsize=(6, 4))
-        internet_churn = (
-            self.data.groupby("InternetService")["Churn"].value_counts().unstack()
-        )
-        internet_churn.plot(kind="bar", ax=plt.gca())
-        plt.title("Churn by Internet Service Type")
-        plt.ylabel("Count")
-        plt.xticks(rotation=0)
-        canvas1 = FigureCanvas(fig1)
-
-        # Contract type vs churn
-        fig2 = plt.figure(figsize=(6, 4))
-        contract_churn = self.data.groupby("Contract")["Churn"].value_counts().unstack()
-        contract_churn.plot(kind="bar", ax=plt.gca())
-        plt.title("Churn by Contract Type")
-        plt.ylabel("Count")
-        plt.xticks(rotation=0)
-        canvas2 = FigureCanvas(fig2)
-
-        # Payment method vs churn
-        fig3 = plt.figure(figsize=(8, 5))
-        payment_churn = (
-            self.data.groupby("PaymentMethod")["Churn"].value_counts().unstack()
-        )
-        payment_churn.plot(kind="bar", ax=plt.gca())
-        plt.title("Churn by Payment Method")
-        plt.ylabel("Count")
-        plt.xticks(rotation=45, ha="right")
-        plt.tight_layout()
-        canvas3 = FigureCanvas(fig3)
-
-        # Phone service vs churn
-        fig4 = plt.figure(figsize=(6, 4))
-        phone_churn = (
-            self.data.groupby("PhoneService")["Churn"].value_counts().unstack()
-        )
-        phone_churn.plot(kind="bar", ax=plt.gca())
-        plt.title("Churn by Phone Service")
-        plt.ylabel("Count")
-        plt.xticks(rotation=0)
-        canvas4 = FigureCanvas(fig4)
-
-        # Center-align the last widget (canvas4)
-
+        # Center-align the last widget (phone service)
         center_widget = QWidget()
         center_layout = QHBoxLayout(center_widget)
         center_layout.addStretch(1)
-        center_layout.addWidget(canvas4)
+        center_layout.addWidget(self.canvas(["phoneChurn"], (6, 4)))
         center_layout.addStretch(1)
 
-        # Add to grid layout
-        layout.addWidget(canvas1, 0, 0)
-        layout.addWidget(canvas2, 0, 1)
-        layout.addWidget(canvas3, 1, 0, 1, 2)
+        # Internet service, contract type and payment method vs churn
+        layout.addWidget(self.canvas(["internetChurn"], (6, 4)), 0, 0)
+        layout.addWidget(self.canvas(["contractChurn"], (6, 4)), 0, 1)
+        layout.addWidget(self.canvas(["paymentChurn"], (8, 5)), 1, 0, 1, 2)
         layout.addWidget(center_widget, 3, 0, 1, 2)
 
         scroll_area.setWidget(inner_widget)
-        self.tabs.addTab(scroll_area, "Services")
+        return scroll_area
 
     def create_financial_tab(self):
         financial_tab = QWidget()
         layout = QVBoxLayout(financial_tab)
 
-        # Monthly charges distribution
-        fig1 = plt.figure(figsize=(10, 5))
-        plt.subplot(1, 2, 1)
-        churn_yes = self.data[self.data["Churn"] == "Yes"]["MonthlyCharges"]
-        churn_no = self.data[self.data["Churn"] == "No"]["MonthlyCharges"]
-        plt.hist(
-            [churn_yes, churn_no], bins=20, label=["Churned", "Not Churned"], alpha=0.7
-        )
-        plt.xlabel("Monthly Charges")
-        plt.ylabel("Frequency")
-        plt.title("Monthly Charges Distribution")
-        plt.legend()
-
-        # Total charges distribution
-        plt.subplot(1, 2, 2)
-        # Convert TotalCharges to numeric, handling empty strings
-        self.data["TotalCharges"] = pd.to_numeric(
-            self.data["TotalCharges"], errors="coerce"
-        )
-        churn_yes_total = self.data[self.data["Churn"] == "Yes"][
-            "TotalCharges"
-        ].dropna()
-        churn_no_total = self.data[self.data["Churn"] == "No"]["TotalCharges"].dropna()
-        plt.hist(
-            [churn_yes_total, churn_no_total],
-            bins=20,
-            label=["Churned", "Not Churned"],
-            alpha=0.7,
+        # Monthly and total charges distributions, monthly charges vs churn rate
+        layout.addWidget(
+            self.canvas(["monthlyChargesDist", "totalChargesDist"], (10, 5))
         )
-        plt.xlabel("Total Charges")
-        plt.ylabel("Frequency")
-        plt.title("Total Charges Distribution")
-        plt.legend()
-
-        canvas1 = FigureCanvas(fig1)
-
-        # Monthly charges vs churn rate
-        fig2 = plt.figure(figsize=(10, 5))
-        self.data["MonthlyChargesGroup"] = pd.cut(self.data["MonthlyCharges"], bins=10)
-        monthly_churn_rate = self.data.groupby("MonthlyChargesGroup")["Churn"].apply(
-            lambda x: (x == "Yes").mean() * 100
-        )
-        plt.bar(range(len(monthly_churn_rate)), monthly_churn_rate.values)
-        plt.xlabel("Monthly Charges Groups")
-        plt.ylabel("Churn Rate (%)")
-        plt.title("Churn Rate by Monthly Charges Groups")
-        plt.xticks(
-            range(len(monthly_churn_rate)),
-            [
-                f"${int(interval.left)}-${int(interval.right)}"
-                for interval in monthly_churn_rate.index
-            ],
-            rotation=45,
-            ha="right",
-        )
-        canvas2 = FigureCanvas(fig2)
+        layout.addWidget(self.canvas(["monthlyGroupsChurn"], (10, 5)))
 
-        layout.addWidget(canvas1)
-        layout.addWidget(canvas2)
-
-        self.tabs.addTab(financial_tab, "Financials")
+        return financial_tab
 
 
 def main():
-    # Load and preprocess data
-    data = pd.read_csv("customer-churn-table.csv")
-
-    # Convert TotalCharges to numeric, handling empty strings
-    data["TotalCharges"] = pd.to_numeric(data["TotalCharges"], errors="coerce")
-    data["TotalCharges"] = data["TotalCharges"].dropna()
+    # Load only the columns the charts use
+    data = load_customers("customer-churn-table.csv")
 
     # Launch the application
     app = QApplication(sys.argv)
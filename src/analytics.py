@@ -0,0 +1,327 @@
+"""Dashboard statistics and charts over a Dataset and a filter mask.
+
+Every chart is a registry entry: a column, how rows are grouped (category
+codes or bin edges) and a metric. Evaluation is one np.bincount pass for
+the group totals and one for the churned counts, so a chart costs O(rows)
+regardless of how many bins it has. The two count vectors are the chart's
+partial aggregate; partials of disjoint row sets can be summed before
+finalize_chart turns them into the response payload.
+"""
+
+import numpy as np
+from dataclasses import dataclass
+from typing import Optional, Tuple
+from dataset import Dataset
+
+MONTHLY_CHARGES_EDGES = (20, 30, 40, 50, 60, 70, 80, 90, 100, 110, 120)
+TOTAL_CHARGES_EDGES = (0, 1000, 2000, 3000, 4000, 5000, 6000, 7000, 8000, 999999)
+TENURE_MONTHS = tuple(range(1, 73))
+
+
+def _range_labels(edges) -> tuple:
+    return tuple(
+        f"{lower}-{upper}" if upper != 999999 else f"{lower}+"
+        for lower, upper in zip(edges[:-1], edges[1:])
+    )
+
+
+@dataclass(frozen=True)
+class ChartSpec:
+    """One dashboard chart.
+
+    Rows are grouped by the category codes of ``column``, or by
+    ``edges[i] <= value < edges[i + 1]`` when ``edges`` is set. ``metric``
+    is "count" (rows per label, most frequent first), "split" (churned and
+    not churned counts) or "rate" (churn rate in percent). Category charts
+    list only labels present in the rows unless ``labels`` fixes them.
+    """
+
+    column: str
+    metric: str
+    edges: Optional[Tuple[float, ...]] = None
+    labels: Optional[tuple] = None
+
+
+CHARTS = {
+    "churnRate": ChartSpec("Churn", "count"),
+    "tenureChurn": ChartSpec(
+        "tenure", "rate", edges=TENURE_MONTHS + (73,), labels=TENURE_MONTHS
+    ),
+    "genderChurn": ChartSpec("gender", "split"),
+    "seniorChurn": ChartSpec("SeniorCitizen", "split", labels=("Not Senior", "Senior")),
+    "partnerChurn": ChartSpec("Partner", "split"),
+    "dependentsChurn": ChartSpec("Dependents", "split"),
+    "internetChurn": ChartSpec("InternetService", "split"),
+    "contractChurn": ChartSpec("Contract", "split"),
+    "paymentChurn": ChartSpec("PaymentMethod", "split"),
+    "phoneChurn": ChartSpec("PhoneService", "split"),
+    "monthlyChargesDist": ChartSpec(
+        "MonthlyCharges",
+        "split",
+        edges=MONTHLY_CHARGES_EDGES,
+        labels=_range_labels(MONTHLY_CHARGES_EDGES),
+    ),
+    "totalChargesDist": ChartSpec(
+        "TotalCharges",
+        "split",
+        edges=TOTAL_CHARGES_EDGES,
+        labels=_range_labels(TOTAL_CHARGES_EDGES),
+    ),
+    "monthlyGroupsChurn": ChartSpec(
+        "MonthlyCharges",
+        "rate",
+        edges=MONTHLY_CHARGES_EDGES,
+        labels=_range_labels(MONTHLY_CHARGES_EDGES),
+    ),
+}
+CHART_NAMES = list(CHARTS)
+
+
+class FilteredRows:
+    """Columns of the rows selected by ``mask``, each selected at most once.
+
+    Sharing one instance between the stats and all charts means a dashboard
+    refresh filters every column it touches a single time, and charts on
+    the same column and bins share one set of group ids.
+    """
+
+    def __init__(self, dataset: Dataset, mask: Optional[np.ndarray]):
+        self.dataset = dataset
+        self.mask = mask
+        self._columns = {}
+        self._groups = {}
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        values = self._columns.get(column)
+        if values is None:
+            values = (
+                self.dataset.churned if column == "churned" else self.dataset[column]
+            )
+            if self.mask is not None:
+                values = values[self.mask]
+            self._columns[column] = values
+        return values
+
+    def __len__(self) -> int:
+        return len(self["churned"])
+
+    def labels(self, column: str) -> list:
+        return self.dataset.labels(column)
+
+    def select(self, *columns: str) -> "FilteredRows":
+        """Filter ``columns`` now rather than on first use"""
+        for column in columns:
+            self[column]
+        return self
+
+    def groups(self, spec: ChartSpec) -> Tuple[np.ndarray, int]:
+        """Group id per row and the number of groups.
+
+        Rows outside every bin get id ``n_groups``, an overflow slot that
+        finalize_chart ignores.
+        """
+        key = (spec.column, spec.edges)
+        cached = self._groups.get(key)
+        if cached is None:
+            values = self[spec.column]
+            if spec.edges is None:
+                n_groups = len(self.labels(spec.column))
+                ids = values
+            else:
+                n_groups = len(spec.edges) - 1
+                ids = np.searchsorted(spec.edges, values, side="right") - 1
+                ids[ids < 0] = n_groups
+            cached = self._groups[key] = (ids, n_groups)
+        return cached
+
+
+def chart_partial(rows: FilteredRows, spec: ChartSpec) -> np.ndarray:
+    """[group totals, churned per group], each of length n_groups + 1"""
+    ids, n_groups = rows.groups(spec)
+    return np.stack(
+        [
+            np.bincount(ids, minlength=n_groups + 1),
+            np.bincount(ids, weights=rows["churned"], minlength=n_groups + 1),
+        ]
+    ).astype(np.int64)
+
+
+def merge_chart_partials(
+    total: Optional[np.ndarray], partial: np.ndarray
+) -> np.ndarray:
+    """Sum two chart partials.
+
+    Category partials of different row sets may have different lengths
+    when later rows bring new labels (appended codes); groups are aligned
+    by code and the overflow slots are summed.
+    """
+    if total is None:
+        return partial.copy()
+    if total.shape == partial.shape:
+        return total + partial
+    merged = np.zeros((2, max(total.shape[1], partial.shape[1])), dtype=np.int64)
+    for part in (total, partial):
+        merged[:, : part.shape[1] - 1] += part[:, :-1]
+        merged[:, -1] += part[:, -1]
+    return merged
+
+
+def chart_codes(
+    spec: ChartSpec, partial: np.ndarray, labels: Optional[list] = None
+) -> Tuple[list, list]:
+    """Group codes a chart shows, in display order, and their labels.
+
+    ``labels`` are the category labels of ``spec.column``; binned charts
+    take theirs from the spec.
+    """
+    if spec.edges is None and spec.labels is None:
+        # Category chart: only labels with rows, in pandas groupby order
+        codes = [code for code in range(len(labels)) if partial[0, code]]
+        if spec.metric == "count":
+            codes.sort(key=lambda code: (-partial[0, code], labels[code]))
+        else:
+            codes.sort(key=lambda code: labels[code])
+        return codes, [labels[code] for code in codes]
+    return list(range(len(spec.labels))), list(spec.labels)
+
+
+def finalize_chart(
+    spec: ChartSpec, partial: np.ndarray, labels: Optional[list] = None
+) -> dict:
+    """Response payload from a (merged) partial"""
+    codes, labels = chart_codes(spec, partial, labels)
+    # Counts stay int64 arrays; serialization writes them without tolist()
+    totals = partial[0, codes]
+    churned = partial[1, codes]
+
+    if spec.metric == "count":
+        return {"labels": labels, "values": totals}
+    if spec.metric == "rate":
+        rates = np.zeros(len(codes))
+        np.divide(churned, totals, out=rates, where=totals > 0)
+        return {
+            "labels": labels,
+            "values": [round(rate * 100, 2) for rate in rates.tolist()],
+        }
+    return {
+        "labels": labels,
+        "churned": churned,
+        "not_churned": totals - churned,
+    }
+
+
+def stats_partial(rows: FilteredRows) -> np.ndarray:
+    """[customers, churned, sum of MonthlyCharges, sum of tenure]"""
+    return np.array(
+        [
+            len(rows),
+            np.count_nonzero(rows["churned"]),
+            rows["MonthlyCharges"].sum(),
+            rows["tenure"].sum(),
+        ],
+        dtype=float,
+    )
+
+
+def finalize_stats(partial: np.ndarray) -> dict:
+    total_customers, churned, monthly_sum, tenure_sum = partial.tolist()
+    if total_customers == 0:
+        return {
+            "total_customers": 0,
+            "churn_rate": 0,
+            "avg_monthly": 0,
+            "avg_tenure": 0,
+        }
+    return {
+        "total_customers": int(total_customers),
+        "churn_rate": round(churned / total_customers * 100, 2),
+        "avg_monthly": round(monthly_sum / total_customers, 2),
+        "avg_tenure": round(tenure_sum / total_customers, 1),
+    }
+
+
+def _stats(rows: FilteredRows) -> dict:
+    return finalize_stats(stats_partial(rows))
+
+
+def chart_from_rows(rows: FilteredRows, chart_name: str) -> dict:
+    spec = CHARTS.get(chart_name)
+    if spec is None:
+        return {}
+    labels = rows.labels(spec.column) if spec.edges is None else None
+    return finalize_chart(spec, chart_partial(rows, spec), labels)
+
+
+def compute_stats(dataset: Dataset, mask: Optional[np.ndarray]) -> dict:
+    return _stats(FilteredRows(dataset, mask))
+
+
+def compute_chart(
+    dataset: Dataset, mask: Optional[np.ndarray], chart_name: str
+) -> dict:
+    return chart_from_rows(FilteredRows(dataset, mask), chart_name)
+
+
+def compute_dashboard(dataset: Dataset, mask: Optional[np.ndarray]) -> dict:
+    """Stats and every chart for one filter selection, filtering only once"""
+    rows = FilteredRows(dataset, mask)
+    return {
+        "stats": _stats(rows),
+        "charts": {
+            chart_name: chart_from_rows(rows, chart_name) for chart_name in CHART_NAMES
+        },
+    }
+
+
+def rows_partials(rows: FilteredRows, specs: dict, with_stats: bool = True):
+    """Stats partial (None unless ``with_stats``) and the partial of every
+    chart in ``specs`` ({name: ChartSpec}) for one row subset"""
+    stats = stats_partial(rows) if with_stats else None
+    return stats, {name: chart_partial(rows, spec) for name, spec in specs.items()}
+
+
+def finalize_charts(partials: dict, categories: dict) -> dict:
+    """Payload of every chart in ``partials`` ({name: partial or None}),
+    whose codes refer to ``categories``"""
+    charts = {}
+    for name, partial in partials.items():
+        spec = CHARTS[name]
+        labels = categories[spec.column] if spec.edges is None else None
+        if partial is None:
+            # No rows were scanned at all
+            size = len(labels) if spec.edges is None else len(spec.edges) - 1
+            partial = np.zeros((2, size + 1), dtype=np.int64)
+        charts[name] = finalize_chart(spec, partial, labels)
+    return charts
+
+
+class PartialAggregator:
+    """Backend that answers queries by merging partials of row subsets.
+
+    Subclasses implement scan(params, specs, with_stats), returning the
+    merged stats partial, the merged partial per chart and the category
+    labels those partials' codes refer to.
+    """
+
+    def scan(self, params: dict, specs: dict, with_stats: bool = True):
+        raise NotImplementedError
+
+    def stats(self, params: dict) -> dict:
+        partial, _, _ = self.scan(params, {})
+        return finalize_stats(partial)
+
+    def chart(self, params: dict, chart_name: str) -> dict:
+        spec = CHARTS.get(chart_name)
+        if spec is None:
+            return {}
+        _, partials, categories = self.scan(
+            params, {chart_name: spec}, with_stats=False
+        )
+        return finalize_charts(partials, categories)[chart_name]
+
+    def dashboard(self, params: dict) -> dict:
+        partial, partials, categories = self.scan(params, CHARTS)
+        return {
+            "stats": finalize_stats(partial),
+            "charts": finalize_charts(partials, categories),
+        }
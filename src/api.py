@@ -1,48 +1,116 @@
+import hashlib
 import os
+import threading
+import time
 import pandas as pd
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, File, HTTPException, Request, Response, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Optional
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import TypeAdapter, ValidationError
+from typing import List, Optional
 from model import CalibratedModel, PredictionInput, PredictionOutput
+from batch_score import (
+    DEFAULT_CHUNKSIZE,
+    OUTPUT_FORMATS,
+    encode_header,
+    encode_summary,
+    missing_columns,
+    read_lines,
+)
+from dataset import (
+    CATEGORICAL_COLUMNS,
+    ID_COLUMN,
+    NUMERIC_COLUMNS,
+    load_dataset,
+)
+from expressions import FilterExpressionError, compile_filter, plan_cache_stats
+from filters import FilterIndex
+from presets import ALL_CONTRACTS, ALL_SERVICES, SEGMENTS, TIME_PERIODS
+from cube import AnalyticsCube
+from incremental import IncrementalTable, read_delta
+from chunked import ChunkedBackend
+from sharded import ShardedBackend
+from sampling import StratifiedSample
+from risk import RiskIndex, RiskIndexer, score_dataset
+from cache import ResponseCache
+from coalescer import PredictionCoalescer
+from analytics import CHARTS
+from metrics import (
+    CHART_PHASE_SECONDS,
+    PREDICT_STAGE_SECONDS,
+    REGISTRY,
+    RESPONSE_ENCODE_SECONDS,
+    MetricsMiddleware,
+    scoring_route,
+)
+import serialization
+import executor
 
 DATA_PATH = os.getenv("DATA_PATH", "./data.csv")
+# Binary copy of DATA_PATH, memory-mapped at startup; set empty to disable
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "./snapshot")
+# With several uvicorn workers, SHARED_DATA=1 makes every worker attach to
+# the read-only memory-mapped snapshot (data and filter masks) instead of
+# holding a private copy, so resident memory stays flat as workers are added
+SHARED_DATA = os.getenv("SHARED_DATA", "0") == "1"
 MODEL_PATH = os.getenv("MODEL_PATH", "utils/best_model.joblib")
 BIN_PATH = os.getenv("BIN_PATH", "utils/binning_transformers.joblib")
-
-
-def apply_filters(
-    dataframe,
-    time_period: Optional[str] = None,
-    segment: Optional[str] = None,
-    service: Optional[str] = None,
-    contract: Optional[str] = None,
-):
-    data = dataframe.copy()
-    # Time period filter (example: Last 30 days = tenure <= 1)
-    if time_period:
-        if time_period == "Last 30 days":
-            data = data[data["tenure"] <= 1]
-        elif time_period == "Last 90 days":
-            data = data[data["tenure"] <= 3]
-        elif time_period == "Last 6 months":
-            data = data[data["tenure"] <= 6]
-        elif time_period == "Last year":
-            data = data[data["tenure"] <= 12]
-    # Segment filter
-    if segment and segment != "All Segments":
-        if segment == "New Customers":
-            data = data[data["tenure"] <= 6]
-        elif segment == "Long-term Customers":
-            data = data[data["tenure"] > 24]
-        elif segment == "High-value Customers":
-            data = data[data["MonthlyCharges"] > 80]
-    # Service filter
-    if service and service != "All Services":
-        data = data[data["InternetService"] == service]
-    # Contract filter
-    if contract and contract != "All Contracts":
-        data = data[data["Contract"] == contract]
-    return data
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "10000"))
+INFERENCE_MODE = os.getenv("INFERENCE_MODE", "live")  # "live" or "table"
+# "memory" keeps the table in RAM; "chunked" answers every analytics query
+# with a streaming scan of DATA_PATH (a CSV or a directory of CSV
+# partitions) for tables that do not fit in memory
+ANALYTICS_BACKEND = os.getenv("ANALYTICS_BACKEND", "memory")
+ANALYTICS_CHUNKSIZE = int(os.getenv("ANALYTICS_CHUNKSIZE", "200000"))
+# In-memory tables of at least SHARD_MIN_ROWS rows are aggregated by
+# ANALYTICS_SHARDS processes (default: one per core), each over a row range
+# of the memory-mapped snapshot. Needs SNAPSHOT_DIR and EXECUTOR=thread.
+SHARD_MIN_ROWS = int(os.getenv("SHARD_MIN_ROWS", "1000000"))
+ANALYTICS_SHARDS = int(os.getenv("ANALYTICS_SHARDS", "0"))
+# /stats and /chart accept approximate=true (or max_error, in percentage
+# points of churn rate) to answer from a stratified sample of about
+# APPROX_SAMPLE_ROWS rows drawn at startup; 0 disables approximate mode.
+# Needs the in-memory backend.
+APPROX_SAMPLE_ROWS = int(os.getenv("APPROX_SAMPLE_ROWS", "100000"))
+APPROX_MAX_ERROR = float(os.getenv("APPROX_MAX_ERROR", "1.0"))
+# /customers/top-risk ranks every loaded customer by churn probability,
+# scored in bulk at startup (in-memory backend only). The index is rebuilt
+# in the background when the model files or the data change, checked every
+# RISK_INDEX_POLL_SECONDS (0: never); with EXECUTOR=thread new model files
+# are then served by /predict too, swapped in with the index.
+RISK_INDEX = os.getenv("RISK_INDEX", "1") == "1"
+RISK_INDEX_POLL_SECONDS = float(os.getenv("RISK_INDEX_POLL_SECONDS", "30"))
+RISK_MAX_K = int(os.getenv("RISK_MAX_K", "10000"))
+# Byte budget of the ranked rows kept per filter selection
+RISK_SELECTION_CACHE_MB = float(os.getenv("RISK_SELECTION_CACHE_MB", "64"))
+# POST /data/append adds and replaces rows of the in-memory table in
+# O(delta), amortized (see incremental.py); it needs EXECUTOR=thread,
+# SHARED_DATA=0 and no sharded aggregation, so that one process holds the
+# table. The stratified sample and the risk index are rebuilt in the
+# background afterwards.
+DATA_APPEND = os.getenv("DATA_APPEND", "1") == "1"
+# Precompute every filter combination at startup unless the cube would hold
+# more than CUBE_MAX_COMBINATIONS entries; then compute on demand
+ANALYTICS_CUBE = os.getenv("ANALYTICS_CUBE", "1") == "1"
+CUBE_MAX_COMBINATIONS = int(os.getenv("CUBE_MAX_COMBINATIONS", "5000"))
+# Response cache for the analytics routes; CACHE_SIZE=0 disables it.
+# CACHE_MAX_AGE=0 makes browsers revalidate with If-None-Match every time.
+CACHE_SIZE = int(os.getenv("CACHE_SIZE", "1024"))
+CACHE_TTL = float(os.getenv("CACHE_TTL", "300"))
+CACHE_MAX_AGE = int(os.getenv("CACHE_MAX_AGE", "0"))
+# CPU-heavy handlers run in a "thread" or "process" pool. At most
+# MAX_CONCURRENT_HEAVY of them run at once and EXECUTOR_QUEUE more may
+# wait; beyond that requests get an immediate 503.
+EXECUTOR_KIND = os.getenv("EXECUTOR", "thread")
+EXECUTOR_WORKERS = int(os.getenv("EXECUTOR_WORKERS", "0")) or None
+MAX_CONCURRENT_HEAVY = int(os.getenv("MAX_CONCURRENT_HEAVY", "0")) or None
+EXECUTOR_QUEUE = int(os.getenv("EXECUTOR_QUEUE", "64"))
+# Concurrent /predict calls arriving within PREDICT_BATCH_WINDOW_MS of each
+# other (up to PREDICT_MAX_BATCH) are scored as one batch; 0 disables it
+PREDICT_BATCH_WINDOW_MS = float(os.getenv("PREDICT_BATCH_WINDOW_MS", "2"))
+PREDICT_MAX_BATCH = int(os.getenv("PREDICT_MAX_BATCH", "64"))
 
 
 app = FastAPI()
@@ -55,24 +123,346 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
+
+PREDICTION_OUTPUTS = TypeAdapter(List[PredictionOutput])
+VALIDATION_SECONDS = PREDICT_STAGE_SECONDS.labels("/predict", "validation")
+SERIALIZATION_SECONDS = PREDICT_STAGE_SECONDS.labels("/predict", "serialization")
+# Scrape-time views of the executor and response cache counters
+REGISTRY.gauge(
+    "heavy_executor_pending",
+    "Heavy requests running or waiting for an executor slot",
+    function=lambda: app.state.executor.pending,
+)
+REGISTRY.counter(
+    "heavy_executor_rejected_total",
+    "Heavy requests rejected with 503",
+    function=lambda: app.state.executor.rejected,
+)
+for _counter in ("hits", "misses", "evictions", "not_modified"):
+    REGISTRY.counter(
+        f"response_cache_{_counter}_total",
+        f"Response cache {_counter.replace('_', ' ')}",
+        function=lambda counter=_counter: getattr(app.state.response_cache, counter),
+    )
 
 
 @app.on_event("startup")
 async def load_model():
     try:
-        app.state.model = CalibratedModel(MODEL_PATH, BIN_PATH)
-        print("Model loaded successfully")
-
-        df = pd.read_csv(DATA_PATH)
-        df["TotalCharges"] = pd.to_numeric(df["TotalCharges"], errors="coerce")
-        df = df.dropna()
-        app.state.data = df.copy()
-        print("DataFrame loaded successfully")
+        timings = {}
+        started = time.perf_counter()
+        app.state.model_files_version = _model_files_version()
+        app.state.model = _load_model()
+        timings["model"] = time.perf_counter() - started
+        print(f"Model loaded successfully ({app.state.model.inference_mode} inference)")
+
+        app.state.response_cache = ResponseCache(CACHE_SIZE, CACHE_TTL)
+        app.state.backend = None
+        app.state.cube = None
+        app.state.sample = None
+        app.state.risk = None
+        app.state.table = None
+        if ANALYTICS_BACKEND == "chunked":
+            started = time.perf_counter()
+            app.state.backend = ChunkedBackend(DATA_PATH, ANALYTICS_CHUNKSIZE)
+            app.state.data = app.state.filter_index = None
+            timings["category scan"] = time.perf_counter() - started
+            print(
+                f"Chunked analytics backend over {DATA_PATH} "
+                f"({app.state.backend.rows} rows, {ANALYTICS_CHUNKSIZE} per chunk)"
+            )
+        elif ANALYTICS_BACKEND == "memory":
+            _load_in_memory(timings)
+        else:
+            raise ValueError(
+                f"ANALYTICS_BACKEND must be 'memory' or 'chunked', "
+                f"got {ANALYTICS_BACKEND!r}"
+            )
+
+        if (
+            EXECUTOR_KIND == "process"
+            and not SNAPSHOT_DIR
+            and app.state.backend is None
+        ):
+            raise ValueError("EXECUTOR=process needs SNAPSHOT_DIR for worker data")
+        _publish_state()
+        app.state.executor = executor.HeavyExecutor(
+            EXECUTOR_KIND,
+            max_workers=EXECUTOR_WORKERS,
+            max_concurrent=MAX_CONCURRENT_HEAVY,
+            max_queue=EXECUTOR_QUEUE,
+            process_init_args=(
+                DATA_PATH,
+                SNAPSHOT_DIR,
+                (MODEL_PATH, BIN_PATH, INFERENCE_MODE, "r"),
+                (
+                    (DATA_PATH, ANALYTICS_CHUNKSIZE)
+                    if isinstance(app.state.backend, ChunkedBackend)
+                    else None
+                ),
+                APPROX_SAMPLE_ROWS if app.state.sample is not None else 0,
+            ),
+        )
+        print(f"Heavy request executor ready: {app.state.executor.stats()}")
+
+        app.state.coalescer = None
+        if PREDICT_BATCH_WINDOW_MS > 0:
+            app.state.coalescer = PredictionCoalescer(
+                lambda inputs: _run_heavy(
+                    executor.predict_batch_task, inputs, "/predict"
+                ),
+                window_seconds=PREDICT_BATCH_WINDOW_MS / 1000,
+                max_batch=PREDICT_MAX_BATCH,
+            )
+            REGISTRY.attach(
+                "predict_batch_size",
+                "Requests per coalesced /predict batch",
+                app.state.coalescer.batch_size,
+            )
+            REGISTRY.attach(
+                "predict_queue_wait_seconds",
+                "Time a /predict request waited for its batch to be dispatched",
+                app.state.coalescer.queue_wait,
+            )
+        print(
+            "Startup timings: "
+            + ", ".join(f"{stage} {seconds:.3f}s" for stage, seconds in timings.items())
+        )
     except Exception as e:
         print(f"Error loading model or dataframe: {e}")
         raise
 
 
+def _load_in_memory(timings: dict):
+    """Load the table, its filter index and (if small enough) the cube"""
+    started = time.perf_counter()
+    app.state.data, data_source = load_dataset(
+        DATA_PATH, SNAPSHOT_DIR, shared=SHARED_DATA
+    )
+    timings[f"data ({data_source})"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    if SHARED_DATA:
+        app.state.filter_index = FilterIndex.shared(
+            app.state.data, os.path.join(SNAPSHOT_DIR, "filter_index")
+        )
+    else:
+        app.state.filter_index = FilterIndex(app.state.data)
+    app.state.data_version = app.state.data.fingerprint()
+    timings["filter index"] = time.perf_counter() - started
+    print(
+        f"Dataset and filter index loaded successfully "
+        f"({len(app.state.data)} rows, {app.state.data_version})"
+    )
+
+    if APPROX_SAMPLE_ROWS:
+        started = time.perf_counter()
+        app.state.sample = StratifiedSample(app.state.data, APPROX_SAMPLE_ROWS)
+        timings["stratified sample"] = time.perf_counter() - started
+        print(
+            f"Stratified sample of {len(app.state.sample)} rows "
+            f"over {app.state.sample.n_strata} strata"
+        )
+
+    if RISK_INDEX:
+        started = time.perf_counter()
+        app.state.risk = RiskIndexer(
+            _build_risk_index, _risk_version, RISK_INDEX_POLL_SECONDS, _serve_model
+        )
+        timings["risk index"] = time.perf_counter() - started
+
+    shards = ANALYTICS_SHARDS or os.cpu_count() or 1
+    if len(app.state.data) >= SHARD_MIN_ROWS and shards > 1:
+        if not SNAPSHOT_DIR or EXECUTOR_KIND != "thread":
+            print("Sharded aggregation needs SNAPSHOT_DIR and EXECUTOR=thread, skipped")
+        else:
+            app.state.backend = ShardedBackend(app.state.data, SNAPSHOT_DIR, shards)
+            print(f"Sharded aggregation over {shards} processes")
+
+    combinations = AnalyticsCube.size(app.state.data)
+    if not ANALYTICS_CUBE:
+        print("Analytics cube disabled, computing on demand")
+    elif combinations > CUBE_MAX_COMBINATIONS:
+        print(
+            f"Analytics cube would hold {combinations} combinations "
+            f"(> {CUBE_MAX_COMBINATIONS}), computing on demand"
+        )
+    else:
+        cube = AnalyticsCube(app.state.data, app.state.filter_index)
+        app.state.cube = cube
+        timings["cube"] = cube.build_seconds
+        print(
+            f"Analytics cube built: {len(cube.entries)} combinations in "
+            f"{cube.build_seconds:.2f}s, ~{cube.size_bytes / 1024:.0f} KB serialized"
+        )
+
+    # Appends need the table in this process only
+    if (
+        DATA_APPEND
+        and EXECUTOR_KIND == "thread"
+        and not SHARED_DATA
+        and app.state.backend is None
+    ):
+        app.state.table = IncrementalTable(app.state.data, app.state.cube)
+        app.state.sample_version = app.state.data_version
+
+
+def _publish_state():
+    """Point the executor's tasks at the current model and data"""
+    executor.set_state(
+        app.state.model,
+        app.state.data,
+        app.state.filter_index,
+        app.state.backend,
+        app.state.sample,
+    )
+
+
+def _model_files_version() -> str:
+    try:
+        stats = [os.stat(path) for path in (MODEL_PATH, BIN_PATH)]
+    except OSError as e:
+        return f"unavailable ({e.strerror})"
+    return ",".join(f"{stat.st_size}:{stat.st_mtime_ns}" for stat in stats)
+
+
+def _load_model() -> CalibratedModel:
+    return CalibratedModel(
+        MODEL_PATH, BIN_PATH, INFERENCE_MODE, mmap_mode="r" if SHARED_DATA else None
+    )
+
+
+def _risk_model_version() -> str:
+    # Process workers load the model once, so the index follows the serving
+    # model there; in thread mode new model files are picked up and served
+    if EXECUTOR_KIND == "thread":
+        return _model_files_version()
+    return app.state.model_files_version
+
+
+def _risk_version() -> str:
+    """Changes whenever the data or the model to score with do"""
+    key = f"{_risk_model_version()} {app.state.data_version}"
+    return hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+
+
+def _build_risk_index(version: str) -> RiskIndex:
+    """Score every loaded row with the serving model, or with the model
+    files' new contents if they changed since it was loaded"""
+    # One read: an append may replace the data and filter index in between
+    filter_index = app.state.filter_index
+    dataset = filter_index.dataset
+    model, model_version = app.state.model, _risk_model_version()
+    if model_version != app.state.model_files_version:
+        model = _load_model()
+    with scoring_route("risk_index"):
+        probabilities = score_dataset(model, dataset)
+    return RiskIndex(
+        dataset,
+        filter_index,
+        probabilities,
+        version,
+        max_selection_bytes=int(RISK_SELECTION_CACHE_MB * 2**20),
+        model=model,
+        model_version=model_version,
+    )
+
+
+def _serve_model(index: RiskIndex):
+    """Serve the model a rebuilt risk index was scored with, so /predict and
+    /customers/top-risk agree"""
+    if index.model_version == app.state.model_files_version:
+        return
+    with _append_lock:
+        app.state.model = index.model
+        app.state.model_files_version = index.model_version
+        _publish_state()
+    print(f"Model reloaded from {MODEL_PATH} ({index.model_version})")
+
+
+@app.on_event("shutdown")
+async def shutdown_executor():
+    if hasattr(app.state, "executor"):
+        app.state.executor.shutdown()
+    if isinstance(getattr(app.state, "backend", None), ShardedBackend):
+        app.state.backend.shutdown()
+    if getattr(app.state, "risk", None) is not None:
+        app.state.risk.stop()
+
+
+async def _run_heavy(fn, *args):
+    """Run ``fn`` on the heavy executor, 503 when it is saturated"""
+    try:
+        return await app.state.executor.run(fn, *args)
+    except executor.Overloaded as e:
+        raise HTTPException(
+            status_code=503, detail=str(e), headers={"Retry-After": "1"}
+        )
+
+
+async def _cached_response(
+    request: Request, route: str, params: dict, compute, lookup_seconds=None
+) -> Response:
+    """Serve ``await compute()`` through the response cache with ETag
+    revalidation, encoded in the format the Accept header asks for;
+    ``lookup_seconds`` times the requests answered without computing"""
+    started = time.perf_counter()
+    media_type = serialization.negotiate(request.headers.get("accept", ""))
+    key = (
+        route,
+        tuple(sorted((name, value) for name, value in params.items() if value)),
+        _data_version(),
+        media_type,
+    )
+    cache = app.state.response_cache
+    etag = cache.etag(key)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": (
+            f"private, max-age={CACHE_MAX_AGE}" if CACHE_MAX_AGE else "no-cache"
+        ),
+        "Vary": "Accept",
+    }
+    if etag in request.headers.get("if-none-match", ""):
+        cache.record_not_modified()
+        if lookup_seconds is not None:
+            lookup_seconds.observe(time.perf_counter() - started)
+        return Response(status_code=304, headers=headers)
+
+    body = cache.get(key)
+    if body is not None and lookup_seconds is not None:
+        lookup_seconds.observe(time.perf_counter() - started)
+    if body is None:
+        payload = await compute()
+        started = time.perf_counter()
+        body = serialization.encode(payload, media_type)
+        RESPONSE_ENCODE_SECONDS.labels(media_type).observe(
+            time.perf_counter() - started
+        )
+        cache.put(key, body)
+    return Response(body, media_type=media_type, headers=headers)
+
+
+def _data_version() -> str:
+    if app.state.backend is not None:
+        # The source may change under a running server
+        return app.state.backend.version()
+    return app.state.data_version
+
+
+def _labels(column: str) -> list:
+    source = app.state.data if app.state.backend is None else app.state.backend
+    return source.labels(column)
+
+
+def _cube_entry(time_period, segment, service, contract, where=None):
+    cube = app.state.cube
+    if cube is None or where:
+        return None
+    return cube.get(time_period, segment, service, contract)
+
+
 @app.get("/")
 async def root():
     return {"message": "Model & Analytics API Running"}
@@ -87,218 +477,464 @@ async def health_check():
     }
 
 
-@app.post("/predict", response_model=PredictionOutput)
-async def predict(input_data: PredictionInput):
+@app.get("/cache/stats")
+async def cache_stats():
+    stats = app.state.response_cache.stats()
+    stats["filter_plans"] = plan_cache_stats()
+    if app.state.filter_index is not None:
+        stats["filter_masks"] = app.state.filter_index.expression_masks.stats()
+    return stats
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(
+        REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@app.get("/executor/stats")
+async def executor_stats():
+    return app.state.executor.stats()
+
+
+@app.get("/predict/batching/stats")
+async def predict_batching_stats():
+    if app.state.coalescer is None:
+        return {"enabled": False}
+    return {"enabled": True, **app.state.coalescer.stats()}
+
+
+def _validate_prediction_input(body: bytes) -> PredictionInput:
     try:
-        result = app.state.model.predict(input_data)
-        return result
+        return PredictionInput.model_validate_json(body)
+    except ValidationError as e:
+        raise RequestValidationError(
+            [
+                {**error, "loc": ("body", *error["loc"])}
+                for error in e.errors(include_url=False)
+            ]
+        )
+
+
+# /predict parses its own body so validation can be timed; this keeps the
+# request schema in the OpenAPI docs
+PREDICT_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {"schema": PredictionInput.model_json_schema()}
+        },
+    }
+}
+
+
+@app.post("/predict", response_model=PredictionOutput, openapi_extra=PREDICT_OPENAPI)
+async def predict(request: Request):
+    started = time.perf_counter()
+    input_data = _validate_prediction_input(await request.body())
+    VALIDATION_SECONDS.observe(time.perf_counter() - started)
+    try:
+        if app.state.coalescer is not None:
+            result = await app.state.coalescer.predict(input_data)
+        else:
+            result = await _run_heavy(executor.predict_task, input_data)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    # Returning a Response skips a second validation against response_model
+    started = time.perf_counter()
+    body = result.model_dump_json()
+    SERIALIZATION_SECONDS.observe(time.perf_counter() - started)
+    return Response(body, media_type="application/json")
+
+
+@app.post("/predict/batch", response_model=List[PredictionOutput])
+async def predict_batch(inputs: List[PredictionInput]):
+    if len(inputs) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch of {len(inputs)} exceeds MAX_BATCH_SIZE={MAX_BATCH_SIZE}",
+        )
+    try:
+        outputs = await _run_heavy(executor.predict_batch_task, inputs)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    # Serialized once by pydantic-core, without re-validating response_model
+    return Response(
+        PREDICTION_OUTPUTS.dump_json(outputs), media_type="application/json"
+    )
+
+
+def _missing_columns(file, *required) -> list:
+    """missing_columns of an upload, 400 if it is empty or not a CSV"""
+    try:
+        return missing_columns(file, *required)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.post("/predict/file")
+async def predict_file(
+    file: UploadFile = File(...),
+    format: str = "csv",
+    chunksize: int = DEFAULT_CHUNKSIZE,
+):
+    if format not in OUTPUT_FORMATS:
+        raise HTTPException(
+            status_code=400, detail=f"format must be one of {list(OUTPUT_FORMATS)}"
+        )
+    if chunksize <= 0:
+        raise HTTPException(status_code=400, detail="chunksize must be positive")
+    missing = _missing_columns(file.file)
+    if missing:
+        raise HTTPException(
+            status_code=422, detail=f"Missing columns: {', '.join(missing)}"
+        )
+    # Blocks of lines are read off the event loop and each is parsed and
+    # scored on the heavy executor; the first one before responding, so an
+    # overloaded executor is still a 503
+    started = time.perf_counter()
+    header = await run_in_threadpool(file.file.readline)
+    block = await run_in_threadpool(read_lines, file.file, chunksize)
+    first = await _run_heavy(executor.score_block_task, header, block, format)
+
+    async def blocks():
+        body, rows, invalid = first
+        yield encode_header(format) + body
+        while True:
+            block = await run_in_threadpool(read_lines, file.file, chunksize)
+            if not block:
+                break
+            body, block_rows, block_invalid = await app.state.executor.run(
+                executor.score_block_task, header, block, format, admitted=True
+            )
+            rows, invalid = rows + block_rows, invalid + block_invalid
+            yield body
+        yield encode_summary(rows, invalid, time.perf_counter() - started, format)
+
+    return StreamingResponse(blocks(), media_type=OUTPUT_FORMATS[format])
 
 
 @app.get("/filters")
-async def get_filters():
-    data = app.state.data.copy()
+async def get_filters(request: Request):
+    return await _cached_response(request, "filters", {}, _filters)
+
+
+async def _filters():
     return {
-        "time_periods": ["Last 30 days", "Last 90 days", "Last 6 months", "Last year"],
-        "segments": [
-            "All Segments",
-            "New Customers",
-            "Long-term Customers",
-            "High-value Customers",
-        ],
-        "services": ["All Services"]
-        + sorted(data["InternetService"].dropna().unique().tolist()),
-        "contracts": ["All Contracts"]
-        + sorted(data["Contract"].dropna().unique().tolist()),
+        "time_periods": list(TIME_PERIODS),
+        "segments": SEGMENTS,
+        "services": [ALL_SERVICES] + sorted(_labels("InternetService")),
+        "contracts": [ALL_CONTRACTS] + sorted(_labels("Contract")),
     }
 
 
+def _where(where: Optional[str]) -> Optional[str]:
+    """Canonical text of a where expression, 400 if it is invalid"""
+    if not where or not where.strip():
+        return None
+    try:
+        plan = compile_filter(where)
+        plan.validate(_labels)
+    except FilterExpressionError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid where: {e}")
+    return plan.text
+
+
+def _max_error(
+    approximate: bool, max_error: Optional[float], progressive: bool
+) -> Optional[float]:
+    """Target churn rate error of an approximate request, None if exact"""
+    if not (approximate or progressive or max_error is not None):
+        return None
+    if app.state.sample is None:
+        raise HTTPException(
+            status_code=400,
+            detail="Approximate mode needs ANALYTICS_BACKEND=memory "
+            "and APPROX_SAMPLE_ROWS > 0",
+        )
+    if max_error is not None and max_error <= 0:
+        raise HTTPException(status_code=400, detail="max_error must be positive")
+    return max_error or APPROX_MAX_ERROR
+
+
+def _progressive_response(params: dict, max_error: float, estimate, exact):
+    """Stream NDJSON estimates over growing sample prefixes, then the exact
+    answer unless the sample already holds every row"""
+
+    async def lines():
+        steps = await _run_heavy(executor.refinement_steps_task, params, max_error)
+        for rows in steps:
+            yield serialization.to_json(await estimate(rows)) + b"\n"
+        if len(app.state.sample) < len(app.state.data):
+            yield serialization.to_json(await exact()) + b"\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
 @app.get("/stats")
 async def get_stats(
+    request: Request,
     time_period: Optional[str] = None,
     segment: Optional[str] = None,
     service: Optional[str] = None,
     contract: Optional[str] = None,
+    where: Optional[str] = None,
+    approximate: bool = False,
+    max_error: Optional[float] = None,
+    progressive: bool = False,
 ):
-    data = apply_filters(app.state.data, time_period, segment, service, contract)
-    total_customers = len(data)
-    churn_rate = round((data["Churn"] == "Yes").mean() * 100, 2)
-    avg_monthly = round(data["MonthlyCharges"].mean(), 2)
-    avg_tenure = round(data["tenure"].mean(), 1)
-    return {
-        "total_customers": total_customers,
-        "churn_rate": churn_rate,
-        "avg_monthly": avg_monthly,
-        "avg_tenure": avg_tenure,
-    }
+    """Filtered summary statistics.
+
+    ``where`` is a filter expression ANDed with the presets, e.g.
+    ``PaymentMethod = 'Electronic check' and tenure between 12 and 24`` (see
+    expressions.py); an invalid one is a 400.
+
+    approximate=true answers from the stratified sample with 95% intervals,
+    reading as much of it as ``max_error`` (percentage points of churn
+    rate) needs; progressive=true streams ever finer estimates as NDJSON,
+    ending with the exact answer.
+    """
+    params = dict(
+        time_period=time_period,
+        segment=segment,
+        service=service,
+        contract=contract,
+        where=_where(where),
+    )
+    error = _max_error(approximate, max_error, progressive)
+    if error is None:
+        return await _cached_response(request, "stats", params, lambda: _stats(params))
+    if progressive:
+        return _progressive_response(
+            params,
+            error,
+            lambda rows: _run_heavy(executor.approx_stats_task, params, error, rows),
+            lambda: _stats(params),
+        )
+    return await _cached_response(
+        request,
+        "stats",
+        {**params, "max_error": error},
+        lambda: _run_heavy(executor.approx_stats_task, params, error),
+    )
+
+
+async def _stats(params):
+    entry = _cube_entry(**params)
+    if entry is not None:
+        return entry["stats"]
+    return await _run_heavy(executor.stats_task, params)
 
 
 @app.get("/chart/{chart_name}")
 async def get_chart_data(
+    request: Request,
     chart_name: str,
     time_period: Optional[str] = None,
     segment: Optional[str] = None,
     service: Optional[str] = None,
     contract: Optional[str] = None,
+    where: Optional[str] = None,
+    approximate: bool = False,
+    max_error: Optional[float] = None,
+    progressive: bool = False,
 ):
-    data = apply_filters(app.state.data, time_period, segment, service, contract)
-    if chart_name == "churnRate":
-        churn_counts = data["Churn"].value_counts()
-        return {
-            "labels": churn_counts.index.tolist(),
-            "values": churn_counts.values.tolist(),
-        }
-    elif chart_name == "tenureChurn":
-        # Calculate churn rate for each tenure month (1-72)
-        churn_rates = []
-        for tenure in range(1, 73):
-            group = data[data["tenure"] == tenure]
-            if len(group) == 0:
-                churn_rates.append(0)
-            else:
-                churn_rates.append(round((group["Churn"] == "Yes").mean() * 100, 2))
-        return {
-            "labels": list(range(1, 73)),
-            "values": churn_rates,
-        }
-    elif chart_name == "genderChurn":
-        grouped = data.groupby("gender")["Churn"].value_counts().unstack().fillna(0)
-        return {
-            "labels": grouped.index.tolist(),
-            "churned": grouped.get("Yes", pd.Series([0] * len(grouped))).tolist(),
-            "not_churned": grouped.get("No", pd.Series([0] * len(grouped))).tolist(),
-        }
-    elif chart_name == "seniorChurn":
-        grouped = (
-            data.groupby("SeniorCitizen")["Churn"].value_counts().unstack().fillna(0)
+    """One chart's data; where, approximate, max_error and progressive work
+    as for /stats, with an interval for every approximate value"""
+    params = dict(
+        time_period=time_period,
+        segment=segment,
+        service=service,
+        contract=contract,
+        where=_where(where),
+    )
+    error = _max_error(approximate, max_error, progressive)
+    if error is None:
+        return await _cached_response(
+            request,
+            f"chart/{chart_name}",
+            params,
+            lambda: _chart(chart_name, params),
+            _chart_lookup_seconds(chart_name),
         )
-        labels = ["Not Senior", "Senior"]
-        return {
-            "labels": labels,
-            "churned": grouped.get("Yes", pd.Series([0] * len(grouped))).tolist(),
-            "not_churned": grouped.get("No", pd.Series([0] * len(grouped))).tolist(),
-        }
-    elif chart_name == "partnerChurn":
-        grouped = data.groupby("Partner")["Churn"].value_counts().unstack().fillna(0)
-        labels = grouped.index.tolist()
-        churned = grouped["Yes"].tolist() if "Yes" in grouped else [0] * len(labels)
-        not_churned = grouped["No"].tolist() if "No" in grouped else [0] * len(labels)
-        return {
-            "labels": labels,
-            "churned": churned,
-            "not_churned": not_churned,
-        }
-    elif chart_name == "dependentsChurn":
-        grouped = data.groupby("Dependents")["Churn"].value_counts().unstack().fillna(0)
-        labels = grouped.index.tolist()
-        churned = grouped["Yes"].tolist() if "Yes" in grouped else [0] * len(labels)
-        not_churned = grouped["No"].tolist() if "No" in grouped else [0] * len(labels)
-        return {
-            "labels": labels,
-            "churned": churned,
-            "not_churned": not_churned,
-        }
-    elif chart_name == "internetChurn":
-        grouped = (
-            data.groupby("InternetService")["Churn"].value_counts().unstack().fillna(0)
+    if progressive:
+        return _progressive_response(
+            params,
+            error,
+            lambda rows: _run_heavy(
+                executor.approx_chart_task, chart_name, params, error, rows
+            ),
+            lambda: _chart(chart_name, params),
         )
-        labels = grouped.index.tolist()
-        churned = grouped["Yes"].tolist() if "Yes" in grouped else [0] * len(labels)
-        not_churned = grouped["No"].tolist() if "No" in grouped else [0] * len(labels)
-        return {
-            "labels": labels,
-            "churned": churned,
-            "not_churned": not_churned,
-        }
-    elif chart_name == "contractChurn":
-        grouped = data.groupby("Contract")["Churn"].value_counts().unstack().fillna(0)
-        labels = grouped.index.tolist()
-        churned = grouped["Yes"].tolist() if "Yes" in grouped else [0] * len(labels)
-        not_churned = grouped["No"].tolist() if "No" in grouped else [0] * len(labels)
-        return {
-            "labels": labels,
-            "churned": churned,
-            "not_churned": not_churned,
-        }
-    elif chart_name == "paymentChurn":
-        grouped = (
-            data.groupby("PaymentMethod")["Churn"].value_counts().unstack().fillna(0)
+    return await _cached_response(
+        request,
+        f"chart/{chart_name}",
+        {**params, "max_error": error},
+        lambda: _run_heavy(executor.approx_chart_task, chart_name, params, error),
+    )
+
+
+def _chart_lookup_seconds(chart_name):
+    # Unknown chart names would add a series per request
+    if chart_name in CHARTS:
+        return CHART_PHASE_SECONDS.labels(chart_name, "lookup")
+
+
+async def _chart(chart_name, params):
+    started = time.perf_counter()
+    entry = _cube_entry(**params)
+    if entry is not None:
+        chart = entry["charts"].get(chart_name, {})
+        lookup_seconds = _chart_lookup_seconds(chart_name)
+        if lookup_seconds is not None:
+            lookup_seconds.observe(time.perf_counter() - started)
+        return chart
+    return await _run_heavy(executor.chart_task, chart_name, params)
+
+
+@app.get("/dashboard")
+async def get_dashboard(
+    request: Request,
+    time_period: Optional[str] = None,
+    segment: Optional[str] = None,
+    service: Optional[str] = None,
+    contract: Optional[str] = None,
+    where: Optional[str] = None,
+):
+    """Stats and every chart in one response, filtered once"""
+    params = dict(
+        time_period=time_period,
+        segment=segment,
+        service=service,
+        contract=contract,
+        where=_where(where),
+    )
+    return await _cached_response(
+        request, "dashboard", params, lambda: _dashboard(params)
+    )
+
+
+async def _dashboard(params):
+    entry = _cube_entry(**params)
+    if entry is not None:
+        return entry
+    return await _run_heavy(executor.dashboard_task, params)
+
+
+@app.get("/customers/top-risk")
+async def top_risk(
+    k: int = 100,
+    time_period: Optional[str] = None,
+    segment: Optional[str] = None,
+    service: Optional[str] = None,
+    contract: Optional[str] = None,
+    where: Optional[str] = None,
+    min_probability: float = 0.0,
+):
+    """The ``k`` customers most likely to churn among those the filters
+    select, at least ``min_probability`` likely, from the risk index"""
+    if app.state.risk is None:
+        raise HTTPException(
+            status_code=400,
+            detail="The risk index needs ANALYTICS_BACKEND=memory and RISK_INDEX=1",
         )
-        labels = grouped.index.tolist()
-        churned = grouped["Yes"].tolist() if "Yes" in grouped else [0] * len(labels)
-        not_churned = grouped["No"].tolist() if "No" in grouped else [0] * len(labels)
-        return {
-            "labels": labels,
-            "churned": churned,
-            "not_churned": not_churned,
-        }
-    elif chart_name == "phoneChurn":
-        grouped = (
-            data.groupby("PhoneService")["Churn"].value_counts().unstack().fillna(0)
+    if not 1 <= k <= RISK_MAX_K:
+        raise HTTPException(
+            status_code=400, detail=f"k must be between 1 and {RISK_MAX_K}"
         )
-        labels = grouped.index.tolist()
-        churned = grouped["Yes"].tolist() if "Yes" in grouped else [0] * len(labels)
-        not_churned = grouped["No"].tolist() if "No" in grouped else [0] * len(labels)
-        return {
-            "labels": labels,
-            "churned": churned,
-            "not_churned": not_churned,
-        }
-    elif chart_name == "monthlyChargesDist":
-        bins = [20, 30, 40, 50, 60, 70, 80, 90, 100, 110, 120]
-        labels = [f"{bins[i]}-{bins[i+1]}" for i in range(len(bins) - 1)]
-        churned = []
-        not_churned = []
-        for i in range(len(bins) - 1):
-            group = data[
-                (data["MonthlyCharges"] >= bins[i])
-                & (data["MonthlyCharges"] < bins[i + 1])
-            ]
-            churned.append(len(group[group["Churn"] == "Yes"]))
-            not_churned.append(len(group[group["Churn"] == "No"]))
-        return {
-            "labels": labels,
-            "churned": churned,
-            "not_churned": not_churned,
-        }
-    elif chart_name == "totalChargesDist":
-        bins = [0, 1000, 2000, 3000, 4000, 5000, 6000, 7000, 8000, 999999]
-        labels = [
-            f"{bins[i]}-{bins[i+1]}" if bins[i + 1] != 999999 else "8000+"
-            for i in range(len(bins) - 1)
-        ]
-        churned = []
-        not_churned = []
-        for i in range(len(bins) - 1):
-            group = data[
-                (data["TotalCharges"] >= bins[i]) & (data["TotalCharges"] < bins[i + 1])
-            ]
-            churned.append(len(group[group["Churn"] == "Yes"]))
-            not_churned.append(len(group[group["Churn"] == "No"]))
-        return {
-            "labels": labels,
-            "churned": churned,
-            "not_churned": not_churned,
-        }
-    elif chart_name == "monthlyGroupsChurn":
-        bins = [20, 30, 40, 50, 60, 70, 80, 90, 100, 110, 120]
-        labels = [f"{bins[i]}-{bins[i+1]}" for i in range(len(bins) - 1)]
-        churn_rates = []
-        for i in range(len(bins) - 1):
-            group = data[
-                (data["MonthlyCharges"] >= bins[i])
-                & (data["MonthlyCharges"] < bins[i + 1])
-            ]
-            if len(group) == 0:
-                churn_rates.append(0)
-            else:
-                churn_rates.append(round((group["Churn"] == "Yes").mean() * 100, 2))
-        return {
-            "labels": labels,
-            "values": churn_rates,
-        }
-    return {}
+    if not 0 <= min_probability <= 1:
+        raise HTTPException(
+            status_code=400, detail="min_probability must be between 0 and 1"
+        )
+    params = dict(
+        time_period=time_period,
+        segment=segment,
+        service=service,
+        contract=contract,
+        where=_where(where),
+    )
+    payload = await run_in_threadpool(
+        app.state.risk.index.top, params, k, min_probability
+    )
+    payload["index"]["rebuilding"] = app.state.risk.building is not None
+    return Response(serialization.to_json(payload), media_type="application/json")
+
+
+@app.post("/data/append")
+async def append_data(file: UploadFile = File(...)):
+    """Add customers from a CSV in the data.csv schema; a row whose
+    customerID is already loaded replaces that customer's row. Rows with a
+    missing or malformed value are dropped and counted in ``dropped``."""
+    if app.state.table is None:
+        raise HTTPException(
+            status_code=400,
+            detail="Appending needs ANALYTICS_BACKEND=memory, EXECUTOR=thread, "
+            "SHARED_DATA=0 and no sharded aggregation",
+        )
+    missing = _missing_columns(
+        file.file, [ID_COLUMN, *NUMERIC_COLUMNS, *CATEGORICAL_COLUMNS]
+    )
+    if missing:
+        raise HTTPException(
+            status_code=422, detail=f"Missing columns: {', '.join(missing)}"
+        )
+    # Parsed and applied off the event loop; queries keep being served
+    return await run_in_threadpool(_append, file.file)
+
+
+_append_lock = threading.Lock()
+_sample_lock = threading.Lock()
+
+
+def _append(source) -> dict:
+    try:
+        frame, dropped = read_delta(source, app.state.data.categories)
+    except (pd.errors.ParserError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=f"Not a valid CSV file: {e}")
+    # Refreshes are published in the order they were applied
+    with _append_lock:
+        dataset, filter_index, summary = app.state.table.append(
+            frame, app.state.filter_index
+        )
+        summary["dropped"] = dropped
+        if summary["inserted"] + summary["replaced"] == 0:
+            # Cached responses, the sample and the risk index stay valid
+            return summary
+        app.state.data, app.state.filter_index = dataset, filter_index
+        app.state.data_version = dataset.fingerprint()
+        _publish_state()
+    print(
+        f"Appended {summary['inserted']} and replaced {summary['replaced']} rows "
+        f"({dropped} dropped) in {summary['seconds']:.3f}s"
+    )
+
+    # O(table) derived state is rebuilt off the request path
+    if app.state.risk is not None:
+        app.state.risk.refresh()
+    if app.state.sample is not None:
+        threading.Thread(target=_rebuild_sample, daemon=True).start()
+    return summary
+
+
+def _rebuild_sample():
+    # Rebuilds queue up; each one samples the latest data, or does nothing
+    # if an earlier one already did
+    with _sample_lock:
+        filter_index = app.state.filter_index
+        version = filter_index.dataset.fingerprint()
+        if version == app.state.sample_version:
+            return
+        app.state.sample = StratifiedSample(
+            filter_index.dataset, APPROX_SAMPLE_ROWS, live=filter_index.live
+        )
+        app.state.sample_version = version
+        _publish_state()
 
 
 # Add similar endpoints for other charts as needed
@@ -0,0 +1,230 @@
+"""Score customer extracts in the data.csv schema without loading them whole.
+
+The CSV is read in chunks and each chunk goes through the vectorized
+CalibratedModel transform, so peak memory depends on the chunk size and not
+on the file size. POST /predict/file sends blocks of lines through the
+heavy executor (score_block); the command line streams a file
+(stream_scores):
+
+    python batch_score.py customers.csv -o scores.csv --format ndjson
+"""
+
+import argparse
+import io
+import itertools
+import json
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+from typing import IO, Iterator, Tuple, Union
+from model import CalibratedModel, PAYMENT_METHOD_LABELS
+
+DEFAULT_CHUNKSIZE = int(os.getenv("SCORING_CHUNKSIZE", "50000"))
+OUTPUT_FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+SCORING_COLUMNS = [
+    "Contract",
+    "InternetService",
+    "MonthlyCharges",
+    "tenure",
+    "PaymentMethod",
+]
+OUTPUT_COLUMNS = [
+    "customerID",
+    "probability",
+    "prediction",
+    "prediction_label",
+    "error",
+]
+
+PAYMENT_METHOD_CODE = {label: code for code, label in enumerate(PAYMENT_METHOD_LABELS)}
+
+
+def missing_columns(header: IO, required=SCORING_COLUMNS) -> list:
+    """``required`` columns (by default the scoring columns) absent from a
+    CSV header, read without consuming the file; ValueError if the file is
+    empty or not a CSV"""
+    position = header.tell()
+    try:
+        columns = pd.read_csv(header, nrows=0).columns
+    except (pd.errors.EmptyDataError, pd.errors.ParserError, UnicodeDecodeError):
+        raise ValueError("Not a CSV file with a header row")
+    finally:
+        header.seek(position)
+    return [column for column in required if column not in columns]
+
+
+def _payment_method_codes(column: pd.Series) -> np.ndarray:
+    # Extracts carry the label ("Electronic check"), the API takes the code;
+    # unknown labels become -1 and are scored by the live model
+    if pd.api.types.is_numeric_dtype(column):
+        return column.to_numpy(dtype=int)
+    return column.map(PAYMENT_METHOD_CODE).fillna(-1).to_numpy(dtype=int)
+
+
+def _invalid_columns(chunk: pd.DataFrame) -> pd.DataFrame:
+    """Per scoring column, the rows whose value is blank or not a number
+    where one is expected"""
+    invalid = {}
+    for column in SCORING_COLUMNS:
+        values = chunk[column]
+        if column in ("MonthlyCharges", "tenure") or (
+            column == "PaymentMethod" and pd.api.types.is_numeric_dtype(values)
+        ):
+            values = pd.to_numeric(values, errors="coerce")
+            invalid[column] = ~np.isfinite(values.to_numpy(dtype=float))
+        else:
+            invalid[column] = (
+                values.isna() | (values.astype(str).str.strip() == "")
+            ).to_numpy()
+    return pd.DataFrame(invalid, index=chunk.index)
+
+
+def score_chunk(model: CalibratedModel, chunk: pd.DataFrame) -> pd.DataFrame:
+    """Scores of a chunk; rows with an invalid scoring column are not
+    scored, they get an empty probability and the columns in ``error``"""
+    invalid = _invalid_columns(chunk)
+    valid = ~invalid.any(axis=1).to_numpy()
+    scored = chunk[valid]
+    probabilities = np.full(len(chunk), np.nan)
+    if len(scored):
+        probabilities[valid] = model.predict_proba_columns(
+            scored["Contract"].to_numpy(dtype=str),
+            scored["InternetService"].to_numpy(dtype=str),
+            pd.to_numeric(scored["MonthlyCharges"]).to_numpy(dtype=float),
+            pd.to_numeric(scored["tenure"]).to_numpy(dtype=float),
+            _payment_method_codes(scored["PaymentMethod"]),
+        )
+    churn = probabilities >= 0.5
+    prediction = pd.array(churn, dtype="Int64")
+    prediction[~valid] = pd.NA
+    label = np.where(churn, "Churn", "No Churn").astype(object)
+    label[~valid] = None
+    # e.g. "invalid MonthlyCharges, PaymentMethod"
+    error = pd.Series("", index=chunk.index)
+    for column in SCORING_COLUMNS:
+        error[invalid[column]] += f", {column}"
+    error = ("invalid " + error.str[2:]).where(~valid, None)
+    return pd.DataFrame(
+        {
+            "customerID": chunk["customerID"] if "customerID" in chunk else chunk.index,
+            "probability": probabilities,
+            "prediction": prediction,
+            "prediction_label": label,
+            "error": error,
+        }
+    )
+
+
+def _columns(column: str) -> bool:
+    return column in SCORING_COLUMNS or column == "customerID"
+
+
+def encode_header(output_format: str) -> bytes:
+    return (",".join(OUTPUT_COLUMNS) + "\n").encode() if output_format == "csv" else b""
+
+
+def encode_scores(scored: pd.DataFrame, output_format: str) -> bytes:
+    if output_format == "csv":
+        return scored.to_csv(header=False, index=False).encode()
+    return scored.to_json(orient="records", lines=True).encode()
+
+
+def encode_summary(
+    rows: int, invalid: int, seconds: float, output_format: str
+) -> bytes:
+    """For CSV a trailing "# rows=..." comment line, for NDJSON a final
+    {"summary": {...}} object"""
+    summary = {
+        "rows": rows,
+        "invalid": invalid,
+        "seconds": round(seconds, 3),
+        "rows_per_sec": round(rows / seconds, 1) if seconds > 0 else None,
+    }
+    if output_format == "csv":
+        return ("# " + " ".join(f"{k}={v}" for k, v in summary.items()) + "\n").encode()
+    return (json.dumps({"summary": summary}) + "\n").encode()
+
+
+def read_lines(source: IO[bytes], lines: int) -> bytes:
+    """The next ``lines`` lines of ``source``, b"" at the end"""
+    return b"".join(itertools.islice(source, lines))
+
+
+def score_block(
+    model: CalibratedModel, header: bytes, block: bytes, output_format: str = "csv"
+) -> Tuple[bytes, int, int]:
+    """Encoded scores of the CSV lines ``block`` under the ``header`` line,
+    with the number of rows and of invalid rows"""
+    chunk = pd.read_csv(io.BytesIO(header + block), usecols=_columns)
+    scored = score_chunk(model, chunk)
+    return (
+        encode_scores(scored, output_format),
+        len(scored),
+        int(scored["error"].notna().sum()),
+    )
+
+
+def stream_scores(
+    model: CalibratedModel,
+    source: Union[str, IO],
+    output_format: str = "csv",
+    chunksize: int = DEFAULT_CHUNKSIZE,
+) -> Iterator[bytes]:
+    """Yield encoded results chunk by chunk, then a rows/sec summary.
+
+    Rows with a blank or non-numeric scoring column are reported with an
+    empty probability and the offending columns in ``error``, and counted
+    as ``invalid`` in the summary.
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"output_format must be one of {list(OUTPUT_FORMATS)}")
+
+    started = time.perf_counter()
+    rows = invalid = 0
+    yield encode_header(output_format)
+    reader = pd.read_csv(source, usecols=_columns, chunksize=chunksize)
+    for chunk in reader:
+        scored = score_chunk(model, chunk)
+        rows += len(scored)
+        invalid += int(scored["error"].notna().sum())
+        yield encode_scores(scored, output_format)
+    yield encode_summary(rows, invalid, time.perf_counter() - started, output_format)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a customer CSV extract")
+    parser.add_argument("input", help="CSV file in the data.csv schema")
+    parser.add_argument("-o", "--output", help="Output file (default: stdout)")
+    parser.add_argument("--format", choices=list(OUTPUT_FORMATS), default="csv")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE)
+    parser.add_argument(
+        "--model", default=os.getenv("MODEL_PATH", "utils/best_model.joblib")
+    )
+    parser.add_argument(
+        "--bins", default=os.getenv("BIN_PATH", "utils/binning_transformers.joblib")
+    )
+    parser.add_argument("--inference-mode", default=os.getenv("INFERENCE_MODE", "live"))
+    args = parser.parse_args()
+
+    model = CalibratedModel(args.model, args.bins, args.inference_mode)
+    with open(args.input) as source:
+        try:
+            missing = missing_columns(source)
+        except ValueError as e:
+            sys.exit(f"{args.input}: {e}")
+        if missing:
+            sys.exit(f"Missing columns in {args.input}: {', '.join(missing)}")
+        output = open(args.output, "wb") if args.output else sys.stdout.buffer
+        try:
+            for block in stream_scores(model, source, args.format, args.chunksize):
+                output.write(block)
+                output.flush()
+        finally:
+            if args.output:
+                output.close()
+
+
+if __name__ == "__main__":
+    main()
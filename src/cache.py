@@ -0,0 +1,74 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+
+class ResponseCache:
+    """Bounded LRU cache of encoded response bodies with a TTL.
+
+    Keys must include everything the response depends on (route, normalized
+    query parameters and the dataset version), which also makes the ETag a
+    pure function of the key.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 300):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.not_modified = 0
+
+    @staticmethod
+    def etag(key: Hashable) -> str:
+        return (
+            '"' + hashlib.blake2b(repr(key).encode(), digest_size=12).hexdigest() + '"'
+        )
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                expires_at, body = entry
+                if expires_at > time.monotonic():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return body
+                del self.entries[key]
+                self.evictions += 1
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, body: bytes):
+        if self.max_entries <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl_seconds, body)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def record_not_modified(self):
+        with self.lock:
+            self.not_modified += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "not_modified": self.not_modified,
+            }
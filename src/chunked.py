@@ -0,0 +1,108 @@
+"""Out-of-core analytics over customer tables larger than memory.
+
+Every /stats, /chart or /dashboard query is one streaming scan of the
+source: each chunk is encoded, filtered and reduced to the same mergeable
+partials the in-memory path uses (stats_partial, chart_partial), which are
+summed as the scan goes. Only one chunk of rows is ever held, so memory
+depends on the chunk size, not the table size, and results match the
+in-memory backend.
+
+The source is a CSV in the data.csv schema or a directory of CSV
+partitions (read in file-name order).
+"""
+
+import glob
+import hashlib
+import os
+import threading
+import numpy as np
+from typing import Dict, List
+from analytics import (
+    FilteredRows,
+    PartialAggregator,
+    merge_chart_partials,
+    rows_partials,
+)
+from dataset import CATEGORICAL_COLUMNS, Dataset, iter_customer_chunks
+from expressions import compile_filter
+from filters import FilterIndex
+
+DEFAULT_CHUNKSIZE = int(os.getenv("ANALYTICS_CHUNKSIZE", "200000"))
+
+# Columns every query reads: the stats inputs and the filter columns (plus
+# those a where expression names)
+BASE_COLUMNS = ("tenure", "MonthlyCharges", "InternetService", "Contract", "Churn")
+
+
+def partition_paths(source: str) -> List[str]:
+    if os.path.isdir(source):
+        paths = sorted(glob.glob(os.path.join(source, "*.csv")))
+        if not paths:
+            raise ValueError(f"No CSV partitions in {source}")
+        return paths
+    return [source]
+
+
+class ChunkedBackend(PartialAggregator):
+    def __init__(self, source: str, chunksize: int = DEFAULT_CHUNKSIZE):
+        self.source = source
+        self.chunksize = chunksize
+        self.lock = threading.Lock()
+        # Row count seen by the category scan at startup
+        self.rows = 0
+        self.categories = self._scan_categories()
+
+    def _scan_categories(self) -> Dict[str, list]:
+        """Sorted labels of every categorical column, as the in-memory
+        Dataset has them, so both backends use the same codes"""
+        labels = {column: set() for column in CATEGORICAL_COLUMNS}
+        for chunk in self._chunks():
+            self.rows += len(chunk)
+            for column in CATEGORICAL_COLUMNS:
+                labels[column].update(chunk[column].unique().tolist())
+        return {column: sorted(values) for column, values in labels.items()}
+
+    def _chunks(self):
+        # Listed per scan so partitions added later are picked up
+        for path in partition_paths(self.source):
+            yield from iter_customer_chunks(path, self.chunksize)
+
+    def version(self) -> str:
+        """Changes whenever a partition is rewritten, added or removed"""
+        digest = hashlib.blake2b(digest_size=16)
+        for path in partition_paths(self.source):
+            stat = os.stat(path)
+            digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+        return digest.hexdigest()
+
+    def labels(self, column: str) -> list:
+        return self.categories[column]
+
+    def scan(self, params: dict, specs: dict, with_stats: bool = True):
+        """Stream the source once, merging each chunk's partials"""
+        columns = set(BASE_COLUMNS) | {spec.column for spec in specs.values()}
+        if params.get("where"):
+            columns |= compile_filter(params["where"]).columns
+        with self.lock:
+            categories = self.categories
+        stats = np.zeros(4)
+        partials = dict.fromkeys(specs)
+        for chunk in self._chunks():
+            data = Dataset.from_frame(chunk, categories, columns)
+            # Labels first seen in this chunk were appended; keep their codes
+            categories = {**categories, **data.categories}
+            index = FilterIndex.for_selection(data, **params)
+            chunk_stats, chunk_partials = rows_partials(
+                FilteredRows(data, index.mask(**params)), specs, with_stats
+            )
+            if with_stats:
+                stats += chunk_stats
+            for name, partial in chunk_partials.items():
+                partials[name] = merge_chart_partials(partials[name], partial)
+        with self.lock:
+            if any(
+                len(categories[column]) > len(self.categories[column])
+                for column in self.categories
+            ):
+                self.categories = {**self.categories, **categories}
+        return stats, partials, categories
@@ -0,0 +1,80 @@
+"""Coalesce concurrent single predictions into one vectorized batch.
+
+Requests that arrive within ``window_seconds`` of the first one waiting, or
+until ``max_batch`` are waiting, are scored together by one call to
+``score_batch`` (one predict_proba instead of one per request). Each caller
+still gets its own output. Batch sizes and the time requests spend waiting
+for their batch are recorded so the window can be tuned.
+"""
+
+import asyncio
+import time
+from typing import Awaitable, Callable, List
+from metrics import BATCH_SIZE_BUCKETS, SECONDS_BUCKETS, Histogram
+from model import PredictionInput, PredictionOutput
+
+
+class PredictionCoalescer:
+    def __init__(
+        self,
+        score_batch: Callable[[List[PredictionInput]], Awaitable[list]],
+        window_seconds: float = 0.002,
+        max_batch: int = 64,
+    ):
+        self.score_batch = score_batch
+        self.window_seconds = window_seconds
+        self.max_batch = max_batch
+        # (input, future, enqueued at); only touched from the event loop
+        self.waiting = []
+        self.timer = None
+        self.tasks = set()
+        self.batch_size = Histogram(BATCH_SIZE_BUCKETS)
+        self.queue_wait = Histogram(SECONDS_BUCKETS)
+
+    async def predict(self, input_data: PredictionInput) -> PredictionOutput:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.waiting.append((input_data, future, time.perf_counter()))
+        if len(self.waiting) >= self.max_batch:
+            self._flush()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.window_seconds, self._flush)
+        return await future
+
+    def _flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        batch, self.waiting = self.waiting, []
+        if not batch:
+            return
+        # Keep a reference so the task is not garbage collected mid-flight
+        task = asyncio.ensure_future(self._score(batch))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _score(self, batch: list):
+        dispatched = time.perf_counter()
+        self.batch_size.observe(len(batch))
+        for _, _, enqueued in batch:
+            self.queue_wait.observe(dispatched - enqueued)
+        try:
+            outputs = await self.score_batch([item for item, _, _ in batch])
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future, _), output in zip(batch, outputs):
+            # Done already if the caller went away
+            if not future.done():
+                future.set_result(output)
+
+    def stats(self) -> dict:
+        return {
+            "window_seconds": self.window_seconds,
+            "max_batch": self.max_batch,
+            "waiting": len(self.waiting),
+            "batch_size": self.batch_size.snapshot(),
+            "queue_wait_seconds": self.queue_wait.snapshot(),
+        }
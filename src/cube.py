@@ -0,0 +1,114 @@
+import itertools
+import time
+from typing import Optional
+from analytics import (
+    CHARTS,
+    FilteredRows,
+    finalize_charts,
+    finalize_stats,
+    merge_chart_partials,
+    rows_partials,
+)
+from dataset import Dataset
+from serialization import to_json
+from filters import FilterIndex
+from presets import ALL_CONTRACTS, ALL_SERVICES, SEGMENTS, TIME_PERIODS
+
+
+class AnalyticsCube:
+    """/stats and every chart payload for every dashboard filter combination.
+
+    The filter space is (time periods + none) x segments x services x
+    contracts, a few hundred combinations, so after the build at startup a
+    dashboard request is a dictionary lookup.
+
+    Each entry keeps the mergeable partials it was finalized from, so rows
+    added to or removed from the table update it with the partials of just
+    those rows (apply_delta).
+    """
+
+    def __init__(self, dataset: Dataset, filter_index: FilterIndex):
+        self.services = [ALL_SERVICES] + sorted(dataset.labels("InternetService"))
+        self.contracts = [ALL_CONTRACTS] + sorted(dataset.labels("Contract"))
+        self.partials = {}
+        self.entries = {}
+
+        started = time.perf_counter()
+        for key in self.combinations():
+            rows = FilteredRows(dataset, filter_index.mask(*key))
+            self.partials[key] = rows_partials(rows, CHARTS)
+            self.entries[key] = self._finalize(key, dataset.categories)
+        self.build_seconds = time.perf_counter() - started
+        self.size_bytes = len(to_json(list(self.entries.values())))
+
+    def _finalize(self, key: tuple, categories: dict) -> dict:
+        stats, partials = self.partials[key]
+        return {
+            "stats": finalize_stats(stats),
+            "charts": finalize_charts(partials, categories),
+        }
+
+    def apply_delta(self, delta: Dataset, sign: int = 1) -> set:
+        """Add (sign=1) or subtract (sign=-1) the partials of the rows in
+        ``delta`` to every entry selecting some of them; the keys of those
+        entries, which finalize() then rebuilds"""
+        index = FilterIndex(delta, mask_cache_bytes=0)
+        changed = set()
+        for key, (stats, partials) in self.partials.items():
+            rows = FilteredRows(delta, index.mask(*key))
+            if not len(rows):
+                continue
+            delta_stats, delta_partials = rows_partials(rows, CHARTS)
+            self.partials[key] = (
+                stats + sign * delta_stats,
+                {
+                    name: merge_chart_partials(partial, sign * delta_partials[name])
+                    for name, partial in partials.items()
+                },
+            )
+            changed.add(key)
+        return changed
+
+    def finalize(self, keys, categories: dict):
+        for key in keys:
+            self.entries[key] = self._finalize(key, categories)
+
+    def combinations(self):
+        return itertools.product(
+            [None] + list(TIME_PERIODS), SEGMENTS, self.services, self.contracts
+        )
+
+    @staticmethod
+    def size(dataset: Dataset) -> int:
+        """Number of combinations a cube over ``dataset`` would hold"""
+        return (
+            (len(TIME_PERIODS) + 1)
+            * len(SEGMENTS)
+            * (len(dataset.labels("InternetService")) + 1)
+            * (len(dataset.labels("Contract")) + 1)
+        )
+
+    def key(
+        self,
+        time_period: Optional[str] = None,
+        segment: Optional[str] = None,
+        service: Optional[str] = None,
+        contract: Optional[str] = None,
+    ) -> tuple:
+        """Normalize request parameters the same way FilterIndex reads them"""
+        return (
+            time_period if time_period in TIME_PERIODS else None,
+            segment if segment in SEGMENTS else "All Segments",
+            service or ALL_SERVICES,
+            contract or ALL_CONTRACTS,
+        )
+
+    def get(
+        self,
+        time_period: Optional[str] = None,
+        segment: Optional[str] = None,
+        service: Optional[str] = None,
+        contract: Optional[str] = None,
+    ) -> Optional[dict]:
+        """Cube entry for the request, None for values outside the cube"""
+        return self.entries.get(self.key(time_period, segment, service, contract))
@@ -0,0 +1,304 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+import numpy as np
+from contextlib import contextmanager
+import pandas as pd
+from typing import Collection, Dict, Iterator, Optional, Tuple
+
+# Bump when the on-disk snapshot layout changes so old snapshots get rebuilt
+SNAPSHOT_FORMAT = 2
+SNAPSHOT_META = "meta.json"
+SNAPSHOT_LOCK_TIMEOUT = 600
+
+ID_COLUMN = "customerID"
+NUMERIC_COLUMNS = ["tenure", "MonthlyCharges", "TotalCharges"]
+CATEGORICAL_COLUMNS = [
+    "gender",
+    "SeniorCitizen",
+    "Partner",
+    "Dependents",
+    "PhoneService",
+    "MultipleLines",
+    "InternetService",
+    "OnlineSecurity",
+    "OnlineBackup",
+    "DeviceProtection",
+    "TechSupport",
+    "StreamingTV",
+    "StreamingMovies",
+    "Contract",
+    "PaperlessBilling",
+    "PaymentMethod",
+    "Churn",
+]
+
+
+def clean_customers(df: pd.DataFrame) -> pd.DataFrame:
+    df["TotalCharges"] = pd.to_numeric(df["TotalCharges"], errors="coerce")
+    return df.dropna()
+
+
+def read_customers(path_or_buffer, **read_csv_kwargs) -> pd.DataFrame:
+    """Read a customer table in the data.csv schema and drop unusable rows"""
+    return clean_customers(pd.read_csv(path_or_buffer, **read_csv_kwargs))
+
+
+def iter_customer_chunks(
+    path_or_buffer, chunksize: int, **read_csv_kwargs
+) -> Iterator[pd.DataFrame]:
+    """read_customers one ``chunksize``-row chunk at a time"""
+    with pd.read_csv(path_or_buffer, chunksize=chunksize, **read_csv_kwargs) as reader:
+        for chunk in reader:
+            yield clean_customers(chunk)
+
+
+class Dataset:
+    """Column-oriented customer table.
+
+    Categorical columns are stored as integer codes into ``categories[column]``
+    and numeric columns as plain NumPy arrays, so filters and aggregations work
+    on contiguous typed arrays instead of a DataFrame.
+    """
+
+    def __init__(
+        self,
+        columns: Dict[str, np.ndarray],
+        categories: Dict[str, list],
+        churned: Optional[np.ndarray] = None,
+    ):
+        self.columns = columns
+        self.categories = categories
+        if churned is None:
+            churned = columns["Churn"] == self.code("Churn", "Yes")
+        self.churned = churned
+        self._fingerprint = None
+
+    @classmethod
+    def from_frame(
+        cls,
+        df: pd.DataFrame,
+        categories: Optional[Dict[str, list]] = None,
+        columns: Optional[Collection[str]] = None,
+    ) -> "Dataset":
+        """Encode a cleaned frame. Known ``categories`` keep their codes and
+        unseen labels are appended, so codes stay stable across frames.
+        ``columns`` limits encoding to those columns (plus ID and Churn)."""
+        categories = {
+            column: list(labels) for column, labels in (categories or {}).items()
+        }
+        wanted = None if columns is None else set(columns) | {"Churn"}
+        encoded = {ID_COLUMN: df[ID_COLUMN].to_numpy(dtype=str)}
+        for column in NUMERIC_COLUMNS:
+            if wanted is None or column in wanted:
+                encoded[column] = df[column].to_numpy(dtype=float)
+        for column in CATEGORICAL_COLUMNS:
+            if wanted is not None and column not in wanted:
+                continue
+            labels = categories.setdefault(column, [])
+            known = set(labels)
+            labels.extend(
+                label
+                for label in sorted(df[column].unique().tolist())
+                if label not in known
+            )
+            encoded[column] = pd.Categorical(df[column], categories=labels).codes
+        return cls(encoded, categories)
+
+    def __len__(self) -> int:
+        return len(self.columns[ID_COLUMN])
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        return self.columns[column]
+
+    def take(self, rows: np.ndarray) -> "Dataset":
+        """The rows at positions ``rows``, in that order"""
+        return Dataset(
+            {column: values[rows] for column, values in self.columns.items()},
+            self.categories,
+            self.churned[rows],
+        )
+
+    def fingerprint(self) -> str:
+        """Content hash of every column and category list"""
+        if self._fingerprint is None:
+            digest = hashlib.blake2b(digest_size=16)
+            digest.update(
+                json.dumps(self.categories, sort_keys=True, default=str).encode()
+            )
+            for column in sorted(self.columns):
+                digest.update(column.encode())
+                digest.update(np.ascontiguousarray(self.columns[column]).data)
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
+    def save(self, directory: str, source: Optional[dict] = None):
+        """Write one .npy file per column plus a meta.json.
+
+        The snapshot is written next to ``directory`` and moved into place,
+        so readers never see a half-written snapshot.
+        """
+        staging = directory.rstrip("/\\") + ".tmp"
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        for column, values in self.columns.items():
+            np.save(os.path.join(staging, f"{column}.npy"), values)
+        # Derived column, stored so attached processes share it too
+        np.save(os.path.join(staging, "churned.npy"), self.churned)
+        meta = {
+            "format": SNAPSHOT_FORMAT,
+            "rows": len(self),
+            "columns": list(self.columns),
+            "categories": self.categories,
+            "fingerprint": self.fingerprint(),
+            "source": source,
+        }
+        with open(os.path.join(staging, SNAPSHOT_META), "w") as f:
+            json.dump(meta, f)
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(staging, directory)
+
+    @classmethod
+    def load(cls, directory: str, mmap_mode: Optional[str] = "r") -> "Dataset":
+        """Open a snapshot; with ``mmap_mode`` columns are memory-mapped"""
+        with open(os.path.join(directory, SNAPSHOT_META)) as f:
+            meta = json.load(f)
+        if meta.get("format") != SNAPSHOT_FORMAT:
+            raise ValueError(f"Unsupported snapshot format {meta.get('format')}")
+        columns = {
+            column: np.load(
+                os.path.join(directory, f"{column}.npy"), mmap_mode=mmap_mode
+            )
+            for column in meta["columns"]
+        }
+        churned = np.load(os.path.join(directory, "churned.npy"), mmap_mode=mmap_mode)
+        dataset = cls(columns, meta["categories"], churned)
+        dataset._fingerprint = meta["fingerprint"]
+        return dataset
+
+    def labels(self, column: str) -> list:
+        return self.categories[column]
+
+    def code(self, column: str, label) -> int:
+        """Code of ``label`` in ``column``, -1 if the label never occurs"""
+        try:
+            return self.categories[column].index(label)
+        except ValueError:
+            return -1
+
+
+def _source_stat(csv_path: str) -> dict:
+    stat = os.stat(csv_path)
+    return {
+        "path": os.path.abspath(csv_path),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+    }
+
+
+def _read_snapshot_source(snapshot_dir: str) -> Optional[dict]:
+    try:
+        with open(os.path.join(snapshot_dir, SNAPSHOT_META)) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get("format") != SNAPSHOT_FORMAT:
+        return None
+    return meta.get("source")
+
+
+@contextmanager
+def snapshot_lock(snapshot_dir: str, timeout: float = SNAPSHOT_LOCK_TIMEOUT):
+    """Cross-process lock so only one worker (re)builds a snapshot.
+
+    A lock file older than ``timeout`` is assumed to belong to a crashed
+    process and is taken over.
+    """
+    lock_path = snapshot_dir.rstrip("/\\") + ".lock"
+    while True:
+        try:
+            os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) > timeout:
+                    os.remove(lock_path)
+            except OSError:
+                pass
+            time.sleep(0.1)
+    try:
+        yield
+    finally:
+        os.remove(lock_path)
+
+
+def build_snapshot(csv_path: str, snapshot_dir: str) -> Dataset:
+    """Parse the CSV once and write it as a binary snapshot"""
+    dataset = Dataset.from_frame(read_customers(csv_path))
+    dataset.save(snapshot_dir, source=_source_stat(csv_path))
+    return dataset
+
+
+def _open_snapshot(csv_path: str, snapshot_dir: str) -> Optional[Dataset]:
+    """Memory-map the snapshot if it was built from the current CSV"""
+    if _read_snapshot_source(snapshot_dir) != _source_stat(csv_path):
+        return None
+    try:
+        return Dataset.load(snapshot_dir)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Snapshot in {snapshot_dir} is unreadable ({e}), rebuilding")
+        return None
+
+
+def load_dataset(
+    csv_path: str, snapshot_dir: Optional[str], shared: bool = False
+) -> Tuple[Dataset, str]:
+    """Load the customer table, preferring an up-to-date snapshot.
+
+    The snapshot is used when it was built from a CSV of the same size and
+    modification time; otherwise one process rebuilds it from the CSV while
+    the others wait. With ``shared`` every process, including the one that
+    built the snapshot, works on the read-only memory-mapped columns, so
+    the OS page cache holds a single copy of the data for all workers.
+    Returns the dataset and where it came from ("snapshot", "csv" or
+    "csv+snapshot").
+    """
+    if not snapshot_dir:
+        if shared:
+            raise ValueError("Shared data needs a snapshot directory")
+        return Dataset.from_frame(read_customers(csv_path)), "csv"
+
+    dataset = _open_snapshot(csv_path, snapshot_dir)
+    if dataset is not None:
+        return dataset, "snapshot"
+
+    with snapshot_lock(snapshot_dir):
+        # Another worker may have built it while we waited for the lock
+        dataset = _open_snapshot(csv_path, snapshot_dir)
+        if dataset is not None:
+            return dataset, "snapshot"
+        dataset = build_snapshot(csv_path, snapshot_dir)
+    if shared:
+        dataset = Dataset.load(snapshot_dir)
+    return dataset, "csv+snapshot"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Write the cleaned customer table as a binary snapshot"
+    )
+    parser.add_argument("csv", nargs="?", default=os.getenv("DATA_PATH", "./data.csv"))
+    parser.add_argument(
+        "snapshot_dir", nargs="?", default=os.getenv("SNAPSHOT_DIR", "./snapshot")
+    )
+    args = parser.parse_args()
+    with snapshot_lock(args.snapshot_dir):
+        dataset = build_snapshot(args.csv, args.snapshot_dir)
+    print(f"Wrote {len(dataset)} rows to {args.snapshot_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""Run CPU-bound analytics and inference off the asyncio event loop.
+
+Heavy handlers are dispatched to a thread or process pool through
+HeavyExecutor, which caps how many run at once and how many may wait. When
+both are full a request fails fast with Overloaded (503) instead of
+queuing without bound, so cheap routes such as /health stay responsive.
+
+The task functions below read the model and data from module state: in
+thread mode that is the API process's own objects (set_state), in process
+mode each worker attaches to the memory-mapped snapshot at start-up (and
+draws the same seeded stratified sample for approximate queries). Stage
+metrics recorded inside tasks (chart phases, model stages) only reach
+/metrics in thread mode; process workers keep their own registry.
+"""
+
+import asyncio
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import List, Optional
+from batch_score import score_block
+from chunked import ChunkedBackend
+from analytics import (
+    CHARTS,
+    FilteredRows,
+    PartialAggregator,
+    chart_from_rows,
+    compute_dashboard,
+    compute_stats,
+)
+from dataset import load_dataset
+from filters import FilterIndex
+from metrics import CHART_PHASE_SECONDS, scoring_route
+from model import CalibratedModel, PredictionInput
+from sampling import StratifiedSample
+
+EXECUTOR_KINDS = ("thread", "process")
+
+_state = {}
+
+
+class Overloaded(Exception):
+    """Every execution slot and queue position is taken"""
+
+
+def set_state(
+    model: CalibratedModel,
+    dataset,
+    filter_index: Optional[FilterIndex],
+    backend: Optional[PartialAggregator] = None,
+    sample: Optional[StratifiedSample] = None,
+):
+    _state.update(
+        model=model,
+        data=dataset,
+        filter_index=filter_index,
+        backend=backend,
+        sample=sample,
+    )
+
+
+def _init_process(
+    data_path: str,
+    snapshot_dir: str,
+    model_args: tuple,
+    backend_args: Optional[tuple] = None,
+    sample_rows: int = 0,
+):
+    model = CalibratedModel(*model_args)
+    if backend_args is not None:
+        set_state(model, None, None, ChunkedBackend(*backend_args))
+        return
+    dataset, _ = load_dataset(data_path, snapshot_dir, shared=True)
+    filter_index = FilterIndex.shared(
+        dataset, os.path.join(snapshot_dir, "filter_index")
+    )
+    sample = StratifiedSample(dataset, sample_rows) if sample_rows else None
+    set_state(model, dataset, filter_index, sample=sample)
+
+
+def _filtered(params: dict):
+    """The dataset and the selection's mask over it. Both come from one
+    filter index: set_state may publish a new dataset and index between two
+    reads of _state."""
+    filter_index = _state["filter_index"]
+    return filter_index.dataset, filter_index.mask(**params)
+
+
+def stats_task(params: dict) -> dict:
+    if _state["backend"] is not None:
+        return _state["backend"].stats(params)
+    return compute_stats(*_filtered(params))
+
+
+def chart_task(chart_name: str, params: dict) -> dict:
+    if _state["backend"] is not None:
+        return _state["backend"].chart(params, chart_name)
+    spec = CHARTS.get(chart_name)
+    if spec is None:
+        return {}
+    # Filter phase: build the mask and select the chart's columns
+    started = time.perf_counter()
+    rows = FilteredRows(*_filtered(params)).select(spec.column, "churned")
+    filtered = time.perf_counter()
+    chart = chart_from_rows(rows, chart_name)
+    CHART_PHASE_SECONDS.labels(chart_name, "filter").observe(filtered - started)
+    CHART_PHASE_SECONDS.labels(chart_name, "aggregate").observe(
+        time.perf_counter() - filtered
+    )
+    return chart
+
+
+def dashboard_task(params: dict) -> dict:
+    if _state["backend"] is not None:
+        return _state["backend"].dashboard(params)
+    return compute_dashboard(*_filtered(params))
+
+
+def approx_stats_task(params: dict, max_error: float, rows: int = 0) -> dict:
+    """Stats from the stratified sample, over ``rows`` sampled rows or as
+    many as ``max_error`` needs"""
+    sample = _state["sample"]
+    return sample.stats(params, rows or sample.rows_for(params, max_error))
+
+
+def approx_chart_task(
+    chart_name: str, params: dict, max_error: float, rows: int = 0
+) -> dict:
+    sample = _state["sample"]
+    return sample.chart(params, chart_name, rows or sample.rows_for(params, max_error))
+
+
+def refinement_steps_task(params: dict, max_error: float) -> list:
+    return _state["sample"].refinement_steps(params, max_error)
+
+
+def predict_task(input_data: PredictionInput):
+    with scoring_route("/predict"):
+        return _state["model"].predict(input_data)
+
+
+def predict_batch_task(inputs: List[PredictionInput], route: str = "/predict/batch"):
+    """``route``: the route the stage timings are recorded under, "/predict"
+    for batches of coalesced single predictions"""
+    with scoring_route(route):
+        return _state["model"].predict_batch(inputs)
+
+
+def score_block_task(header: bytes, block: bytes, output_format: str):
+    with scoring_route("/predict/file"):
+        return score_block(_state["model"], header, block, output_format)
+
+
+class HeavyExecutor:
+    """Bounded dispatcher in front of a thread or process pool.
+
+    At most ``max_concurrent`` tasks run at once and at most ``max_queue``
+    more wait for a slot; anything beyond that raises Overloaded right away.
+    """
+
+    def __init__(
+        self,
+        kind: str = "thread",
+        max_workers: Optional[int] = None,
+        max_concurrent: Optional[int] = None,
+        max_queue: int = 64,
+        process_init_args: Optional[tuple] = None,
+    ):
+        if kind not in EXECUTOR_KINDS:
+            raise ValueError(f"kind must be one of {EXECUTOR_KINDS}, got {kind!r}")
+        self.kind = kind
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_concurrent = max_concurrent or self.max_workers
+        self.max_queue = max_queue
+        if kind == "process":
+            self.pool = ProcessPoolExecutor(
+                self.max_workers, initializer=_init_process, initargs=process_init_args
+            )
+        else:
+            self.pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix="heavy")
+        self.semaphore = asyncio.Semaphore(self.max_concurrent)
+        self.pending = 0
+        self.rejected = 0
+
+    async def run(self, fn, *args, admitted: bool = False):
+        """``fn(*args)`` on the pool; ``admitted`` skips the queue bound,
+        for the later steps of a request that already got through it"""
+        # pending is only touched from the event loop thread, no lock needed
+        if not admitted and self.pending >= self.max_concurrent + self.max_queue:
+            self.rejected += 1
+            raise Overloaded(f"{self.pending} heavy requests already in flight")
+        self.pending += 1
+        try:
+            async with self.semaphore:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self.pool, partial(fn, *args))
+        finally:
+            self.pending -= 1
+
+    def stats(self) -> dict:
+        return {
+            "kind": self.kind,
+            "max_workers": self.max_workers,
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "pending": self.pending,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
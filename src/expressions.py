@@ -0,0 +1,450 @@
+"""Filter expressions for the analytics routes.
+
+/stats, /chart and /dashboard take a ``where`` expression on top of the
+filter presets, e.g.
+
+    PaymentMethod = 'Electronic check' and SeniorCitizen = 1
+    tenure between 12 and 24 and not Contract in ('One year', 'Two year')
+    MonthlyCharges >= 100 or (PaperlessBilling = Yes and TotalCharges < 500)
+
+Grammar (keywords are case-insensitive, so are column names):
+
+    expression := term ("or" term)*
+    term       := factor ("and" factor)*
+    factor     := "not" factor | "(" expression ")" | predicate
+    predicate  := column op value
+                | column ["not"] "in" "(" value ("," value)* ")"
+                | column "between" value "and" value
+    op         := "=" | "==" | "!=" | "<>" | "<" | "<=" | ">" | ">="
+    value      := number | 'quoted' | "quoted" | bare-word
+
+Numeric columns take every operator; categorical columns take =, != and in
+over their labels. An expression compiles to a plan: a tree of predicates,
+each one vectorized operation over a typed column (a comparison of a float
+column, or a code comparison / lookup table over category codes), combined
+with logical and/or/not. Plans are cached by expression text, and an index
+keeps the masks of its predicates and sub-expressions in a byte-bounded
+LRU keyed by their canonical text, so the same predicate is scanned once
+whatever expression it appears in.
+"""
+
+import os
+import re
+import threading
+import numpy as np
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, Optional, Tuple
+from dataset import CATEGORICAL_COLUMNS, NUMERIC_COLUMNS, Dataset
+
+# Parsed plans kept per process, and the default byte budget of an index's
+# predicate mask cache
+FILTER_PLAN_CACHE_SIZE = int(os.getenv("FILTER_PLAN_CACHE_SIZE", "256"))
+FILTER_MASK_CACHE_MB = float(os.getenv("FILTER_MASK_CACHE_MB", "64"))
+MAX_EXPRESSION_LENGTH = 2000
+MAX_NESTING = 32
+
+COLUMNS = {column.lower(): column for column in NUMERIC_COLUMNS}
+COLUMNS.update({column.lower(): column for column in CATEGORICAL_COLUMNS})
+KEYWORDS = {"and", "or", "not", "in", "between"}
+OPERATORS = {"=": "=", "==": "=", "!=": "!=", "<>": "!=", "<": "<", "<=": "<="}
+OPERATORS.update({">": ">", ">=": ">="})
+NUMERIC_OPERATORS = {
+    "=": np.equal,
+    "!=": np.not_equal,
+    "<": np.less,
+    "<=": np.less_equal,
+    ">": np.greater,
+    ">=": np.greater_equal,
+}
+
+TOKEN = re.compile(
+    r"""\s*(?:
+        (?P<number>[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)(?![\w-])
+        |(?P<string>'[^']*'|"[^"]*")
+        |(?P<op><=|>=|!=|<>|==|=|<|>)
+        |(?P<punct>[(),])
+        |(?P<word>[A-Za-z_][\w-]*)
+    )""",
+    re.VERBOSE,
+)
+
+
+class FilterExpressionError(ValueError):
+    """The expression does not parse or does not fit the dataset"""
+
+
+def _quote(label: str) -> str:
+    return f'"{label}"' if "'" in label else f"'{label}'"
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+@dataclass(frozen=True)
+class Predicate:
+    """``column op values``; op is a comparison, "in" or "between"
+    (inclusive), values are floats for numeric columns and label text for
+    categorical ones"""
+
+    column: str
+    op: str
+    values: tuple
+
+    @property
+    def key(self) -> str:
+        if self.column in NUMERIC_COLUMNS:
+            values = [_number(value) for value in self.values]
+        else:
+            values = [_quote(value) for value in self.values]
+        if self.op == "in":
+            return f"{self.column} in ({', '.join(values)})"
+        if self.op == "between":
+            return f"{self.column} between {values[0]} and {values[1]}"
+        return f"{self.column} {self.op} {values[0]}"
+
+    @property
+    def columns(self) -> frozenset:
+        return frozenset([self.column])
+
+    def evaluate(self, dataset: Dataset, cache=None) -> np.ndarray:
+        values = dataset[self.column]
+        if self.column in NUMERIC_COLUMNS:
+            if self.op == "in":
+                return np.isin(values, self.values)
+            if self.op == "between":
+                mask = values >= self.values[0]
+                mask &= values <= self.values[1]
+                return mask
+            return NUMERIC_OPERATORS[self.op](values, self.values[0])
+
+        # Labels absent from this dataset match no rows
+        codes = {
+            str(label): code for code, label in enumerate(dataset.labels(self.column))
+        }
+        wanted = [codes[value] for value in self.values if value in codes]
+        if len(wanted) == 1:
+            mask = values == wanted[0]
+        else:
+            # One gather over the codes; the extra last slot catches code -1
+            table = np.zeros(len(codes) + 1, dtype=bool)
+            table[wanted] = True
+            mask = table[values]
+        if self.op == "!=":
+            np.logical_not(mask, out=mask)
+        return mask
+
+
+@dataclass(frozen=True)
+class Combination:
+    """Logical "and" / "or" of two or more expressions"""
+
+    op: str
+    children: tuple
+
+    @property
+    def key(self) -> str:
+        return f" {self.op} ".join(
+            f"({child.key})" if isinstance(child, Combination) else child.key
+            for child in self.children
+        )
+
+    @property
+    def columns(self) -> frozenset:
+        return frozenset().union(*(child.columns for child in self.children))
+
+    def evaluate(self, dataset: Dataset, cache=None) -> np.ndarray:
+        combine = np.logical_and if self.op == "and" else np.logical_or
+        masks = [_mask(child, dataset, cache) for child in self.children]
+        result = combine(masks[0], masks[1])
+        for mask in masks[2:]:
+            combine(result, mask, out=result)
+        return result
+
+
+@dataclass(frozen=True)
+class Negation:
+    child: object
+
+    @property
+    def key(self) -> str:
+        if isinstance(self.child, Predicate):
+            return f"not {self.child.key}"
+        return f"not ({self.child.key})"
+
+    @property
+    def columns(self) -> frozenset:
+        return self.child.columns
+
+    def evaluate(self, dataset: Dataset, cache=None) -> np.ndarray:
+        return np.logical_not(_mask(self.child, dataset, cache))
+
+
+def _mask(node, dataset: Dataset, cache) -> np.ndarray:
+    if cache is None or not cache.max_bytes:
+        return node.evaluate(dataset, cache)
+    return cache.get_or_compute(node.key, lambda: node.evaluate(dataset, cache))
+
+
+def _combine(op: str, nodes: list):
+    """Flattened, deduplicated and sorted, so that equivalent expressions
+    get the same canonical text"""
+    children = {}
+    for node in nodes:
+        parts = (
+            node.children if isinstance(node, Combination) and node.op == op else [node]
+        )
+        for part in parts:
+            children.setdefault(part.key, part)
+    if len(children) == 1:
+        return next(iter(children.values()))
+    return Combination(op, tuple(children[key] for key in sorted(children)))
+
+
+class _Parser:
+    def __init__(self, text: str):
+        self.text = text
+        self.tokens = []
+        position = 0
+        while position < len(text):
+            match = TOKEN.match(text, position)
+            if match is None or match.end() == position:
+                rest = text[position:]
+                if not rest.strip():
+                    break
+                raise self.error(
+                    "Unexpected character", position + len(rest) - len(rest.lstrip())
+                )
+            kind = match.lastgroup
+            value = match.group(kind)
+            start = match.start(kind)
+            if kind == "word" and value.lower() in KEYWORDS:
+                kind, value = "keyword", value.lower()
+            self.tokens.append((kind, value, start))
+            position = match.end()
+        self.index = 0
+        self.depth = 0
+
+    def error(self, message: str, position: Optional[int] = None):
+        if position is None:
+            position = self.peek()[2]
+        return FilterExpressionError(f"{message} at position {position + 1}")
+
+    def peek(self) -> tuple:
+        if self.index < len(self.tokens):
+            return self.tokens[self.index]
+        return ("end", None, len(self.text))
+
+    def accept(self, kind: str, value: Optional[str] = None) -> bool:
+        token_kind, token_value, _ = self.peek()
+        if token_kind == kind and (value is None or token_value == value):
+            self.index += 1
+            return True
+        return False
+
+    def expect(self, kind: str, value: str):
+        if not self.accept(kind, value):
+            raise self.error(f"Expected '{value}'")
+
+    def parse(self):
+        node = self.expression()
+        if self.peek()[0] != "end":
+            raise self.error("Unexpected input")
+        return node
+
+    def expression(self):
+        terms = [self.term()]
+        while self.accept("keyword", "or"):
+            terms.append(self.term())
+        return terms[0] if len(terms) == 1 else _combine("or", terms)
+
+    def term(self):
+        factors = [self.factor()]
+        while self.accept("keyword", "and"):
+            factors.append(self.factor())
+        return factors[0] if len(factors) == 1 else _combine("and", factors)
+
+    def factor(self):
+        self.depth += 1
+        if self.depth > MAX_NESTING:
+            raise self.error("Expression nested too deeply")
+        if self.accept("keyword", "not"):
+            child = self.factor()
+            node = child.child if isinstance(child, Negation) else Negation(child)
+        elif self.accept("punct", "("):
+            node = self.expression()
+            self.expect("punct", ")")
+        else:
+            node = self.predicate()
+        self.depth -= 1
+        return node
+
+    def predicate(self):
+        kind, name, position = self.peek()
+        if kind != "word":
+            raise self.error("Expected a column name")
+        column = COLUMNS.get(name.lower())
+        if column is None:
+            raise self.error(
+                f"Unknown column '{name}' (columns: {', '.join(COLUMNS.values())})",
+                position,
+            )
+        self.index += 1
+        numeric = column in NUMERIC_COLUMNS
+
+        negated = self.accept("keyword", "not")
+        if negated or self.accept("keyword", "in"):
+            if negated:
+                self.expect("keyword", "in")
+            self.expect("punct", "(")
+            values = [self.value(numeric)]
+            while self.accept("punct", ","):
+                values.append(self.value(numeric))
+            self.expect("punct", ")")
+            node = Predicate(column, "in", tuple(sorted(set(values))))
+            return Negation(node) if negated else node
+
+        if self.accept("keyword", "between"):
+            if not numeric:
+                raise self.error(f"'between' needs a numeric column, {column} is not")
+            low = self.value(numeric)
+            self.expect("keyword", "and")
+            high = self.value(numeric)
+            return Predicate(column, "between", (low, high))
+
+        kind, op, position = self.peek()
+        if kind != "op":
+            raise self.error("Expected an operator, 'in' or 'between'")
+        self.index += 1
+        op = OPERATORS[op]
+        if not numeric and op not in ("=", "!="):
+            raise self.error(f"{column} is categorical, use =, != or in", position)
+        return Predicate(column, op, (self.value(numeric),))
+
+    def value(self, numeric: bool):
+        kind, value, position = self.peek()
+        if kind == "string":
+            value = value[1:-1]
+        elif kind not in ("number", "word"):
+            raise self.error("Expected a value")
+        self.index += 1
+        if not numeric:
+            return value
+        try:
+            return float(value)
+        except ValueError:
+            raise self.error(f"Expected a number, got '{value}'", position)
+
+
+@dataclass(frozen=True)
+class FilterPlan:
+    """A compiled expression; ``text`` is its canonical form"""
+
+    root: object
+
+    @property
+    def text(self) -> str:
+        return self.root.key
+
+    @property
+    def columns(self) -> frozenset:
+        return self.root.columns
+
+    def predicates(self) -> Tuple[Predicate, ...]:
+        nodes, found = [self.root], []
+        while nodes:
+            node = nodes.pop()
+            if isinstance(node, Predicate):
+                found.append(node)
+            elif isinstance(node, Negation):
+                nodes.append(node.child)
+            else:
+                nodes.extend(node.children)
+        return tuple(found)
+
+    def validate(self, labels: Callable[[str], list]):
+        """Raise FilterExpressionError for labels ``labels(column)`` does
+        not list"""
+        for predicate in self.predicates():
+            if predicate.column in NUMERIC_COLUMNS:
+                continue
+            known = [str(label) for label in labels(predicate.column)]
+            for value in predicate.values:
+                if value not in known:
+                    raise FilterExpressionError(
+                        f"Unknown {predicate.column} value '{value}' "
+                        f"(values: {', '.join(known)})"
+                    )
+
+    def mask(self, dataset: Dataset, cache: Optional["MaskCache"] = None):
+        return _mask(self.root, dataset, cache)
+
+
+@lru_cache(maxsize=FILTER_PLAN_CACHE_SIZE)
+def compile_filter(text: str) -> FilterPlan:
+    """Parse and type-check an expression; cached by its text"""
+    if len(text) > MAX_EXPRESSION_LENGTH:
+        raise FilterExpressionError(
+            f"Expression longer than {MAX_EXPRESSION_LENGTH} characters"
+        )
+    return FilterPlan(_Parser(text).parse())
+
+
+def plan_cache_stats() -> dict:
+    info = compile_filter.cache_info()
+    return {
+        "entries": info.currsize,
+        "max_entries": info.maxsize,
+        "hits": info.hits,
+        "misses": info.misses,
+    }
+
+
+class MaskCache:
+    """LRU of read-only row masks keyed by canonical expression text,
+    holding at most ``max_bytes`` of masks (0 disables it)"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_compute(self, key: str, compute) -> np.ndarray:
+        with self.lock:
+            mask = self.entries.get(key)
+            if mask is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return mask
+            self.misses += 1
+        # Computed outside the lock; concurrent misses may compute it twice
+        mask = compute()
+        if mask.nbytes > self.max_bytes:
+            return mask
+        mask.setflags(write=False)
+        with self.lock:
+            if key not in self.entries:
+                self.entries[key] = mask
+                self.bytes += mask.nbytes
+            while self.bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.bytes -= evicted.nbytes
+                self.evictions += 1
+        return mask
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,158 @@
+import json
+import os
+import numpy as np
+from typing import Optional
+from dataset import Dataset
+from expressions import FILTER_MASK_CACHE_MB, MaskCache, compile_filter
+from presets import ALL_CONTRACTS, ALL_SERVICES, TIME_PERIODS, range_masks
+
+
+class FilterIndex:
+    """Precomputed boolean mask for every dashboard filter preset.
+
+    A request ANDs the masks it selects instead of copying and re-filtering
+    the table, so filtering costs O(rows) byte operations per request. A
+    ``where`` expression (see expressions.py) adds the mask of its compiled
+    plan, whose predicate masks are cached in ``expression_masks``.
+
+    ``dead_rows`` are rows a refresh replaced (see incremental.py); every
+    request's mask leaves them out.
+    """
+
+    def __init__(
+        self,
+        dataset: Dataset,
+        masks: Optional[dict] = None,
+        mask_cache_bytes: int = int(FILTER_MASK_CACHE_MB * 2**20),
+        dead_rows: Optional[np.ndarray] = None,
+    ):
+        self.dataset = dataset
+        self.size = len(dataset)
+        self.masks = self._build_masks(dataset) if masks is None else masks
+        self.expression_masks = MaskCache(mask_cache_bytes)
+        self.dead_rows = dead_rows if dead_rows is not None and len(dead_rows) else None
+        self._live = None
+
+        # Unknown service/contract values match no rows
+        self.empty = np.zeros(self.size, dtype=bool)
+
+    @staticmethod
+    def _build_masks(dataset: Dataset, only: Optional[set] = None) -> dict:
+        """Every preset mask, or just the keys in ``only``"""
+        definitions = range_masks(dataset["tenure"], dataset["MonthlyCharges"])
+        for key, column in (("service", "InternetService"), ("contract", "Contract")):
+            for code, label in enumerate(dataset.labels(column)):
+                definitions[(key, label)] = (
+                    lambda column=column, code=code: dataset[column] == code
+                )
+        return {
+            key: build()
+            for key, build in definitions.items()
+            if only is None or key in only
+        }
+
+    @classmethod
+    def for_selection(
+        cls,
+        dataset: Dataset,
+        time_period: Optional[str] = None,
+        segment: Optional[str] = None,
+        service: Optional[str] = None,
+        contract: Optional[str] = None,
+        where: Optional[str] = None,
+    ) -> "FilterIndex":
+        """Index holding only the masks one request selects, for one-off use
+        (so expression masks are not cached either)"""
+        keys = {
+            ("time_period", time_period),
+            ("segment", segment),
+            ("service", service),
+            ("contract", contract),
+        }
+        return cls(dataset, cls._build_masks(dataset, keys), mask_cache_bytes=0)
+
+    @classmethod
+    def shared(cls, dataset: Dataset, path: str) -> "FilterIndex":
+        """Index whose masks are memory-mapped from ``path``.npy.
+
+        The file is built by whichever process gets there first and reused
+        by every process attached to the same dataset version.
+        """
+        meta_path = path + ".json"
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta["fingerprint"] == dataset.fingerprint():
+                stacked = np.load(path + ".npy", mmap_mode="r")
+                keys = [tuple(key) for key in meta["keys"]]
+                return cls(dataset, dict(zip(keys, stacked)))
+        except (OSError, ValueError, KeyError):
+            pass
+
+        index = cls(dataset)
+        staging = f"{path}.{os.getpid()}"
+        np.save(staging + ".npy", np.stack(list(index.masks.values())))
+        os.replace(staging + ".npy", path + ".npy")
+        with open(staging + ".json", "w") as f:
+            json.dump(
+                {"fingerprint": dataset.fingerprint(), "keys": list(index.masks)}, f
+            )
+        os.replace(staging + ".json", meta_path)
+        return cls.shared(dataset, path)
+
+    @property
+    def live(self) -> Optional[np.ndarray]:
+        """Mask of the rows that are not dead, None when every row is live;
+        built on first use"""
+        if self.dead_rows is not None and self._live is None:
+            live = np.ones(self.size, dtype=bool)
+            live[self.dead_rows] = False
+            self._live = live
+        return self._live
+
+    def selected(
+        self,
+        time_period: Optional[str] = None,
+        segment: Optional[str] = None,
+        service: Optional[str] = None,
+        contract: Optional[str] = None,
+        where: Optional[str] = None,
+    ) -> list:
+        """Masks selected by the request parameters"""
+        selected = []
+        # Unknown time periods and segments leave the data unfiltered
+        if time_period in TIME_PERIODS:
+            selected.append(self.masks[("time_period", time_period)])
+        if segment and segment != "All Segments":
+            mask = self.masks.get(("segment", segment))
+            if mask is not None:
+                selected.append(mask)
+        if service and service != ALL_SERVICES:
+            selected.append(self.masks.get(("service", service), self.empty))
+        if contract and contract != ALL_CONTRACTS:
+            selected.append(self.masks.get(("contract", contract), self.empty))
+        if where:
+            plan = compile_filter(where)
+            selected.append(plan.mask(self.dataset, self.expression_masks))
+        if self.dead_rows is not None:
+            selected.append(self.live)
+        return selected
+
+    def mask(
+        self,
+        time_period: Optional[str] = None,
+        segment: Optional[str] = None,
+        service: Optional[str] = None,
+        contract: Optional[str] = None,
+        where: Optional[str] = None,
+    ) -> Optional[np.ndarray]:
+        """Combined mask for the request, None when every row is selected"""
+        selected = self.selected(time_period, segment, service, contract, where)
+        if not selected:
+            return None
+        if len(selected) == 1:
+            return selected[0]
+        combined = np.logical_and(selected[0], selected[1])
+        for mask in selected[2:]:
+            np.logical_and(combined, mask, out=combined)
+        return combined
@@ -0,0 +1,277 @@
+"""Incremental refresh of the in-memory table.
+
+POST /data/append sends delta rows in the data.csv schema: new customers
+are appended and a row whose customerID is already loaded replaces that
+customer's row. Adding rows costs O(delta rows), not O(table):
+
+- every column, the churned flag and every preset filter mask live in
+  capacity-doubling buffers, so new rows are written past the current end
+  (amortized O(1) per row)
+- a replaced row is not overwritten: the new row is written past the end
+  like a new customer's and the old one is marked dead, so queries leave
+  it out through the filter index (FilterIndex.dead_rows). Once dead rows
+  make up DEAD_ROWS_FRACTION of the buffers, the live rows are compacted
+  into new buffers, an O(table) step amortized over the replacements
+- the analytics cube keeps the mergeable partials behind each entry
+  (customer and churned counts, charge and tenure sums, per-group counts);
+  the replaced rows' partials are subtracted, the delta's added, and only
+  the entries they touch are finalized again
+- the dataset version chains the previous version with a hash of the
+  delta instead of rehashing the table
+
+Each refresh publishes a new Dataset and FilterIndex whose columns are views
+of the first rows of the buffers, and queries already running keep a
+consistent snapshot in the previous ones: new rows lie past the end of
+their views, rows they hold are never written to and compaction writes new
+buffers. An upload with no
+usable rows changes nothing, not even the version. The first refresh copies
+the loaded columns (which may be read-only memory maps) into buffers and
+indexes the customer IDs, a one-off O(table) step.
+"""
+
+import hashlib
+import threading
+import time
+import numpy as np
+import pandas as pd
+from typing import IO, Optional, Tuple
+from cube import AnalyticsCube
+from dataset import (
+    CATEGORICAL_COLUMNS,
+    ID_COLUMN,
+    NUMERIC_COLUMNS,
+    Dataset,
+    clean_customers,
+)
+from filters import FilterIndex
+
+# Compact the buffers once this fraction of their rows is dead
+DEAD_ROWS_FRACTION = 0.25
+
+
+def read_delta(source: IO, categories: dict) -> Tuple[pd.DataFrame, int]:
+    """Delta rows from a CSV in the data.csv schema, and how many were
+    dropped as unusable.
+
+    Each categorical column is parsed like the loaded table's labels (text,
+    or integers such as SeniorCitizen), so a malformed row is dropped
+    instead of mixing label types; so is a row with extra fields.
+    """
+    integer_columns = [
+        column
+        for column in CATEGORICAL_COLUMNS
+        if categories.get(column)
+        and all(isinstance(label, (int, np.integer)) for label in categories[column])
+    ]
+    position = source.tell()
+    header = pd.read_csv(source, nrows=0).columns
+    source.seek(position)
+    # Naming the columns stops pandas from taking extra fields in the first
+    # row as an index; rows with extra fields are skipped instead
+    skipped = []
+    frame = pd.read_csv(
+        source,
+        header=0,
+        names=list(header),
+        dtype={
+            column: str
+            for column in [ID_COLUMN, *CATEGORICAL_COLUMNS]
+            if column not in integer_columns
+        },
+        engine="python",
+        on_bad_lines=skipped.append,
+    )
+    rows = len(frame) + len(skipped)
+    for column in integer_columns + NUMERIC_COLUMNS:
+        frame[column] = pd.to_numeric(frame[column], errors="coerce")
+    frame = clean_customers(frame)
+    frame = frame.astype({column: np.int64 for column in integer_columns})
+    return frame, rows - len(frame)
+
+
+def _grow(buffer: np.ndarray, rows: int, capacity: int, dtype) -> np.ndarray:
+    grown = np.zeros(capacity, dtype=dtype)
+    grown[:rows] = buffer[:rows]
+    return grown
+
+
+class IncrementalTable:
+    """Appends and replaces rows of an in-memory table; one refresh at a
+    time, queries never wait for one"""
+
+    def __init__(self, dataset: Dataset, cube: Optional[AnalyticsCube] = None):
+        self.dataset = dataset
+        self.cube = cube
+        self.rows = len(dataset)
+        self.lock = threading.Lock()
+        # Set up by the first refresh
+        self.columns = None
+        self.masks = None
+        self.positions = None
+        # Positions of the rows replaced since the last compaction
+        self.dead = None
+        self.dead_rows = 0
+
+    def _prepare(self, filter_index: FilterIndex, live: Optional[np.ndarray] = None):
+        """Buffers holding the rows of ``filter_index``, only the ``live``
+        ones if given"""
+        dataset = filter_index.dataset
+        columns = dict(dataset.columns, churned=dataset.churned)
+        masks = filter_index.masks
+        if live is not None:
+            rows = np.flatnonzero(live)
+            columns = {column: values[rows] for column, values in columns.items()}
+            masks = {key: mask[rows] for key, mask in masks.items()}
+        self.rows = len(columns[ID_COLUMN])
+        capacity = max(2 * self.rows, 1024)
+        self.columns = {
+            column: _grow(values, self.rows, capacity, values.dtype)
+            for column, values in columns.items()
+        }
+        self.masks = {
+            key: _grow(mask, self.rows, capacity, bool) for key, mask in masks.items()
+        }
+        self.positions = {
+            customer: row
+            for row, customer in enumerate(
+                self.columns[ID_COLUMN][: self.rows].tolist()
+            )
+        }
+        # A new buffer: published filter indexes keep views of the old one
+        self.dead = np.zeros(0, dtype=np.int64)
+        self.dead_rows = 0
+
+    def _reserve(self, rows: int, delta: Dataset):
+        """Room for ``rows`` rows in every buffer, in dtypes that hold the
+        delta's values (e.g. longer IDs, wider category codes)"""
+        capacity = len(self.columns[ID_COLUMN])
+        if rows > capacity:
+            capacity = max(rows, 2 * capacity)
+        for column, buffer in self.columns.items():
+            dtype = buffer.dtype
+            if column in delta.columns:
+                dtype = np.result_type(dtype, delta[column].dtype)
+            if len(buffer) < capacity or dtype != buffer.dtype:
+                self.columns[column] = _grow(buffer, self.rows, capacity, dtype)
+        for key, mask in self.masks.items():
+            if len(mask) < capacity:
+                self.masks[key] = _grow(mask, self.rows, capacity, bool)
+
+    def _snapshot(self, categories: dict, fingerprint: str):
+        """Dataset and filter index over the rows written so far"""
+        end = self.rows
+        dataset = Dataset(
+            {
+                column: buffer[:end]
+                for column, buffer in self.columns.items()
+                if column != "churned"
+            },
+            categories,
+            self.columns["churned"][:end],
+        )
+        dataset._fingerprint = fingerprint
+        filter_index = FilterIndex(
+            dataset,
+            {key: mask[:end] for key, mask in self.masks.items()},
+            dead_rows=self.dead[: self.dead_rows],
+        )
+        return dataset, filter_index
+
+    def _gather(self, rows: np.ndarray, categories: dict) -> Dataset:
+        """The current values of ``rows``, as a Dataset"""
+        columns = {
+            column: buffer[rows]
+            for column, buffer in self.columns.items()
+            if column != "churned"
+        }
+        return Dataset(columns, categories, self.columns["churned"][rows])
+
+    def append(
+        self, frame: pd.DataFrame, filter_index: FilterIndex
+    ) -> Tuple[Dataset, FilterIndex, dict]:
+        """Apply cleaned delta rows; the new dataset, its filter index and a
+        summary of the refresh"""
+        with self.lock:
+            started = time.perf_counter()
+            if frame.empty:
+                # Nothing to apply: same dataset, same version
+                return (
+                    self.dataset,
+                    filter_index,
+                    {
+                        "inserted": 0,
+                        "replaced": 0,
+                        "rows": self.rows - self.dead_rows,
+                        "version": self.dataset.fingerprint(),
+                        "seconds": round(time.perf_counter() - started, 4),
+                    },
+                )
+            frame = frame.drop_duplicates(ID_COLUMN, keep="last")
+            # Known labels keep their codes, new ones are appended
+            delta = Dataset.from_frame(frame, self.dataset.categories)
+            categories = delta.categories
+            if self.columns is None:
+                self._prepare(filter_index)
+
+            customers = delta[ID_COLUMN].tolist()
+            existing = [self.positions.get(customer) for customer in customers]
+            replaced_rows = np.array(
+                [row for row in existing if row is not None], dtype=np.int64
+            )
+            start, end = self.rows, self.rows + len(customers)
+
+            changed = set()
+            if self.cube is not None:
+                changed |= self.cube.apply_delta(
+                    self._gather(replaced_rows, categories), sign=-1
+                )
+                changed |= self.cube.apply_delta(delta, sign=1)
+
+            # Every delta row goes past the end, the rows it replaces die
+            self._reserve(end, delta)
+            values = dict(delta.columns, churned=delta.churned)
+            for column, buffer in self.columns.items():
+                buffer[start:end] = values[column]
+            for key, mask in FilterIndex._build_masks(delta).items():
+                if key not in self.masks:
+                    # A new service or contract label; no earlier row has it
+                    self.masks[key] = np.zeros(len(self.columns[ID_COLUMN]), bool)
+                self.masks[key][start:end] = mask
+            dead_rows = self.dead_rows + len(replaced_rows)
+            if dead_rows > len(self.dead):
+                self.dead = _grow(
+                    self.dead,
+                    self.dead_rows,
+                    max(dead_rows, 2 * len(self.dead)),
+                    np.int64,
+                )
+            self.dead[self.dead_rows : dead_rows] = replaced_rows
+            self.dead_rows = dead_rows
+            for offset, customer in enumerate(customers):
+                self.positions[customer] = start + offset
+            self.rows = end
+
+            digest = hashlib.blake2b(
+                self.dataset.fingerprint().encode(), digest_size=16
+            )
+            digest.update(delta.fingerprint().encode())
+            dataset, filter_index = self._snapshot(categories, digest.hexdigest())
+            if self.dead_rows >= DEAD_ROWS_FRACTION * self.rows:
+                self._prepare(filter_index, filter_index.live)
+                dataset, filter_index = self._snapshot(
+                    categories, dataset.fingerprint()
+                )
+            if self.cube is not None:
+                self.cube.finalize(changed, categories)
+            self.dataset = dataset
+            return (
+                dataset,
+                filter_index,
+                {
+                    "inserted": len(customers) - len(replaced_rows),
+                    "replaced": len(replaced_rows),
+                    "rows": self.rows - self.dead_rows,
+                    "version": dataset.fingerprint(),
+                    "seconds": round(time.perf_counter() - started, 4),
+                },
+            )
@@ -0,0 +1,304 @@
+"""In-process metrics with Prometheus text exposition.
+
+Recording is a bisect plus a few integer updates under a per-series lock,
+cheap enough for the request hot path. REGISTRY holds every metric the API
+exposes on /metrics.
+"""
+
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional, Sequence
+
+# Bucket upper bounds for common measurements
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+SECONDS_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+)
+
+
+class Histogram:
+    """Fixed-bucket histogram with Prometheus semantics.
+
+    A value falls in the first bucket whose upper bound is >= the value;
+    values above every bound land in the implicit +Inf bucket.
+    """
+
+    def __init__(self, buckets: Sequence[float] = SECONDS_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self) -> dict:
+        """Cumulative bucket counts keyed by upper bound, plus sum and count"""
+        with self.lock:
+            counts = list(self.counts)
+            total, count = self.sum, self.count
+        cumulative = {}
+        running = 0
+        for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+            running += bucket_count
+            cumulative[str(bound)] = running
+        return {"buckets": cumulative, "sum": total, "count": count}
+
+
+class Value:
+    """One counter or gauge series"""
+
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1):
+        with self.lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Metric:
+    """A named metric and its series, one per combination of label values.
+
+    ``kind`` is "counter", "gauge" or "histogram"; the series returned by
+    labels() is a Value for the first two and a Histogram for the last.
+    An unlabelled counter or gauge may instead read its value from
+    ``function`` at scrape time.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        kind: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = SECONDS_BUCKETS,
+        function: Optional[Callable[[], float]] = None,
+    ):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.label_names = tuple(label_names)
+        self.buckets = buckets
+        self.function = function
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def labels(self, *values):
+        series = self.series.get(values)
+        if series is None:
+            with self.lock:
+                series = self.series.get(values)
+                if series is None:
+                    if len(values) != len(self.label_names):
+                        raise ValueError(
+                            f"{self.name} takes labels {self.label_names}, got {values}"
+                        )
+                    series = (
+                        Histogram(self.buckets) if self.kind == "histogram" else Value()
+                    )
+                    self.series[values] = series
+        return series
+
+    def _label_text(self, values: tuple, extra: str = "") -> str:
+        pairs = [
+            f'{name}="{_escape(str(value))}"'
+            for name, value in zip(self.label_names, values)
+        ]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        if self.function is not None:
+            lines.append(f"{self.name} {_number(self.function())}")
+            return lines
+        for values, series in list(self.series.items()):
+            if self.kind != "histogram":
+                lines.append(
+                    f"{self.name}{self._label_text(values)} {_number(series.value)}"
+                )
+                continue
+            snapshot = series.snapshot()
+            for bound, count in snapshot["buckets"].items():
+                label_text = self._label_text(values, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{label_text} {count}")
+            label_text = self._label_text(values)
+            lines.append(f"{self.name}_sum{label_text} {_number(snapshot['sum'])}")
+            lines.append(f"{self.name}_count{label_text} {snapshot['count']}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def _add(self, metric: Metric) -> Metric:
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(
+        self,
+        name: str,
+        help: str,
+        label_names: Sequence[str] = (),
+        function: Optional[Callable[[], float]] = None,
+    ):
+        return self._add(Metric(name, help, "counter", label_names, function=function))
+
+    def gauge(
+        self,
+        name: str,
+        help: str,
+        label_names: Sequence[str] = (),
+        function: Optional[Callable[[], float]] = None,
+    ):
+        return self._add(Metric(name, help, "gauge", label_names, function=function))
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = SECONDS_BUCKETS,
+    ):
+        return self._add(Metric(name, help, "histogram", label_names, buckets))
+
+    def attach(self, name: str, help: str, histogram: Histogram) -> Metric:
+        """Expose an existing unlabelled Histogram under ``name``, replacing
+        whatever was attached there before"""
+        metric = Metric(name, help, "histogram", buckets=histogram.buckets)
+        metric.series[()] = histogram
+        self.metrics[name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "http_request_duration_seconds",
+    "Time from request start to the end of the response body",
+    ("method", "route"),
+)
+HTTP_REQUESTS = REGISTRY.counter(
+    "http_requests_total", "Finished requests", ("method", "route", "status")
+)
+HTTP_IN_FLIGHT = REGISTRY.gauge(
+    "http_requests_in_flight", "Requests currently being handled", ("method",)
+)
+PREDICT_STAGE_SECONDS = REGISTRY.histogram(
+    "predict_stage_seconds",
+    "Time per prediction stage (transform and predict_proba per scoring call), "
+    "per calling route",
+    ("route", "stage"),
+)
+# The route model scoring is recorded under (see scoring_route)
+_SCORING_ROUTE = contextvars.ContextVar("scoring_route", default="other")
+CHART_PHASE_SECONDS = REGISTRY.histogram(
+    "chart_phase_seconds",
+    "Time to filter rows and to aggregate them per computed chart, or to look "
+    "the chart up in the cube or the response cache (phase lookup)",
+    ("chart", "phase"),
+)
+RESPONSE_ENCODE_SECONDS = REGISTRY.histogram(
+    "response_encode_seconds",
+    "Time to encode an analytics response body, per media type",
+    ("format",),
+)
+
+
+@contextmanager
+def scoring_route(route: str):
+    """Record the model stages scored inside the block under ``route``,
+    under "other" outside any such block (e.g. the batch_score CLI)"""
+    token = _SCORING_ROUTE.set(route)
+    try:
+        yield
+    finally:
+        _SCORING_ROUTE.reset(token)
+
+
+def observe_predict_stage(stage: str, seconds: float):
+    PREDICT_STAGE_SECONDS.labels(_SCORING_ROUTE.get(), stage).observe(seconds)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, status counts and in-flight requests.
+
+    Requests are labelled with the matched route template (e.g.
+    /chart/{chart_name}), not the raw path, to keep the series count bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"]
+        in_flight = HTTP_IN_FLIGHT.labels(method)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            in_flight.dec()
+            route = scope.get("route")
+            route = getattr(route, "path", "unmatched")
+            HTTP_REQUEST_SECONDS.labels(method, route).observe(elapsed)
+            HTTP_REQUESTS.labels(method, route, str(status)).inc()
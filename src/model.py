@@ -1,7 +1,11 @@
+import bisect
+import itertools
+import time
 import joblib
 import numpy as np
 from typing import List, Optional, Any
 from pydantic import BaseModel
+from metrics import observe_predict_stage
 
 
 class PredictionInput(BaseModel):
@@ -19,11 +23,74 @@ class PredictionOutput(BaseModel):
     features: Optional[Any] = None
 
 
+# PaymentMethod label-encoder codes seen at training time (LabelEncoder sorts
+# the labels). Inputs outside this range are still scored, but only by the
+# live model.
+PAYMENT_METHOD_LABELS = [
+    "Bank transfer (automatic)",
+    "Credit card (automatic)",
+    "Electronic check",
+    "Mailed check",
+]
+PAYMENT_METHOD_CODES = len(PAYMENT_METHOD_LABELS)
+N_BINS = 4
+
+# Shape of the discrete feature space after _transform_features:
+# PaymentMethod x Has_Internet x Contract_Short x monthly bin x tenure bin
+TABLE_SHAPE = (PAYMENT_METHOD_CODES, 2, 2, N_BINS, N_BINS)
+
+INFERENCE_MODES = ("live", "table")
+
+
+def _observe_stages(started: float, transformed: float):
+    """Record transform (started..transformed) and scoring (transformed..now)
+    under the current scoring route"""
+    observe_predict_stage("transform", transformed - started)
+    observe_predict_stage("predict_proba", time.perf_counter() - transformed)
+
+
 class CalibratedModel:
-    def __init__(self, model_path: str, binning_transformers_path: str):
-        self.model = joblib.load(model_path)
+    def __init__(
+        self,
+        model_path: str,
+        binning_transformers_path: str,
+        inference_mode: str = "live",
+        mmap_mode: Optional[str] = None,
+    ):
+        if inference_mode not in INFERENCE_MODES:
+            raise ValueError(
+                f"inference_mode must be one of {INFERENCE_MODES}, got {inference_mode!r}"
+            )
+        # mmap_mode="r" shares the model's NumPy arrays between processes
+        # (only effective for uncompressed joblib files)
+        self.model = joblib.load(model_path, mmap_mode=mmap_mode)
         self.binning_transformers = joblib.load(binning_transformers_path)
 
+        # Inner bin edges of the fitted quantile binners, used to bin whole
+        # columns at once in the batch path
+        self.monthly_edges = self._inner_bin_edges("monthly_binner")
+        self.tenure_edges = self._inner_bin_edges("tenure_binner")
+
+        # "table" mode: every reachable feature vector scored once up front,
+        # so predictions become an index computation plus an array lookup
+        self.inference_mode = inference_mode
+        self.probability_table = None
+        if inference_mode == "table":
+            self.probability_table = self._build_probability_table()
+            if not self._check_table_parity():
+                print("Probability table does not match live model, using live scoring")
+                self.probability_table = None
+                self.inference_mode = "live"
+
+    def _inner_bin_edges(self, binner_name: str) -> np.ndarray:
+        bin_edges = self.binning_transformers[binner_name].bin_edges_[0]
+        return np.asarray(bin_edges[1:-1], dtype=float)
+
+    @staticmethod
+    def _bin_column(values, inner_edges: np.ndarray) -> np.ndarray:
+        """Same result as KBinsDiscretizer(encode="ordinal").transform"""
+        return np.searchsorted(inner_edges, values, side="right")
+
     def _transform_features(self, raw_input: PredictionInput):
         """Transform raw input into model features"""
         # Contract encoding (same)
@@ -75,16 +142,48 @@ class CalibratedModel:
             tenure_low,
         ]
 
-    def predict(self, input_data: PredictionInput) -> PredictionOutput:
-        # Convert named features to array in the correct order
-        features = self._transform_features(input_data)
+    def _encode_columns(self, contract, internet_service, monthly_charges, tenure):
+        """Vectorized contract/internet flags and bin numbers for raw columns"""
+        contract_lower = np.char.lower(np.asarray(contract, dtype=str))
+        contract_short = (np.char.find(contract_lower, "month") >= 0).astype(int)
 
-        # Convert to 2D array for sklearn
-        features_array = np.array(features).reshape(1, -1)
+        internet_lower = np.char.lower(np.asarray(internet_service, dtype=str))
+        has_internet = (np.char.find(internet_lower, "no") < 0).astype(int)
 
-        # Get probability
-        probability = self.model.predict_proba(features_array)[0, 1]
+        monthly_bin = self._bin_column(monthly_charges, self.monthly_edges)
+        tenure_bin = self._bin_column(tenure, self.tenure_edges)
+        return has_internet, contract_short, monthly_bin, tenure_bin
+
+    @staticmethod
+    def _features_from_codes(
+        payment_method, has_internet, contract_short, monthly_bin, tenure_bin
+    ) -> np.ndarray:
+        features = np.empty((len(contract_short), 10), dtype=int)
+        features[:, 0] = payment_method
+        features[:, 1] = has_internet
+        features[:, 2] = 1 - contract_short
+        features[:, 3] = contract_short
+        features[:, 4] = monthly_bin == 3
+        features[:, 5] = monthly_bin == 1
+        features[:, 6] = monthly_bin == 0
+        features[:, 7] = tenure_bin == 3
+        features[:, 8] = tenure_bin == 2
+        features[:, 9] = tenure_bin == 0
+        return features
 
+    @staticmethod
+    def _input_columns(inputs: List[PredictionInput]):
+        """Raw input columns in predict_proba_columns argument order"""
+        return (
+            [item.Contract for item in inputs],
+            [item.InternetService for item in inputs],
+            np.fromiter((item.MonthlyCharges for item in inputs), float, len(inputs)),
+            np.fromiter((item.tenure for item in inputs), float, len(inputs)),
+            np.fromiter((item.PaymentMethod for item in inputs), int, len(inputs)),
+        )
+
+    @staticmethod
+    def _build_output(probability: float) -> PredictionOutput:
         # Get prediction (you can adjust threshold if needed)
         prediction = 1 if probability >= 0.5 else 0
 
@@ -95,5 +194,118 @@ class CalibratedModel:
             probability=float(probability),
             prediction=prediction,
             prediction_label=prediction_label,
-            # features=features,
         )
+
+    def _build_probability_table(self) -> np.ndarray:
+        """Score the whole discrete feature space in one predict_proba call"""
+        codes = np.unravel_index(np.arange(np.prod(TABLE_SHAPE)), TABLE_SHAPE)
+        features_array = self._features_from_codes(*codes)
+        return self.model.predict_proba(features_array)[:, 1]
+
+    def _check_table_parity(self) -> bool:
+        """Compare table lookups with live scoring over every bin and flag"""
+        monthly_values = self.binning_transformers["monthly_binner"].bin_edges_[0]
+        tenure_values = self.binning_transformers["tenure_binner"].bin_edges_[0]
+        inputs = [
+            PredictionInput(
+                Contract=contract,
+                InternetService=internet,
+                MonthlyCharges=monthly,
+                tenure=int(tenure),
+                PaymentMethod=payment_method,
+            )
+            for payment_method, contract, internet, monthly, tenure in itertools.product(
+                range(PAYMENT_METHOD_CODES),
+                ["Month-to-month", "One year", "Two year"],
+                ["DSL", "Fiber optic", "No"],
+                monthly_values,
+                tenure_values,
+            )
+        ]
+        live = self.model.predict_proba(
+            np.array([self._transform_features(item) for item in inputs])
+        )[:, 1]
+        table = self.probability_table[[self._table_key(item) for item in inputs]]
+        return bool(np.allclose(live, table))
+
+    def _table_key(self, raw_input: PredictionInput) -> Optional[int]:
+        """Packed index into probability_table, None if PaymentMethod is unseen"""
+        payment_method = raw_input.PaymentMethod
+        if not 0 <= payment_method < PAYMENT_METHOD_CODES:
+            return None
+        has_internet = 0 if "no" in raw_input.InternetService.lower() else 1
+        contract_short = 1 if "month" in raw_input.Contract.lower() else 0
+        monthly_bin = bisect.bisect_right(self.monthly_edges, raw_input.MonthlyCharges)
+        tenure_bin = bisect.bisect_right(self.tenure_edges, raw_input.tenure)
+        return (
+            ((payment_method * 2 + has_internet) * 2 + contract_short) * N_BINS
+            + monthly_bin
+        ) * N_BINS + tenure_bin
+
+    def _predict_proba_live(self, features_array: np.ndarray) -> np.ndarray:
+        return self.model.predict_proba(features_array)[:, 1]
+
+    def predict_proba_columns(
+        self, contract, internet_service, monthly_charges, tenure, payment_method
+    ) -> np.ndarray:
+        """Churn probability for raw input columns, one sklearn call at most"""
+        started = time.perf_counter()
+        payment_method = np.asarray(payment_method)
+        codes = self._encode_columns(
+            contract, internet_service, monthly_charges, tenure
+        )
+        if self.probability_table is None:
+            features_array = self._features_from_codes(payment_method, *codes)
+            transformed = time.perf_counter()
+            probabilities = self._predict_proba_live(features_array)
+            _observe_stages(started, transformed)
+            return probabilities
+
+        in_range = (payment_method >= 0) & (payment_method < PAYMENT_METHOD_CODES)
+        probabilities = np.empty(len(payment_method), dtype=float)
+        keys = np.ravel_multi_index(
+            tuple(column[in_range] for column in (payment_method, *codes)),
+            TABLE_SHAPE,
+        )
+        transformed = time.perf_counter()
+        probabilities[in_range] = self.probability_table[keys]
+        if not in_range.all():
+            out_of_range = ~in_range
+            probabilities[out_of_range] = self._predict_proba_live(
+                self._features_from_codes(
+                    payment_method[out_of_range],
+                    *(column[out_of_range] for column in codes),
+                )
+            )
+        _observe_stages(started, transformed)
+        return probabilities
+
+    def predict(self, input_data: PredictionInput) -> PredictionOutput:
+        started = time.perf_counter()
+        if self.probability_table is not None:
+            key = self._table_key(input_data)
+            if key is not None:
+                transformed = time.perf_counter()
+                probability = self.probability_table[key]
+                _observe_stages(started, transformed)
+                return self._build_output(probability)
+
+        # Convert named features to array in the correct order
+        features = self._transform_features(input_data)
+
+        # Convert to 2D array for sklearn
+        features_array = np.array(features).reshape(1, -1)
+        transformed = time.perf_counter()
+
+        # Get probability
+        probability = self.model.predict_proba(features_array)[0, 1]
+        _observe_stages(started, transformed)
+
+        return self._build_output(probability)
+
+    def predict_batch(self, inputs: List[PredictionInput]) -> List[PredictionOutput]:
+        """Score many inputs with a single predict_proba call, keeping order"""
+        if not inputs:
+            return []
+        probabilities = self.predict_proba_columns(*self._input_columns(inputs))
+        return [self._build_output(probability) for probability in probabilities]
@@ -0,0 +1,39 @@
+"""Dashboard filter presets, shared by the API (filters.py) and the desktop
+dashboard (model_training/aggregates.py).
+
+Time periods and segments are expressed on tenure (months) and
+MonthlyCharges, e.g. "Last 30 days" = tenure <= 1.
+"""
+
+import numpy as np
+from typing import Callable, Dict, Tuple
+
+TIME_PERIODS = {
+    "Last 30 days": 1,
+    "Last 90 days": 3,
+    "Last 6 months": 6,
+    "Last year": 12,
+}
+SEGMENTS = [
+    "All Segments",
+    "New Customers",
+    "Long-term Customers",
+    "High-value Customers",
+]
+ALL_SERVICES = "All Services"
+ALL_CONTRACTS = "All Contracts"
+
+
+def range_masks(
+    tenure: np.ndarray, monthly_charges: np.ndarray
+) -> Dict[Tuple[str, str], Callable[[], np.ndarray]]:
+    """Builders of the time period and segment masks, by (parameter, value)"""
+    definitions = {}
+    for time_period, max_tenure in TIME_PERIODS.items():
+        definitions[("time_period", time_period)] = (
+            lambda max_tenure=max_tenure: tenure <= max_tenure
+        )
+    definitions[("segment", "New Customers")] = lambda: tenure <= 6
+    definitions[("segment", "Long-term Customers")] = lambda: tenure > 24
+    definitions[("segment", "High-value Customers")] = lambda: monthly_charges > 80
+    return definitions
@@ -0,0 +1,244 @@
+"""Churn risk index over every loaded customer.
+
+At load time every row of the in-memory Dataset is scored in bulk through
+the vectorized CalibratedModel transform (a chunk of rows per
+predict_proba_columns call) and the rows are sorted by probability,
+highest first. /customers/top-risk then never rescores anyone:
+
+- the rows matching a filter selection, in risk order, are one O(n) pass
+  of the selection's mask over the sorted rows; these ranked lists are
+  kept in a byte-bounded LRU per selection, so a repeated selection costs
+  O(k) for its top k while a new (or evicted) one costs O(n)
+- min_probability is a binary search in the ranked probabilities, O(log n)
+
+RiskIndexer keeps the current index and rebuilds it on a background thread
+when its version (model files and data version) changes; queries keep using
+the previous index until the new one is swapped in, together with the model
+it was scored with.
+"""
+
+import threading
+import time
+import numpy as np
+from collections import OrderedDict
+from typing import Callable, Optional
+from batch_score import DEFAULT_CHUNKSIZE, PAYMENT_METHOD_CODE
+from dataset import ID_COLUMN, Dataset
+from filters import FilterIndex
+from model import CalibratedModel
+
+# Customer attributes returned with each probability
+RISK_COLUMNS = (
+    "Contract",
+    "InternetService",
+    "PaymentMethod",
+    "tenure",
+    "MonthlyCharges",
+)
+
+
+def score_dataset(
+    model: CalibratedModel, dataset: Dataset, chunksize: int = DEFAULT_CHUNKSIZE
+) -> np.ndarray:
+    """Churn probability of every row, ``chunksize`` rows per model call"""
+    contracts = np.asarray(dataset.labels("Contract"), dtype=str)
+    services = np.asarray(dataset.labels("InternetService"), dtype=str)
+    # The model takes training-time PaymentMethod codes; unknown labels are -1
+    payment_methods = np.array(
+        [
+            PAYMENT_METHOD_CODE.get(label, -1)
+            for label in dataset.labels("PaymentMethod")
+        ]
+    )
+    probabilities = np.empty(len(dataset), dtype=float)
+    for start in range(0, len(dataset), chunksize):
+        rows = slice(start, start + chunksize)
+        probabilities[rows] = model.predict_proba_columns(
+            contracts[dataset["Contract"][rows]],
+            services[dataset["InternetService"][rows]],
+            dataset["MonthlyCharges"][rows],
+            dataset["tenure"][rows],
+            payment_methods[dataset["PaymentMethod"][rows]],
+        )
+    return probabilities
+
+
+def _nbytes(ranked: tuple) -> int:
+    return sum(array.nbytes for array in ranked)
+
+
+class RiskIndex:
+    """Rows of one dataset sorted by churn probability, highest first"""
+
+    def __init__(
+        self,
+        dataset: Dataset,
+        filter_index: FilterIndex,
+        probabilities: np.ndarray,
+        version: str,
+        max_selection_bytes: int = 64 * 2**20,
+        model: Optional[CalibratedModel] = None,
+        model_version: Optional[str] = None,
+    ):
+        self.dataset = dataset
+        self.filter_index = filter_index
+        self.version = version
+        # The model the probabilities come from, and its files' version
+        self.model = model
+        self.model_version = model_version
+        self.max_selection_bytes = max_selection_bytes
+        index_type = np.int32 if len(dataset) < 2**31 else np.int64
+        # Stable, so ties keep table order
+        self.order = np.argsort(-probabilities, kind="stable").astype(index_type)
+        self.probabilities = probabilities[self.order]
+        self.selections = OrderedDict()
+        self.selection_bytes = 0
+        self.lock = threading.Lock()
+        self.built_at = time.time()
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def ranked(self, params: dict):
+        """Row positions matching the selection, in risk order, and their
+        probabilities; O(n) unless the selection is cached"""
+        key = tuple(sorted((name, value) for name, value in params.items() if value))
+        with self.lock:
+            ranked = self.selections.get(key)
+            if ranked is not None:
+                self.selections.move_to_end(key)
+                return ranked
+        mask = self.filter_index.mask(**params)
+        if mask is None:
+            return self.order, self.probabilities
+        keep = mask[self.order]
+        ranked = (self.order[keep], self.probabilities[keep])
+        size = _nbytes(ranked)
+        if size > self.max_selection_bytes:
+            return ranked
+        with self.lock:
+            if key not in self.selections:
+                self.selections[key] = ranked
+                self.selection_bytes += size
+            while self.selection_bytes > self.max_selection_bytes:
+                _, evicted = self.selections.popitem(last=False)
+                self.selection_bytes -= _nbytes(evicted)
+        return ranked
+
+    def top(self, params: dict, k: int, min_probability: float = 0.0) -> dict:
+        rows, probabilities = self.ranked(params)
+        matching = len(rows)
+        # Probabilities are descending, so negate them for searchsorted
+        above = int(np.searchsorted(-probabilities, -min_probability, side="right"))
+        rows, probabilities = rows[: min(k, above)], probabilities[: min(k, above)]
+        customers = {
+            ID_COLUMN: self.dataset[ID_COLUMN][rows].astype(str),
+            "probability": np.round(probabilities, 4),
+        }
+        for column in RISK_COLUMNS:
+            values = self.dataset[column][rows]
+            if column in self.dataset.categories:
+                values = np.asarray(self.dataset.labels(column))[values]
+            customers[column] = values
+        return {
+            "customers": [
+                dict(zip(customers, values))
+                for values in zip(*(column.tolist() for column in customers.values()))
+            ],
+            "matching": matching,
+            "above_min_probability": above,
+            "index": {
+                "version": self.version,
+                "rows": len(self),
+                "built_at": self.built_at,
+            },
+        }
+
+
+class RiskIndexer:
+    """The current RiskIndex, rebuilt in the background on version changes.
+
+    ``version()`` identifies the model and data an index is built from and
+    ``build(version)`` builds one; every ``poll_seconds`` (0: never) the
+    version is checked and a rebuild started if it changed; a change during
+    a rebuild is picked up by another one when it ends. ``on_swap`` is
+    called with each rebuilt index as it is swapped in, e.g. to serve its
+    model.
+    """
+
+    def __init__(
+        self,
+        build: Callable[[str], RiskIndex],
+        version: Callable[[], str],
+        poll_seconds: float = 0,
+        on_swap: Optional[Callable[[RiskIndex], None]] = None,
+    ):
+        self.build = build
+        self.version = version
+        self.on_swap = on_swap
+        self.index = build(version())
+        self.building = None
+        # Set by refresh() while building: the version may have changed
+        self.pending = False
+        self.last_error = None
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        if poll_seconds > 0:
+            threading.Thread(
+                target=self._poll, args=(poll_seconds,), name="risk-index", daemon=True
+            ).start()
+
+    def _poll(self, poll_seconds: float):
+        while not self.stopped.wait(poll_seconds):
+            self.refresh()
+
+    def refresh(self) -> bool:
+        """Start a background rebuild if the version changed; True if one
+        is running"""
+        version = self.version()
+        with self.lock:
+            if self.building is not None:
+                self.pending = True
+                return True
+            if version == self.index.version:
+                return False
+            self.building = threading.Thread(
+                target=self._rebuild, args=(version,), name="risk-index-build"
+            )
+            self.building.start()
+            return True
+
+    def _rebuild(self, version: str):
+        """Build ``version``, then the latest version until the index is
+        current; after a failure, only if refresh() was called meanwhile"""
+        while True:
+            started = time.perf_counter()
+            try:
+                index = self.build(version)
+            except Exception as e:
+                print(f"Risk index rebuild failed: {e}")
+                self.last_error = str(e)
+                index = None
+            with self.lock:
+                if index is not None:
+                    if self.on_swap is not None:
+                        self.on_swap(index)
+                    self.index = index
+                    self.last_error = None
+                # Read under the lock: a later change either sets pending or
+                # finds building cleared and starts its own rebuild
+                version = self.version()
+                pending, self.pending = self.pending, False
+                if version == self.index.version or (index is None and not pending):
+                    self.building = None
+                    version = None
+            if index is not None:
+                print(
+                    f"Risk index rebuilt over {len(index)} rows "
+                    f"in {time.perf_counter() - started:.2f}s"
+                )
+            if version is None:
+                return
+
+    def stop(self):
+        self.stopped.set()
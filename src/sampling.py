@@ -0,0 +1,260 @@
+"""Approximate /stats and /chart answers from a stratified sample.
+
+At load time every row is assigned to a stratum (Contract x InternetService
+x tenure band) and a seeded Bernoulli sample of about APPROX_SAMPLE_ROWS rows
+is drawn, keeping at least a few rows of every stratum. The sample is stored
+as its own small Dataset, ordered so that any prefix of it is itself a
+stratified sample with (roughly) proportional allocation: a query at
+precision ``max_error`` reads only the prefix it needs, so its cost is
+bounded by the sample size whatever the size of the table.
+
+Estimates weight each sampled row by N_h / n_h (stratum population over
+stratum rows in the prefix). Means and rates are ratio estimates over the
+filtered domain; 95% confidence intervals come from the usual stratified
+variance with finite population correction, so a prefix covering a whole
+stratum contributes no error for it.
+"""
+
+import math
+import numpy as np
+from typing import Optional
+from analytics import CHARTS, FilteredRows, chart_codes
+from dataset import Dataset
+from filters import FilterIndex
+
+Z_95 = 1.959964
+# Lower bounds (months) of the tenure bands used as strata
+TENURE_BANDS = (0, 6, 12, 24, 48)
+# Rows of every stratum kept regardless of the sampling fraction, and the
+# smallest prefix a query reads
+MIN_STRATUM_ROWS = 4
+PILOT_ROWS = 2000
+
+
+def _stratum_sums(strata: np.ndarray, n_strata: int, weights=None) -> np.ndarray:
+    return np.bincount(strata, weights=weights, minlength=n_strata).astype(float)
+
+
+def _total_variance(sums, squares, n, population) -> np.ndarray:
+    """Variance of the estimated population total of a variable, given its
+    per-stratum sums and sums of squares over the sampled rows (last axis
+    is the stratum)"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        spread = (squares - sums**2 / n) / (n - 1)
+        terms = population**2 * (1 - n / population) * spread / n
+    return np.where(n > 1, terms, 0.0).sum(axis=-1)
+
+
+def _rate_interval(rate: float, error: float) -> list:
+    return [round(max(rate - error, 0) * 100, 2), round(min(rate + error, 1) * 100, 2)]
+
+
+class StratifiedSample:
+    def __init__(
+        self,
+        dataset: Dataset,
+        rows: int,
+        seed: int = 0,
+        live: Optional[np.ndarray] = None,
+    ):
+        """``live``: mask of the rows to sample from (FilterIndex.live),
+        all of them when None"""
+        if live is not None:
+            dataset = dataset.take(np.flatnonzero(live))
+        strata, self.n_strata = self._strata(dataset)
+        self.population = _stratum_sums(strata, self.n_strata)
+        self.total = len(dataset)
+
+        # Bernoulli sample; small strata are kept with a higher probability
+        fraction = min(1.0, rows / self.total) if self.total else 1.0
+        with np.errstate(divide="ignore"):
+            floor = np.minimum(1.0, MIN_STRATUM_ROWS / self.population)
+        keys = np.random.default_rng(seed).random(self.total)
+        picked = np.flatnonzero(keys < np.maximum(fraction, floor[strata]))
+
+        # Order by the fraction of its stratum a row "enters" at, so any
+        # prefix holds about the same share of every stratum; the first two
+        # rows of each stratum enter at once so every variance is defined
+        picked = picked[np.lexsort((keys[picked], strata[picked]))]
+        picked_strata = strata[picked]
+        starts = np.searchsorted(picked_strata, np.arange(self.n_strata))
+        rank = np.arange(len(picked)) - starts[picked_strata]
+        entry = np.maximum(rank - 1, 0) / self.population[picked_strata]
+        order = np.argsort(entry, kind="stable")
+        picked = picked[order]
+
+        self.strata = picked_strata[order]
+        self.dataset = dataset.take(picked)
+        self.filter_index = FilterIndex(self.dataset)
+        self.min_rows = min(len(picked), max(PILOT_ROWS, 2 * self.n_strata))
+
+    def __len__(self) -> int:
+        return len(self.strata)
+
+    @staticmethod
+    def _strata(dataset: Dataset):
+        bands = np.searchsorted(TENURE_BANDS, dataset["tenure"], side="right") - 1
+        bands = np.maximum(bands, 0)
+        n_services = len(dataset.labels("InternetService"))
+        n_strata = len(dataset.labels("Contract")) * n_services * len(TENURE_BANDS)
+        strata = (
+            dataset["Contract"].astype(np.int64) * n_services
+            + dataset["InternetService"]
+        ) * len(TENURE_BANDS) + bands
+        return strata, n_strata
+
+    def _prefix(self, params: dict, rows: int):
+        """Rows of the first ``rows`` sampled rows selected by the filters,
+        with the strata of all of them"""
+        data = Dataset(
+            {column: values[:rows] for column, values in self.dataset.columns.items()},
+            self.dataset.categories,
+            self.dataset.churned[:rows],
+        )
+        mask = None
+        for selected in self.filter_index.selected(**params):
+            mask = selected[:rows] if mask is None else mask & selected[:rows]
+        strata = self.strata[:rows]
+        return (
+            FilteredRows(data, mask),
+            strata,
+            (strata if mask is None else strata[mask]),
+        )
+
+    def _meta(self, rows: int) -> dict:
+        return {
+            "sample_rows": rows,
+            "population_rows": self.total,
+            "confidence": 0.95,
+        }
+
+    def _weights(self, n: np.ndarray) -> np.ndarray:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(n > 0, self.population / n, 0.0)
+
+    def _ratio(self, n, domain_sums, value_sums, square_sums):
+        """Ratio estimate of a variable's mean over the domain, from its
+        per-stratum sums, and the half-width of its confidence interval"""
+        weights = self._weights(n)
+        domain_total = weights @ domain_sums
+        if domain_total == 0:
+            return 0.0, 0.0
+        ratio = float(weights @ value_sums / domain_total)
+        # Residuals d = y - ratio * x, x being the domain indicator (x^2 = x,
+        # and y is zero outside the domain so x * y = y)
+        sums = value_sums - ratio * domain_sums
+        squares = square_sums - 2 * ratio * value_sums + ratio**2 * domain_sums
+        variance = _total_variance(sums, squares, n, self.population)
+        return ratio, float(Z_95 * math.sqrt(variance) / domain_total)
+
+    def rows_for(self, params: dict, max_error: float) -> int:
+        """Sample prefix needed for a churn rate within ``max_error``
+        percentage points, assuming the worst case p = 0.5 and scaling by
+        the filters' selectivity seen in a pilot prefix"""
+        _, _, domain_strata = self._prefix(params, self.min_rows)
+        selectivity = max(len(domain_strata), 1) / max(self.min_rows, 1)
+        needed = (Z_95 * 0.5 / (max_error / 100)) ** 2 / selectivity
+        return int(min(len(self), max(self.min_rows, math.ceil(needed))))
+
+    def stats(self, params: dict, rows: int) -> dict:
+        filtered, strata, domain_strata = self._prefix(params, rows)
+        n = _stratum_sums(strata, self.n_strata)
+        domain_sums = _stratum_sums(domain_strata, self.n_strata)
+        total = float(self._weights(n) @ domain_sums)
+        total_error = Z_95 * math.sqrt(
+            _total_variance(domain_sums, domain_sums, n, self.population)
+        )
+        estimates = {}
+        for name, values in (
+            ("churn_rate", filtered["churned"].astype(float)),
+            ("avg_monthly", filtered["MonthlyCharges"]),
+            ("avg_tenure", filtered["tenure"]),
+        ):
+            estimates[name] = self._ratio(
+                n,
+                domain_sums,
+                _stratum_sums(domain_strata, self.n_strata, values),
+                _stratum_sums(domain_strata, self.n_strata, values * values),
+            )
+        churn_rate, churn_error = estimates["churn_rate"]
+        monthly, monthly_error = estimates["avg_monthly"]
+        tenure, tenure_error = estimates["avg_tenure"]
+        return {
+            "total_customers": int(round(total)),
+            "churn_rate": round(churn_rate * 100, 2),
+            "avg_monthly": round(monthly, 2),
+            "avg_tenure": round(tenure, 1),
+            "intervals": {
+                "total_customers": [
+                    int(round(max(total - total_error, 0))),
+                    int(round(total + total_error)),
+                ],
+                "churn_rate": _rate_interval(churn_rate, churn_error),
+                "avg_monthly": [
+                    round(monthly - monthly_error, 2),
+                    round(monthly + monthly_error, 2),
+                ],
+                "avg_tenure": [
+                    round(tenure - tenure_error, 1),
+                    round(tenure + tenure_error, 1),
+                ],
+            },
+            "approximate": self._meta(rows),
+        }
+
+    def chart(self, params: dict, chart_name: str, rows: int) -> dict:
+        spec = CHARTS.get(chart_name)
+        if spec is None:
+            return {}
+        filtered, strata, domain_strata = self._prefix(params, rows)
+        n = _stratum_sums(strata, self.n_strata)
+        weights = self._weights(n)
+        ids, n_groups = filtered.groups(spec)
+        # Per group and stratum: domain rows and churned domain rows
+        cells = ids.astype(np.int64) * self.n_strata + domain_strata
+        size = (n_groups + 1) * self.n_strata
+        in_group = np.bincount(cells, minlength=size).reshape(n_groups + 1, -1)
+        churned = np.bincount(
+            cells, weights=filtered["churned"], minlength=size
+        ).reshape(n_groups + 1, -1)
+
+        labels = filtered.labels(spec.column) if spec.edges is None else None
+        estimate = np.stack([in_group @ weights, churned @ weights])
+        codes, labels = chart_codes(spec, np.round(estimate), labels)
+        payload = {"labels": labels, "intervals": {}}
+        if spec.metric == "rate":
+            rates = [
+                self._ratio(n, in_group[code], churned[code], churned[code])
+                for code in codes
+            ]
+            payload["values"] = [round(rate * 100, 2) for rate, _ in rates]
+            payload["intervals"]["values"] = [
+                _rate_interval(rate, error) for rate, error in rates
+            ]
+        else:
+            # Counts are population totals of 0/1 variables, so sums of
+            # squares equal sums
+            if spec.metric == "count":
+                variables = {"values": in_group}
+            else:
+                variables = {"churned": churned, "not_churned": in_group - churned}
+            for name, sums in variables.items():
+                sums = sums[codes].astype(float)
+                values = sums @ weights
+                errors = Z_95 * np.sqrt(_total_variance(sums, sums, n, self.population))
+                payload[name] = np.round(values).astype(np.int64)
+                payload["intervals"][name] = [
+                    [int(round(max(value - error, 0))), int(round(value + error))]
+                    for value, error in zip(values.tolist(), errors.tolist())
+                ]
+        payload["approximate"] = self._meta(rows)
+        return payload
+
+    def refinement_steps(self, params: dict, max_error: Optional[float]) -> list:
+        """Prefix sizes for progressive answers: the size ``max_error``
+        needs (or the pilot size), doubling up to the whole sample"""
+        rows = self.rows_for(params, max_error) if max_error else self.min_rows
+        steps = [rows]
+        while steps[-1] < len(self):
+            steps.append(min(len(self), steps[-1] * 2))
+        return steps
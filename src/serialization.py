@@ -0,0 +1,87 @@
+"""Response body encoding for the analytics routes.
+
+JSON is written by orjson when it is installed, which serializes NumPy
+arrays natively, so chart payloads are never turned into Python lists.
+Clients can ask for a binary body with the Accept header:
+
+- application/msgpack: MessagePack (needs the msgpack package)
+- application/x-npz: a NumPy .npz archive with one typed array per value,
+  keyed by its "/"-joined path (e.g. "charts/tenureChurn/values"); read it
+  with numpy.load(io.BytesIO(body))
+
+Accept entries are tried in the order given; anything unsupported falls
+back to JSON.
+"""
+
+import io
+import json
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+NPZ = "application/x-npz"
+MSGPACK_ALIASES = (MSGPACK, "application/x-msgpack")
+
+
+def _default(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def to_json(payload) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(
+            payload, default=_default, option=orjson.OPT_SERIALIZE_NUMPY
+        )
+    return json.dumps(
+        payload, default=_default, ensure_ascii=False, separators=(",", ":")
+    ).encode()
+
+
+def _leaves(payload: dict, prefix: str = ""):
+    for key, value in payload.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            yield from _leaves(value, path + "/")
+        else:
+            yield path, np.asarray(value)
+
+
+def to_npz(payload: dict) -> bytes:
+    buffer = io.BytesIO()
+    np.savez(buffer, **dict(_leaves(payload)))
+    return buffer.getvalue()
+
+
+def negotiate(accept: str) -> str:
+    """Media type to answer a request with the given Accept header"""
+    for entry in accept.split(","):
+        media_type = entry.split(";")[0].strip().lower()
+        if media_type == NPZ:
+            return NPZ
+        if media_type in MSGPACK_ALIASES and msgpack is not None:
+            return MSGPACK
+        if media_type in (JSON, "application/*", "*/*"):
+            return JSON
+    return JSON
+
+
+def encode(payload, media_type: str = JSON) -> bytes:
+    if media_type == NPZ:
+        return to_npz(payload)
+    if media_type == MSGPACK:
+        return msgpack.packb(payload, default=_default)
+    return to_json(payload)
@@ -0,0 +1,87 @@
+"""Multi-core analytics over row shards of the memory-mapped snapshot.
+
+The table is split into contiguous row ranges, one per worker process.
+Each worker memory-maps the snapshot once, and for a query filters its own
+range and reduces it to stats/chart partials. The parent sums the partials
+(counts and sums, so the merge is exact) and finalizes them like the
+single-core path. Used when the table has at least SHARD_MIN_ROWS rows.
+"""
+
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+from analytics import CHARTS, FilteredRows, PartialAggregator, rows_partials
+from dataset import Dataset
+from filters import FilterIndex
+
+_shard_state = {}
+
+
+def _init_worker(snapshot_dir: str, fingerprint: str):
+    dataset = Dataset.load(snapshot_dir)
+    if dataset.fingerprint() != fingerprint:
+        raise RuntimeError(f"Snapshot in {snapshot_dir} changed under the server")
+    _shard_state["data"] = dataset
+
+
+def _shard(start: int, end: int) -> Dataset:
+    dataset = _shard_state["data"]
+    # Slices of memory-mapped columns are views, nothing is copied
+    return Dataset(
+        {column: values[start:end] for column, values in dataset.columns.items()},
+        dataset.categories,
+        dataset.churned[start:end],
+    )
+
+
+def shard_partials(
+    start: int, end: int, params: dict, chart_names: list, with_stats: bool
+):
+    """Partials of rows [start, end) for one query, run in a worker"""
+    data = _shard(start, end)
+    index = FilterIndex.for_selection(data, **params)
+    specs = {name: CHARTS[name] for name in chart_names}
+    return rows_partials(FilteredRows(data, index.mask(**params)), specs, with_stats)
+
+
+class ShardedBackend(PartialAggregator):
+    def __init__(
+        self, dataset: Dataset, snapshot_dir: str, shards: Optional[int] = None
+    ):
+        self.dataset = dataset
+        self.shards = shards or os.cpu_count() or 1
+        self.bounds = np.linspace(0, len(dataset), self.shards + 1).astype(int).tolist()
+        self.pool = ProcessPoolExecutor(
+            self.shards,
+            initializer=_init_worker,
+            initargs=(snapshot_dir, dataset.fingerprint()),
+        )
+
+    def version(self) -> str:
+        return self.dataset.fingerprint()
+
+    def labels(self, column: str) -> list:
+        return self.dataset.labels(column)
+
+    def scan(self, params: dict, specs: dict, with_stats: bool = True):
+        futures = [
+            self.pool.submit(
+                shard_partials, start, end, params, list(specs), with_stats
+            )
+            for start, end in zip(self.bounds[:-1], self.bounds[1:])
+        ]
+        stats = np.zeros(4)
+        partials = dict.fromkeys(specs)
+        for future in futures:
+            shard_stats, shard_chart_partials = future.result()
+            if with_stats:
+                stats += shard_stats
+            for name, partial in shard_chart_partials.items():
+                # Shards share the dataset's codes, so shapes always match
+                total = partials[name]
+                partials[name] = partial if total is None else total + partial
+        return stats, partials, self.dataset.categories
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
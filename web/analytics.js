@@ -463,110 +463,59 @@ document.addEventListener('DOMContentLoaded', async function () {
         }
     });
 
-    async function fetchStats(filters) {
+    async function fetchDashboard(filters) {
         const params = new URLSearchParams(filters).toString();
-        const res = await fetch(`http://localhost:8000/stats?${params}`);
-        return await res.json();
-    }
-
-    async function fetchChart(chartName, filters) {
-        const params = new URLSearchParams(filters).toString();
-        const res = await fetch(`http://localhost:8000/chart/${chartName}?${params}`);
+        const res = await fetch(`http://localhost:8000/dashboard?${params}`);
         return await res.json();
     }
 
     async function updateDashboard(filters) {
+        // Stats and every chart come back in one response
+        const dashboard = await fetchDashboard(filters);
+        const stats = dashboard.stats;
+        const charts = dashboard.charts;
+
         // Update stats
-        const stats = await fetchStats(filters);
         document.querySelector('.stats-value.text-primary').textContent = stats.total_customers;
         document.querySelector('.stats-value.text-warning').textContent = stats.churn_rate + "%";
         document.querySelector('.stats-value.text-info').textContent = "$" + stats.avg_monthly;
         document.querySelector('.stats-value.text-success').textContent = stats.avg_tenure + " mos";
 
         // Update churn rate chart
-        const churnData = await fetchChart("churnRate", filters);
+        const churnData = charts.churnRate;
         churnRateChart.data.labels = churnData.labels;
         churnRateChart.data.datasets[0].data = churnData.values;
         churnRateChart.update();
 
         // Update tenure churn chart
-        const tenureData = await fetchChart("tenureChurn", filters);
+        const tenureData = charts.tenureChurn;
         tenureChurnChart.data.labels = tenureData.labels;
         tenureChurnChart.data.datasets[0].data = tenureData.values;
         tenureChurnChart.update();
 
-        // Gender Churn Chart
-        const genderData = await fetchChart("genderChurn", filters);
-        genderChurnChart.data.labels = genderData.labels;
-        genderChurnChart.data.datasets[0].data = genderData.churned;
-        genderChurnChart.data.datasets[1].data = genderData.not_churned;
-        genderChurnChart.update();
-
-        // Senior Citizen Churn Chart
-        const seniorData = await fetchChart("seniorChurn", filters);
-        seniorChurnChart.data.labels = seniorData.labels;
-        seniorChurnChart.data.datasets[0].data = seniorData.churned;
-        seniorChurnChart.data.datasets[1].data = seniorData.not_churned;
-        seniorChurnChart.update();
-
-        // Partner Churn Chart
-        const partnerData = await fetchChart("partnerChurn", filters);
-        partnerChurnChart.data.labels = partnerData.labels;
-        partnerChurnChart.data.datasets[0].data = partnerData.churned;
-        partnerChurnChart.data.datasets[1].data = partnerData.not_churned;
-        partnerChurnChart.update();
-
-        // Dependents Churn Chart
-        const dependentsData = await fetchChart("dependentsChurn", filters);
-        dependentsChurnChart.data.labels = dependentsData.labels;
-        dependentsChurnChart.data.datasets[0].data = dependentsData.churned;
-        dependentsChurnChart.data.datasets[1].data = dependentsData.not_churned;
-        dependentsChurnChart.update();
-
-        // Internet Service Churn Chart
-        const internetData = await fetchChart("internetChurn", filters);
-        internetChurnChart.data.labels = internetData.labels;
-        internetChurnChart.data.datasets[0].data = internetData.churned;
-        internetChurnChart.data.datasets[1].data = internetData.not_churned;
-        internetChurnChart.update();
-
-        // Contract Type Churn Chart
-        const contractData = await fetchChart("contractChurn", filters);
-        contractChurnChart.data.labels = contractData.labels;
-        contractChurnChart.data.datasets[0].data = contractData.churned;
-        contractChurnChart.data.datasets[1].data = contractData.not_churned;
-        contractChurnChart.update();
-
-        // Payment Method Churn Chart
-        const paymentData = await fetchChart("paymentChurn", filters);
-        paymentChurnChart.data.labels = paymentData.labels;
-        paymentChurnChart.data.datasets[0].data = paymentData.churned;
-        paymentChurnChart.data.datasets[1].data = paymentData.not_churned;
-        paymentChurnChart.update();
-
-        // Phone Service Churn Chart
-        const phoneData = await fetchChart("phoneChurn", filters);
-        phoneChurnChart.data.labels = phoneData.labels;
-        phoneChurnChart.data.datasets[0].data = phoneData.churned;
-        phoneChurnChart.data.datasets[1].data = phoneData.not_churned;
-        phoneChurnChart.update();
-
-        // Monthly Charges Distribution Chart
-        const monthlyChargesData = await fetchChart("monthlyChargesDist", filters);
-        monthlyChargesChart.data.labels = monthlyChargesData.labels;
-        monthlyChargesChart.data.datasets[0].data = monthlyChargesData.churned;
-        monthlyChargesChart.data.datasets[1].data = monthlyChargesData.not_churned;
-        monthlyChargesChart.update();
-
-        // Total Charges Distribution Chart
-        const totalChargesData = await fetchChart("totalChargesDist", filters);
-        totalChargesChart.data.labels = totalChargesData.labels;
-        totalChargesChart.data.datasets[0].data = totalChargesData.churned;
-        totalChargesChart.data.datasets[1].data = totalChargesData.not_churned;
-        totalChargesChart.update();
+        // Churned / not churned bar and line charts
+        const splitCharts = [
+            ['genderChurn', genderChurnChart],
+            ['seniorChurn', seniorChurnChart],
+            ['partnerChurn', partnerChurnChart],
+            ['dependentsChurn', dependentsChurnChart],
+            ['internetChurn', internetChurnChart],
+            ['contractChurn', contractChurnChart],
+            ['paymentChurn', paymentChurnChart],
+            ['phoneChurn', phoneChurnChart],
+            ['monthlyChargesDist', monthlyChargesChart],
+            ['totalChargesDist', totalChargesChart],
+        ];
+        splitCharts.forEach(([chartName, chart]) => {
+            const data = charts[chartName];
+            chart.data.labels = data.labels;
+            chart.data.datasets[0].data = data.churned;
+            chart.data.datasets[1].data = data.not_churned;
+            chart.update();
+        });
 
         // Churn Rate by Monthly Charges Groups Chart
-        const monthlyGroupsChurnData = await fetchChart("monthlyGroupsChurn", filters);
+        const monthlyGroupsChurnData = charts.monthlyGroupsChurn;
         monthlyGroupsChurnChart.data.labels = monthlyGroupsChurnData.labels;
         monthlyGroupsChurnChart.data.datasets[0].data = monthlyGroupsChurnData.values;
         monthlyGroupsChurnChart.update();